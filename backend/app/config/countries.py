@@ -5,15 +5,59 @@ Configuration des pays pour Luxarmonie Pricing Manager
 - Taux de change par défaut (modifiables via l'interface)
 """
 
+import math
+
 # Terminaisons par type (NE PAS MODIFIER - règles culturelles)
+def round_99(price: float) -> float:
+    """Low-context: .99 (France, USA, UK, etc.)"""
+    return float(math.floor(price)) + 0.99
+
+def round_95(price: float) -> float:
+    """Allemagne, Autriche, Suisse: .95"""
+    return float(math.floor(price)) + 0.95
+
+def round_00(price: float) -> float:
+    """High-context: .00 (Brésil, Italie, etc.)"""
+    return float(round(price))
+
+def round_9_int(price: float) -> float:
+    """Moyen-Orient: entier finissant en 9"""
+    base = int(price)
+    last = base % 10
+    if last == 9:
+        return float(base)
+    elif last < 9:
+        return float(base - last + 9) if base >= 10 else float(9)
+    return float(base - 1)
+
+def round_000(price: float) -> float:
+    """Grandes devises: milliers, au moins 1000 (Chili, Colombie)"""
+    thousands = round(price / 1000)
+    return float(max(thousands, 1) * 1000)
+
+def round_990(price: float) -> float:
+    """HUF, CZK, RSD: en 990/90/9"""
+    base = int(price)
+    if base >= 10000:
+        return float((base // 1000) * 1000 + 990)
+    elif base >= 1000:
+        return float((base // 100) * 100 + 90)
+    else:
+        return float((base // 10) * 10 + 9)
+
+def round_kr(price: float) -> float:
+    """Scandinave DKK/SEK: multiples de 5"""
+    return float(round(price / 5) * 5)
+
+
 ENDINGS = {
-    "99": lambda p: float(int(p)) + 0.99,           # France, USA, UK, etc.
-    "95": lambda p: float(int(p)) + 0.95,           # Allemagne, Autriche, Suisse
-    "00": lambda p: float(round(p)),                 # High-context: Brésil, Italie, etc.
-    "9_int": lambda p: float(int(p) - (int(p) % 10) + 9) if int(p) % 10 != 9 else float(int(p)),  # Moyen-Orient
-    "000": lambda p: float(round(p / 1000) * 1000),  # Grandes devises: Chili, Colombie
-    "990": lambda p: float((int(p) // 1000) * 1000 + 990) if p >= 10000 else float((int(p) // 100) * 100 + 90),  # Hongrie, Tchéquie
-    "kr": lambda p: float(round(p / 5) * 5),         # Scandinave: DKK, SEK
+    "99": round_99,
+    "95": round_95,
+    "00": round_00,
+    "9_int": round_9_int,
+    "000": round_000,
+    "990": round_990,
+    "kr": round_kr,
 }
 
 # Configuration complète par pays
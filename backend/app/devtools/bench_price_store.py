@@ -0,0 +1,81 @@
+"""
+Mesure mémoire du cache de prix : ancien format dict-de-dicts vs stockage colonnaire
+
+    python -m app.devtools.bench_price_store --markets 20 --variants 50000
+
+Construit le même jeu de prix dans les deux formats et mesure
+l'allocation avec tracemalloc (octets par prix, total pour 1M de prix).
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.services.price_store import PriceStore, variant_gid
+
+VARIANT_ID_OFFSET = 40000000000
+
+
+def build_dicts(markets: int, variants: int, rng: random.Random) -> dict:
+    """Format historique : {marché: {"prices": {gid: {price, compareAtPrice, currency}}}}"""
+    cache = {}
+    for m in range(markets):
+        prices = {}
+        for v in range(variants):
+            prices[variant_gid(VARIANT_ID_OFFSET + v)] = {
+                "price": f"{rng.randint(40, 400)}.99",
+                "compareAtPrice": None,
+                "currency": "EUR"
+            }
+        cache[f"Market {m}"] = {
+            "marketId": f"gid://shopify/Market/{m}",
+            "currency": "EUR",
+            "priceListId": f"gid://shopify/PriceList/{m}",
+            "prices": prices
+        }
+    return cache
+
+
+def build_store(markets: int, variants: int, rng: random.Random) -> PriceStore:
+    store = PriceStore()
+    for m in range(markets):
+        market = store.new_market(f"gid://shopify/Market/{m}", "EUR", f"gid://shopify/PriceList/{m}")
+        for v in range(variants):
+            store.put(market, variant_gid(VARIANT_ID_OFFSET + v), f"{rng.randint(40, 400)}.99", None)
+        store.publish(f"Market {m}", market)
+    return store
+
+
+def measure(builder, markets: int, variants: int) -> dict:
+    tracemalloc.start()
+    start = time.monotonic()
+    data = builder(markets, variants, random.Random(42))
+    elapsed = time.monotonic() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+
+    prices = markets * variants
+    return {
+        "builder": builder.__name__,
+        "prices": prices,
+        "bytes": current,
+        "bytes_per_price": round(current / prices, 1),
+        "mb_per_1m_prices": round(current / prices * 1_000_000 / 1024 / 1024, 1),
+        "build_seconds": round(elapsed, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--markets", type=int, default=20)
+    parser.add_argument("--variants", type=int, default=50000)
+    args = parser.parse_args()
+
+    for builder in (build_dicts, build_store):
+        print(measure(builder, args.markets, args.variants))
+
+
+if __name__ == "__main__":
+    main()
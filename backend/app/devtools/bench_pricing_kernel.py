@@ -0,0 +1,135 @@
+"""
+Parité et performance du noyau de prix vectorisé (services/pricing_kernel)
+
+    python -m app.devtools.bench_pricing_kernel --variants 50000 --markets 60
+
+1. Parité exacte (==) de chaque terminaison vectorisée avec sa fonction scalaire
+   (ENDINGS de config/countries), sur des prix aléatoires et des cas limites
+   (demi-unités, 999.99, 10000, prix négatifs...)
+2. Parité du mode prix marché de la preview (prix, compare-at, % réduction)
+   pour tous les pays et alias du registre + un pays inconnu (plan par défaut)
+3. Temps scalaire (une boucle Python par cellule) vs noyau sur une grille
+   variantes × marchés
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.config.countries import COUNTRIES, ENDINGS
+from app.routers.pricing import apply_psychological_ending, calculate_compare_at, vector_ending
+from app.services.pricing_kernel import VECTOR_ENDINGS, market_price_block
+from app.services.pricing_rules import MARKET_ALIASES
+
+EDGE_PRICES = [
+    0.0, 0.01, 0.5, 1.5, 2.5, 4.99, 5.0, 7.5, 8.99, 9.0, 9.99, 10.0, 12.5, 19.5,
+    99.99, 499.5, 500.0, 999.0, 999.99, 1000.0, 1499.5, 1500.0, 2500.0, 9999.99,
+    10000.0, 10990.0, 12345.67, 99999.5, 250000.0, -0.5, -3.2, -12.5
+]
+
+
+def sample_prices(rng: random.Random, count: int) -> list:
+    prices = list(EDGE_PRICES)
+    for _ in range(count):
+        scale = rng.choice((10, 100, 1000, 10000, 1000000))
+        prices.append(round(rng.uniform(0, scale), rng.choice((0, 1, 2))))
+    return prices
+
+
+def scalar_cell(current: float, country: str, base_adjustment: float, discount: float):
+    """Calcul d'une cellule, tel que la preview le faisait avant le noyau"""
+    raw_price = current * (1 + base_adjustment)
+    new_price = apply_psychological_ending(raw_price, country)
+    if discount > 0:
+        compare_at_price = apply_psychological_ending(calculate_compare_at(new_price, discount), country)
+    else:
+        compare_at_price = new_price
+    if compare_at_price > new_price:
+        discount_percentage = round((1 - new_price / compare_at_price) * 100)
+    else:
+        discount_percentage = 0
+    return new_price, compare_at_price, discount_percentage
+
+
+def check_endings(prices: list) -> int:
+    values = np.array(prices, dtype=np.float64)
+    mismatches = 0
+    for family, scalar in ENDINGS.items():
+        result = VECTOR_ENDINGS[family](values).tolist()
+        for price, got in zip(prices, result):
+            expected = scalar(price)
+            if expected != got:
+                mismatches += 1
+                print(f"  {scalar.__name__}({price!r}): scalar {expected!r} vs vector {got!r}")
+    return mismatches
+
+
+def check_block(prices: list, countries: list) -> int:
+    mismatches = 0
+    current = np.array(prices, dtype=np.float64)[:, None].repeat(len(countries), axis=1)
+    endings = [vector_ending(country) for country in countries]
+    for base_adjustment, discount in ((0.0, 0.0), (0.1, 0.4), (-0.12, 0.3), (0.05, 1.0)):
+        new_price, compare_at, percent = (
+            block.tolist() for block in market_price_block(current, endings, base_adjustment, discount)
+        )
+        for i, price in enumerate(prices):
+            for j, country in enumerate(countries):
+                expected = scalar_cell(price, country, base_adjustment, discount)
+                got = (new_price[i][j], compare_at[i][j], percent[i][j])
+                if expected != got:
+                    mismatches += 1
+                    if mismatches <= 10:
+                        print(f"  {country} {price!r} ({base_adjustment}, {discount}): {expected} vs {got}")
+    return mismatches
+
+
+def benchmark(variants: int, markets: int, rng: random.Random) -> dict:
+    countries = (list(COUNTRIES) * (markets // len(COUNTRIES) + 1))[:markets]
+    current = np.array([[rng.randint(1000, 500000) / 100 for _ in range(markets)] for _ in range(variants)])
+    current_rows = current.tolist()
+
+    start = time.monotonic()
+    for row in current_rows:
+        for price, country in zip(row, countries):
+            scalar_cell(price, country, 0.1, 0.4)
+    scalar_seconds = time.monotonic() - start
+
+    start = time.monotonic()
+    market_price_block(current, [vector_ending(country) for country in countries], 0.1, 0.4)
+    kernel_seconds = time.monotonic() - start
+
+    return {
+        "grid": f"{variants} x {markets}",
+        "cells": variants * markets,
+        "scalar_seconds": round(scalar_seconds, 3),
+        "kernel_seconds": round(kernel_seconds, 3),
+        "speedup": round(scalar_seconds / kernel_seconds, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--variants", type=int, default=50000)
+    parser.add_argument("--markets", type=int, default=60)
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    prices = sample_prices(rng, args.samples)
+    countries = sorted(set(COUNTRIES) | set(MARKET_ALIASES)) + ["Pays inconnu"]
+
+    endings = check_endings(prices)
+    print(f"endings parity: {len(ENDINGS)} families, {len(prices)} prices, {endings} mismatches")
+    block = check_block(prices[:2000], countries)
+    print(f"preview parity: {len(countries)} countries, {block} mismatches")
+    print(benchmark(args.variants, args.markets, rng))
+
+    if endings or block:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark de l'ordonnanceur de coût contre le serveur Shopify de substitution
+
+    uvicorn app.devtools.fake_shopify:app --port 8787 &
+    SHOPIFY_SHOP_DOMAIN=http://127.0.0.1:8787 python -m app.devtools.bench_throttle
+
+Lance N appelants concurrents qui paginent chacun une PriceList,
+avec puis sans ordonnanceur, et compare durée et réponses THROTTLED.
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.services.http_pool import http_pool
+from app.services.shopify import ShopifyService
+from app.services.shopify_throttle import get_throttle_scheduler, is_throttled
+
+PRICES_QUERY = """
+query GetPriceListPrices($priceListId: ID!, $first: Int!, $after: String) {
+    priceList(id: $priceListId) {
+        prices(first: $first, after: $after) {
+            edges {
+                node {
+                    variant { id }
+                    price { amount currencyCode }
+                }
+                cursor
+            }
+            pageInfo { hasNextPage }
+        }
+    }
+}
+"""
+
+
+async def paginate(service: ShopifyService, price_list_id: str, stats: dict):
+    cursor = None
+    while True:
+        variables = {"priceListId": price_list_id, "first": 250}
+        if cursor:
+            variables["after"] = cursor
+        result = await service.execute_query(PRICES_QUERY, variables)
+        if is_throttled(result):
+            stats["failed_callers"] += 1
+            return
+        edges = result["data"]["priceList"]["prices"]["edges"]
+        stats["pages"] += 1
+        if not edges or not result["data"]["priceList"]["prices"]["pageInfo"]["hasNextPage"]:
+            return
+        cursor = edges[-1]["cursor"]
+
+
+async def run(service: ShopifyService, callers: int, enabled: bool) -> dict:
+    scheduler = get_throttle_scheduler(service.shop_domain)
+    scheduler.enabled = enabled
+
+    async with httpx.AsyncClient() as client:
+        before = (await client.get(f"{service.shop_domain}/_fake/stats")).json()
+
+    stats = {"pages": 0, "failed_callers": 0}
+    start = time.monotonic()
+    await asyncio.gather(*[
+        paginate(service, f"gid://shopify/PriceList/{(i % 10) + 1}", stats)
+        for i in range(callers)
+    ])
+    elapsed = time.monotonic() - start
+
+    async with httpx.AsyncClient() as client:
+        after = (await client.get(f"{service.shop_domain}/_fake/stats")).json()
+
+    return {
+        "scheduler": enabled,
+        "seconds": round(elapsed, 2),
+        "pages": stats["pages"],
+        "failed_callers": stats["failed_callers"],
+        "server_throttled": after["throttled"] - before["throttled"],
+        "client": scheduler.get_stats()
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--callers", type=int, default=8)
+    args = parser.parse_args()
+
+    service = ShopifyService()
+    try:
+        for enabled in (True, False):
+            result = await run(service, args.callers, enabled)
+            print(result)
+            # Laisser le bucket du serveur se remplir entre les deux passes
+            await asyncio.sleep(20)
+    finally:
+        await http_pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,424 @@
+"""
+Serveur Shopify de substitution (développement / benchmarks hors ligne)
+Simule l'API GraphQL Admin avec un catalogue synthétique et un bucket de coût
+
+Lancement :
+    uvicorn app.devtools.fake_shopify:app --port 8787
+Puis pointer le backend dessus :
+    SHOPIFY_SHOP_DOMAIN=http://127.0.0.1:8787
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from typing import Dict, List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.config.countries import COUNTRIES
+from app.services.shopify_throttle import estimate_query_cost
+
+# Paramètres de simulation
+FAKE_MARKETS = int(os.environ.get("FAKE_SHOPIFY_MARKETS", "10"))
+FAKE_PRODUCTS = int(os.environ.get("FAKE_SHOPIFY_PRODUCTS", "200"))
+FAKE_VARIANTS_PER_PRODUCT = int(os.environ.get("FAKE_SHOPIFY_VARIANTS", "3"))
+FAKE_BUCKET_MAX = float(os.environ.get("FAKE_SHOPIFY_BUCKET_MAX", "1000"))
+FAKE_RESTORE_RATE = float(os.environ.get("FAKE_SHOPIFY_RESTORE_RATE", "50"))
+FAKE_LATENCY_MS = float(os.environ.get("FAKE_SHOPIFY_LATENCY_MS", "50"))
+FAKE_BULK_DELAY_MS = float(os.environ.get("FAKE_SHOPIFY_BULK_DELAY_MS", "500"))
+# Fichier JSONL servi à la place du catalogue synthétique pour les bulk operations
+FAKE_BULK_FIXTURE = os.environ.get("FAKE_SHOPIFY_BULK_FIXTURE", "")
+# Pannes simulées : part des requêtes en 502, part des requêtes en 429 (+ Retry-After)
+FAKE_ERROR_RATE = float(os.environ.get("FAKE_SHOPIFY_ERROR_RATE", "0"))
+FAKE_429_RATE = float(os.environ.get("FAKE_SHOPIFY_429_RATE", "0"))
+FAKE_RETRY_AFTER = os.environ.get("FAKE_SHOPIFY_RETRY_AFTER", "1")
+
+VARIANT_ID_OFFSET = 40000000000
+PRODUCT_ID_OFFSET = 8000000000
+# updatedAt du catalogue synthétique initial
+FAKE_CREATED_AT = "2024-01-01T00:00:00Z"
+
+
+class FakeShop:
+    """Catalogue synthétique déterministe + bucket de coût"""
+
+    def __init__(self, seed: int = 42):
+        rng = random.Random(seed)
+
+        self.markets: List[dict] = []
+        for idx, name in enumerate(list(COUNTRIES.keys())[:FAKE_MARKETS]):
+            currency = COUNTRIES[name]["currency"]
+            self.markets.append({
+                "id": f"gid://shopify/Market/{idx + 1}",
+                "name": name,
+                "handle": name.lower().replace(" ", "-"),
+                "enabled": True,
+                "primary": idx == 0,
+                "currencySettings": {"baseCurrency": {"currencyCode": currency}},
+                "priceList": {
+                    "id": f"gid://shopify/PriceList/{idx + 1}",
+                    "name": f"{name} prices",
+                    "currency": currency
+                }
+            })
+
+        self.products: List[dict] = []
+        for p in range(FAKE_PRODUCTS):
+            product_id = PRODUCT_ID_OFFSET + p
+            variants = []
+            for v in range(FAKE_VARIANTS_PER_PRODUCT):
+                variants.append({
+                    "id": f"gid://shopify/ProductVariant/{VARIANT_ID_OFFSET + p * 100 + v}",
+                    "sku": f"LUX-{p:05d}-{v}",
+                    "title": f"Taille {v + 1}",
+                    "price": f"{rng.randint(40, 400)}.00",
+                    "compareAtPrice": None,
+                    "updatedAt": FAKE_CREATED_AT
+                })
+            self.products.append({
+                "id": f"gid://shopify/Product/{product_id}",
+                "title": f"Produit {p:05d}",
+                "handle": f"produit-{p:05d}",
+                "status": "ACTIVE",
+                "updatedAt": FAKE_CREATED_AT,
+                "featuredImage": None,
+                "variants": variants
+            })
+
+        # Prix fixes par PriceList : {price_list_id: {variant_id: (price, compare_at)}}
+        self.price_lists: Dict[str, Dict[str, tuple]] = {}
+        for market in self.markets:
+            rate = COUNTRIES[market["name"]]["exchange_rate"]
+            prices = {}
+            for product in self.products:
+                for variant in product["variants"]:
+                    amount = round(float(variant["price"]) * rate, 2)
+                    prices[variant["id"]] = (f"{amount:.2f}", None)
+            self.price_lists[market["priceList"]["id"]] = prices
+
+        # Bulk operations : {id: {"created_at": float, "objects": int}}
+        self.bulk_operations: Dict[str, dict] = {}
+
+        # Bucket de coût
+        self.available = FAKE_BUCKET_MAX
+        self.updated_at = time.monotonic()
+        self.stats = {"requests": 0, "throttled": 0, "injected": 0}
+        # Fin de la panne simulée (POST /_fake/outage)
+        self.outage_until = 0.0
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(FAKE_BUCKET_MAX, self.available + (now - self.updated_at) * FAKE_RESTORE_RATE)
+        self.updated_at = now
+
+    def cost_extension(self, requested: float, actual) -> dict:
+        return {
+            "cost": {
+                "requestedQueryCost": requested,
+                "actualQueryCost": actual,
+                "throttleStatus": {
+                    "maximumAvailable": FAKE_BUCKET_MAX,
+                    "currentlyAvailable": round(self.available, 1),
+                    "restoreRate": FAKE_RESTORE_RATE
+                }
+            }
+        }
+
+
+shop = FakeShop()
+app = FastAPI(title="Fake Shopify Admin API")
+
+
+# ========================================
+# RÉSOLVEURS
+# ========================================
+
+def _connection(items: List[dict], first: int, after) -> tuple:
+    """Découpe une liste en page de connexion (curseur = offset)"""
+    start = int(after) if after else 0
+    page = items[start:start + first]
+    edges = [{"node": item, "cursor": str(start + i + 1)} for i, item in enumerate(page)]
+    return {
+        "edges": edges,
+        "pageInfo": {"hasNextPage": start + first < len(items)}
+    }, len(page)
+
+
+def _product_node(product: dict) -> dict:
+    return {
+        **{k: v for k, v in product.items() if k != "variants"},
+        "variants": {"edges": [{"node": dict(v)} for v in product["variants"]]}
+    }
+
+
+def _updated_since(search: str):
+    """Filtre updated_at:>'2024-01-01T00:00:00Z' d'une recherche, None si absent"""
+    match = re.search(r"updated_at:>'?([^'\s]+)'?", search)
+    return match.group(1) if match else None
+
+
+def _filter_products(search: str) -> List[dict]:
+    if not search:
+        return shop.products
+    since = _updated_since(search)
+    if since:
+        return [p for p in shop.products if p["updatedAt"] > since]
+    if search.startswith("sku:"):
+        sku = search[4:]
+        return [p for p in shop.products if any(v["sku"] == sku for v in p["variants"])]
+    search = search.lower()
+    return [p for p in shop.products if search in p["title"].lower()]
+
+
+def _search_values(search: str, field: str) -> set:
+    """Valeurs d'un filtre de recherche : 'sku:"A" OR sku:B' → {"A", "B"}"""
+    return set(re.findall(rf'\b{field}:"?([^"\s]+)"?', search))
+
+
+def _price_nodes(price_list_id: str, variant_ids=None) -> List[dict]:
+    market = next(m for m in shop.markets if m["priceList"]["id"] == price_list_id)
+    currency = market["priceList"]["currency"]
+    return [
+        {
+            "variant": {"id": variant_id},
+            "price": {"amount": price, "currencyCode": currency},
+            "compareAtPrice": {"amount": compare_at, "currencyCode": currency} if compare_at else None
+        }
+        for variant_id, (price, compare_at) in shop.price_lists[price_list_id].items()
+        if variant_ids is None or variant_id.rsplit("/", 1)[-1] in variant_ids
+    ]
+
+
+def _bulk_lines():
+    """Lignes JSONL d'un export bulk des PriceLists (fixture ou catalogue synthétique)"""
+    if FAKE_BULK_FIXTURE:
+        with open(FAKE_BULK_FIXTURE, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line.rstrip("\n") + "\n"
+        return
+
+    for market in shop.markets:
+        price_list = market["priceList"]
+        currency = price_list["currency"]
+        yield json.dumps({"id": price_list["id"], "currency": currency}) + "\n"
+        for variant_id, (price, compare_at) in shop.price_lists[price_list["id"]].items():
+            yield json.dumps({
+                "variant": {"id": variant_id},
+                "price": {"amount": price, "currencyCode": currency},
+                "compareAtPrice": {"amount": compare_at} if compare_at else None,
+                "__parentId": price_list["id"]
+            }) + "\n"
+
+
+def _bulk_operation_node(operation_id: str, base_url: str):
+    operation = shop.bulk_operations.get(operation_id)
+    if operation is None:
+        return None
+    done = (time.monotonic() - operation["created_at"]) * 1000 >= FAKE_BULK_DELAY_MS
+    number = operation_id.split("/")[-1]
+    return {
+        "id": operation_id,
+        "status": "COMPLETED" if done else "RUNNING",
+        "errorCode": None,
+        "objectCount": str(operation["objects"]) if done else "0",
+        "url": f"{base_url}_fake/bulk/{number}.jsonl" if done else None,
+        "partialDataUrl": None
+    }
+
+
+def resolve(query: str, variables: dict, base_url: str = "") -> tuple:
+    """Retourne (data, nombre d'éléments renvoyés)"""
+    if "bulkOperationRunQuery" in query:
+        operation_id = f"gid://shopify/BulkOperation/{len(shop.bulk_operations) + 1}"
+        objects = sum(1 + len(prices) for prices in shop.price_lists.values())
+        shop.bulk_operations[operation_id] = {"created_at": time.monotonic(), "objects": objects}
+        return {"bulkOperationRunQuery": {
+            "bulkOperation": {"id": operation_id, "status": "CREATED"},
+            "userErrors": []
+        }}, 1
+
+    if re.search(r'\bnode\s*\(', query):
+        return {"node": _bulk_operation_node(variables.get("id", ""), base_url)}, 1
+
+    if "priceListFixedPricesAdd" in query:
+        prices = shop.price_lists.get(variables["priceListId"])
+        if prices is None:
+            return {"priceListFixedPricesAdd": {
+                "prices": [],
+                "userErrors": [{"field": ["priceListId"], "message": "Price list not found"}]
+            }}, 0
+        updated = []
+        for item in variables["prices"]:
+            compare_at = item.get("compareAtPrice")
+            prices[item["variantId"]] = (item["price"]["amount"], compare_at["amount"] if compare_at else None)
+            updated.append({"variant": {"id": item["variantId"]}, "price": item["price"]})
+        return {"priceListFixedPricesAdd": {"prices": updated, "userErrors": []}}, len(updated)
+
+    first = int(variables.get("first", 50))
+    after = variables.get("after")
+
+    # PriceLists en alias filtrées par variantes : pl0: priceList(id: $pl0) { prices(query: $query) }
+    aliases = re.findall(r'(\w+)\s*:\s*priceList\s*\(\s*id\s*:\s*\$(\w+)', query)
+    if aliases:
+        variant_ids = _search_values(variables.get("query") or "", "variant_id")
+        data, returned = {}, 0
+        for alias, variable in aliases:
+            price_list_id = variables.get(variable)
+            if price_list_id not in shop.price_lists:
+                data[alias] = None
+                continue
+            nodes = _price_nodes(price_list_id, variant_ids)[:first]
+            returned = max(returned, len(nodes))
+            data[alias] = {"id": price_list_id, "prices": {"edges": [{"node": n} for n in nodes]}}
+        return data, returned
+
+    if re.search(r'\bproductVariants\s*\(', query):
+        search = variables.get("query") or ""
+        skus = _search_values(search, "sku")
+        since = _updated_since(search)
+        variants = [
+            {**v, "product": {"id": p["id"]}}
+            for p in shop.products for v in p["variants"]
+            if (not skus or v["sku"] in skus) and (not since or v["updatedAt"] > since)
+        ]
+        connection, count = _connection(variants, first, after)
+        return {"productVariants": connection}, count
+
+    if re.search(r'\bmarkets\s*\(', query):
+        connection, count = _connection(shop.markets, first, after)
+        return {"markets": connection}, count
+
+    if re.search(r'\bmarket\s*\(', query):
+        market = next((m for m in shop.markets if m["id"] == variables.get("marketId")), None)
+        return {"market": market}, 1
+
+    if re.search(r'\bpriceList\s*\(', query):
+        price_list_id = variables.get("priceListId")
+        prices = shop.price_lists.get(price_list_id)
+        if prices is None:
+            return {"priceList": None}, 0
+        market = next(m for m in shop.markets if m["priceList"]["id"] == price_list_id)
+        currency = market["priceList"]["currency"]
+        connection, count = _connection(_price_nodes(price_list_id), first, after)
+        return {"priceList": {
+            "id": price_list_id,
+            "name": market["priceList"]["name"],
+            "currency": currency,
+            "prices": connection
+        }}, count
+
+    if re.search(r'\bproduct\s*\(', query):
+        product = next((p for p in shop.products if p["id"] == variables.get("id")), None)
+        return {"product": _product_node(product) if product else None}, 1
+
+    if re.search(r'\bproducts\s*\(', query):
+        products = [_product_node(p) for p in _filter_products(variables.get("query") or "")]
+        connection, count = _connection(products, first, after)
+        return {"products": connection}, count
+
+    return None, 0
+
+
+def _injected_failure():
+    """Panne simulée : 503 pendant une panne, sinon 502 / 429 aléatoires"""
+    if time.monotonic() < shop.outage_until:
+        return JSONResponse({"errors": "Service Unavailable"}, status_code=503)
+    roll = random.random()
+    if roll < FAKE_ERROR_RATE:
+        return JSONResponse({"errors": "Bad Gateway"}, status_code=502)
+    if roll < FAKE_ERROR_RATE + FAKE_429_RATE:
+        return JSONResponse(
+            {"errors": "Too Many Requests"}, status_code=429, headers={"Retry-After": FAKE_RETRY_AFTER}
+        )
+    return None
+
+
+# ========================================
+# ENDPOINTS
+# ========================================
+
+@app.post("/admin/api/{api_version}/graphql.json")
+async def graphql(api_version: str, request: Request):
+    body = await request.json()
+    query = body.get("query", "")
+    variables = body.get("variables") or {}
+
+    shop.stats["requests"] += 1
+
+    failure = _injected_failure()
+    if failure is not None:
+        shop.stats["injected"] += 1
+        return failure
+
+    requested = estimate_query_cost(query, variables)
+
+    shop.refill()
+    if shop.available < requested:
+        shop.stats["throttled"] += 1
+        return {
+            "errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}],
+            "extensions": shop.cost_extension(requested, None)
+        }
+    shop.available -= requested
+
+    if FAKE_LATENCY_MS:
+        await asyncio.sleep(FAKE_LATENCY_MS / 1000)
+
+    data, returned = resolve(query, variables, str(request.base_url))
+    if data is None:
+        return {"errors": [{"message": "Unsupported query in fake server"}]}
+
+    # Coût réel : même calcul avec le nombre d'éléments effectivement renvoyés
+    actual = requested
+    if "first" in variables:
+        actual = estimate_query_cost(query, {**variables, "first": returned})
+    shop.refill()
+    shop.available = min(FAKE_BUCKET_MAX, shop.available + requested - actual)
+
+    return {"data": data, "extensions": shop.cost_extension(requested, actual)}
+
+
+@app.get("/_fake/bulk/{number}.jsonl")
+async def bulk_result(number: str):
+    """Fichier JSONL d'une bulk operation terminée, envoyé en streaming"""
+    if f"gid://shopify/BulkOperation/{number}" not in shop.bulk_operations:
+        raise HTTPException(status_code=404, detail="Unknown bulk operation")
+    return StreamingResponse(_bulk_lines(), media_type="application/jsonl")
+
+
+@app.post("/_fake/outage")
+async def start_outage(seconds: float = 30):
+    """Simule une panne : toutes les requêtes GraphQL en 503 pendant `seconds`"""
+    shop.outage_until = time.monotonic() + seconds
+    return {"outage_seconds": seconds}
+
+
+@app.post("/_fake/touch")
+async def touch_products(count: int = 10, delete: int = 0):
+    """
+    Simule des modifications dans l'admin : les `count` premiers produits
+    changent de titre et de prix (updatedAt = maintenant), les `delete`
+    derniers sont supprimés
+    """
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    for product in shop.products[:count]:
+        product["title"] = product["title"].split(" (")[0] + f" ({now})"
+        product["updatedAt"] = now
+        for variant in product["variants"]:
+            variant["price"] = f"{float(variant['price']) + 1:.2f}"
+            variant["updatedAt"] = now
+    deleted = shop.products[len(shop.products) - delete:] if delete else []
+    del shop.products[len(shop.products) - len(deleted):]
+    return {"touched": min(count, len(shop.products)), "deleted": len(deleted), "updated_at": now}
+
+
+@app.get("/_fake/stats")
+async def fake_stats():
+    """Compteurs du serveur (requêtes reçues, rejetées THROTTLED, pannes simulées)"""
+    shop.refill()
+    return {**shop.stats, "currently_available": round(shop.available, 1)}
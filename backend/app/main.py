@@ -16,6 +16,12 @@ from app.routers.csv_processor import router as csv_router
 # Services
 from app.services.shopify import ShopifyService
 from app.services.price_cache import price_cache
+from app.services.product_catalog import product_catalog
+from app.services.http_pool import http_pool
+from app.services.shopify_throttle import get_throttle_stats
+from app.services.market_registry import get_market_registry_stats
+from app.services.single_flight import cancel_single_flights, get_single_flight_stats
+from app.services.shopify_retry import get_retry_stats
 
 # Logging
 logging.basicConfig(level=logging.INFO)
@@ -32,26 +38,38 @@ async def lifespan(app: FastAPI):
     # Lancer le chargement du cache en arrière-plan
     shopify_service = ShopifyService()
     
-    # Créer une tâche de fond pour charger le cache
+    # Client HTTP partagé (keep-alive + HTTP/2) pour tous les ShopifyService
+    shopify_service.open_http_pool()
+    
+    # Tâche de fond : chargement initial si le snapshot est absent ou expiré,
+    # puis rafraîchissement périodique des marchés expirés
     # Ne pas bloquer le démarrage du serveur
-    asyncio.create_task(load_cache_background(shopify_service))
+    refresh_task = asyncio.create_task(price_cache.run_refresh_scheduler(shopify_service))
+    
+    # Compaction périodique du journal des Apply dans le snapshot
+    compaction_task = asyncio.create_task(price_cache.run_compaction_loop())
+    
+    # Catalogue produits local : synchronisation incrémentale périodique
+    catalog_task = asyncio.create_task(product_catalog.run_sync_scheduler(shopify_service))
     
-    logger.info("Cache loading started in background")
+    logger.info("Cache refresh scheduler started in background")
     logger.info("Server is ready to accept requests")
     
     yield
     
     logger.info("=== APPLICATION SHUTDOWN ===")
-
-
-async def load_cache_background(shopify_service: ShopifyService):
-    """Charge le cache en arrière-plan"""
-    try:
-        logger.info("Starting background cache load...")
-        await price_cache.load_all_prices(shopify_service)
-        logger.info("Background cache load completed!")
-    except Exception as e:
-        logger.error(f"Background cache load failed: {e}")
+    tasks = [refresh_task, compaction_task, catalog_task]
+    for task in tasks:
+        task.cancel()
+    # Attendre la fin réelle des tâches (un chargement annulé libère le cache
+    # et ses requêtes HTTP) avant de compacter et de fermer le pool ; les
+    # appels partagés encore en vol sont annulés aussi
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await cancel_single_flights()
+    # Compacter le journal et attendre la fin des écritures du snapshot
+    price_cache.compact()
+    await price_cache.flush(timeout=30)
+    await http_pool.close()
 
 
 # Create FastAPI app
@@ -83,6 +101,7 @@ app.include_router(csv_router)    # csv_router a déjà le préfixe /api/csv
 async def root():
     """Health check endpoint"""
     cache_status = price_cache.get_status()
+    catalog_status = product_catalog.get_status()
     return {
         "status": "ok",
         "service": "Luxarmonie Hub API",
@@ -92,10 +111,27 @@ async def root():
             "loading": cache_status["loading"],
             "markets": cache_status["markets_count"],
             "prices": cache_status["total_prices"]
+        },
+        "catalog": {
+            "loaded": catalog_status["loaded"],
+            "products": catalog_status["products"],
+            "variants": catalog_status["variants"]
         }
     }
 
 
+@app.get("/api/shopify/stats")
+async def shopify_stats():
+    """Statistiques du client Shopify (connexions, bucket de coût, registre des marchés, coalescence, retries / circuit)"""
+    return {
+        "http": http_pool.get_stats(),
+        "throttle": get_throttle_stats(),
+        "markets": get_market_registry_stats(),
+        "coalescing": get_single_flight_stats(),
+        "retries": get_retry_stats()
+    }
+
+
 @app.get("/health")
 async def health():
     """Health check for Railway"""
@@ -1,15 +1,24 @@
 """
 Router pour la gestion du cache des prix
 """
-from fastapi import APIRouter, BackgroundTasks
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
+from pydantic import BaseModel
 from app.services.shopify import ShopifyService
-from app.services.price_cache import price_cache
+from app.services.price_cache import price_cache, CACHE_SCOPED_REFRESH_WAIT, CACHE_TTL_SECONDS
 
 router = APIRouter(prefix="/api/cache", tags=["cache"])
 
 shopify_service = ShopifyService()
 
 
+class VariantRefreshRequest(BaseModel):
+    variant_ids: Optional[List[str]] = None  # GID ou ID numérique
+    skus: Optional[List[str]] = None
+
+
 @router.get("/status")
 async def get_cache_status():
     """Retourne le statut du cache"""
@@ -17,11 +26,54 @@ async def get_cache_status():
 
 
 @router.post("/refresh")
-async def refresh_cache(background_tasks: BackgroundTasks):
+async def refresh_cache(
+    background_tasks: BackgroundTasks,
+    mode: str = Query("paginated", description="paginated (par PriceList) ou bulk (Bulk Operation JSONL)"),
+    stale_only: bool = Query(False, description="Ne recharger que les marchés expirés (TTL)"),
+    markets: Optional[List[str]] = Query(None, description="Noms des marchés à recharger"),
+    price_list_ids: Optional[List[str]] = Query(None, description="IDs des PriceLists à recharger")
+):
     """
     Lance le rafraîchissement du cache en arrière-plan.
     Retourne immédiatement avec le statut.
+    
+    Avec markets / price_list_ids, seuls ces marchés sont rechargés : le
+    rafraîchissement est attendu et la réponse détaille le travail par marché.
+    Les autres marchés restent servis depuis le cache pendant ce temps.
+    Si un chargement est déjà en cours (planificateur compris), la demande
+    ciblée attend sa fin (CACHE_SCOPED_REFRESH_WAIT secondes max) puis
+    s'exécute ; au-delà elle est refusée (success=False, queued=False).
     """
+    if mode not in ("paginated", "bulk"):
+        raise HTTPException(status_code=400, detail=f"Mode '{mode}' invalide (paginated ou bulk)")
+    
+    # Rafraîchissement ciblé : mis en file derrière le chargement en cours
+    if markets or price_list_ids:
+        waited = time.monotonic()
+        if not await price_cache.wait_until_idle(CACHE_SCOPED_REFRESH_WAIT):
+            return {
+                "success": False,
+                "queued": False,
+                "message": f"Un chargement est toujours en cours après {CACHE_SCOPED_REFRESH_WAIT:.0f}s d'attente, réessayer plus tard",
+                "status": price_cache.get_status()
+            }
+        waited_s = round(time.monotonic() - waited, 2)
+        
+        max_age = CACHE_TTL_SECONDS if stale_only else None
+        success = await price_cache.load_all_prices(
+            shopify_service, mode, max_age, markets=markets, price_list_ids=price_list_ids
+        )
+        progress = price_cache.load_progress
+        return {
+            "success": success,
+            "mode": mode,
+            "waited_s": waited_s,
+            "markets": progress["markets"],
+            "unknown": progress.get("unknown", []),
+            "total_prices": progress["total_prices"],
+            "http_requests": progress.get("http_requests", 0)
+        }
+    
     if price_cache.is_loading:
         return {
             "success": False,
@@ -30,15 +82,42 @@ async def refresh_cache(background_tasks: BackgroundTasks):
         }
     
     # Lancer le chargement en arrière-plan
-    background_tasks.add_task(price_cache.load_all_prices, shopify_service)
+    max_age = CACHE_TTL_SECONDS if stale_only else None
+    background_tasks.add_task(price_cache.load_all_prices, shopify_service, mode, max_age)
     
     return {
         "success": True,
         "message": "Chargement du cache lancé en arrière-plan",
+        "mode": mode,
+        "stale_only": stale_only,
         "status": price_cache.get_status()
     }
 
 
+@router.post("/refresh/variants")
+async def refresh_variants(request: VariantRefreshRequest):
+    """
+    Recharge les prix de quelques variantes (IDs ou SKUs) dans tous les marchés
+    du cache, après une modification faite directement dans l'admin Shopify.
+    """
+    if not request.variant_ids and not request.skus:
+        raise HTTPException(status_code=400, detail="variant_ids ou skus requis")
+    
+    if not price_cache.is_loaded:
+        raise HTTPException(status_code=409, detail="Le cache n'est pas encore chargé")
+    
+    try:
+        result = await price_cache.refresh_variants(
+            shopify_service,
+            variant_ids=request.variant_ids,
+            skus=request.skus
+        )
+    except Exception as e:
+        # Rien n'est écrit dans le cache si une requête Shopify échoue
+        raise HTTPException(status_code=502, detail=f"Rechargement des variantes échoué: {e}")
+    return {"success": True, **result}
+
+
 @router.get("/progress")
 async def get_cache_progress():
     """Retourne la progression du chargement"""
@@ -8,99 +8,23 @@ from fastapi import APIRouter, HTTPException, UploadFile, File, Form
 from fastapi.responses import StreamingResponse
 from typing import Optional
 import pandas as pd
-import math
 import random
 import io
 import logging
 
+from app.services.pricing_rules import pricing_rules
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/csv", tags=["csv"])
 
 
 # ========================================
-# FONCTIONS DE TERMINAISON PSYCHOLOGIQUE
+# TERMINAISONS PSYCHOLOGIQUES (services/pricing_rules)
 # ========================================
 
-def round_99(price: float) -> float:
-    """Low-context: .99"""
-    return float(math.floor(price)) + 0.99
-
-def round_95(price: float) -> float:
-    """Allemagne, Autriche, Suisse: .95"""
-    return float(math.floor(price)) + 0.95
-
-def round_00(price: float) -> float:
-    """High-context: .00"""
-    return float(round(price))
-
-def round_9_int(price: float) -> float:
-    """Moyen-Orient: entier finissant en 9"""
-    base = int(price)
-    last = base % 10
-    if last == 9:
-        return float(base)
-    elif last < 9:
-        return float(base - last + 9) if base >= 10 else float(9)
-    return float(base - 1)
-
-def round_000(price: float) -> float:
-    """Grandes devises: milliers"""
-    thousands = round(price / 1000)
-    return float(max(thousands, 1) * 1000)
-
-def round_990(price: float) -> float:
-    """HUF, CZK, RSD: en 990/90/9"""
-    base = int(price)
-    if base >= 10000:
-        return float((base // 1000) * 1000 + 990)
-    elif base >= 1000:
-        return float((base // 100) * 100 + 90)
-    else:
-        return float((base // 10) * 10 + 9)
-
-def round_kr(price: float) -> float:
-    """Scandinave: multiples de 5"""
-    return float(round(price / 5) * 5)
-
-
-# Mapping pays → fonction
-COUNTRY_ROUNDING = {
-    # .99
-    'France': round_99, 'USA': round_99, 'UK': round_99, 'Canada': round_99,
-    'Australie': round_99, 'Nouvelle': round_99, 'Belgique': round_99,
-    'Espagne': round_99, 'Pays-Bas': round_99, 'Luxembourg': round_99,
-    'ESTONIE': round_99, 'Grèce': round_99, 'Irlande': round_99,
-    'Portugal': round_99, 'Croatie': round_99, 'Finlande': round_99,
-    'Pologne': round_99, 'Mexique': round_99, 'Israël': round_99,
-    'Pérou': round_99, 'Bolivie': round_99, 'Guatemala': round_99,
-    'Honduras': round_99, 'Turquie': round_99, 'République Dominique': round_99,
-    
-    # .95
-    'Allemagne': round_95, 'Autriche': round_95, 'Suisse': round_95,
-    
-    # .00
-    'Italie': round_00, 'Brésil': round_00, 'Honk Hong': round_00,
-    'SINGAPOUR': round_00, 'Argentine': round_00, 'Uruguay': round_00,
-    'Costa Rica': round_00, 'Afrique du Sud': round_00, 'Équateur': round_00,
-    'Bahrëin': round_00, 'sal': round_00, 'Autres': round_00,
-    'Norvège': round_00,
-    
-    # Scandinave
-    'Danemark': round_kr, 'Suède': round_kr,
-    
-    # 990
-    'Hongrie': round_990, 'République tchèque': round_990, 'Serbie': round_990,
-    
-    # 9 entier
-    'Arabie Saoudite': round_9_int, 'Émirats Arabes Unis': round_9_int, 'Qatar': round_9_int,
-    
-    # Milliers
-    'Chili': round_000, 'Colombie': round_000, 'Paraguay': round_000,
-}
-
 def get_rounding_function(country: str):
-    return COUNTRY_ROUNDING.get(country, round_99)
+    return pricing_rules.plan(country).round
 
 
 def detect_csv_format(df: pd.DataFrame) -> str:
@@ -397,7 +321,7 @@ async def csv_info():
     """Infos sur le module CSV"""
     return {
         "module": "CSV Price Modifier",
-        "supported_countries": len(COUNTRY_ROUNDING),
+        "supported_countries": len(pricing_rules),
         "output_format": "Matrixify compatible",
         "features": [
             "Ajustement global (+/- %)",
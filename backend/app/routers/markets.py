@@ -4,6 +4,8 @@ Router pour la gestion des marchés Shopify
 
 from fastapi import APIRouter, HTTPException
 from app.services.shopify import shopify_service
+from app.services.price_cache import price_cache
+from app.services.pricing_rules import pricing_rules
 from app.config.countries import COUNTRIES, get_all_countries
 from typing import List, Optional
 from pydantic import BaseModel
@@ -78,6 +80,23 @@ async def get_markets():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/refresh")
+async def refresh_markets():
+    """
+    Invalide le registre des marchés et recharge la liste depuis Shopify
+    (après création ou modification d'un marché / d'une PriceList)
+    """
+    shopify_service.invalidate_markets()
+    try:
+        markets = await shopify_service.get_all_markets()
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Chargement des marchés échoué: {e}")
+    return {
+        "total": len(markets),
+        "with_price_list": len([m for m in markets if m.get("priceList")])
+    }
+
+
 @router.get("/countries")
 async def get_countries_config():
     """
@@ -102,9 +121,8 @@ async def get_market_details(market_name: str):
     Récupère les détails d'un marché spécifique
     """
     try:
-        # Récupérer depuis Shopify
-        markets = await shopify_service.get_all_markets()
-        market = next((m for m in markets if m["name"] == market_name), None)
+        # Récupérer depuis le registre des marchés
+        market = await shopify_service.get_market_by_name(market_name)
         
         if not market:
             raise HTTPException(status_code=404, detail=f"Market '{market_name}' not found")
@@ -112,16 +130,17 @@ async def get_market_details(market_name: str):
         # Config Luxarmonie
         config = COUNTRIES.get(market_name)
         
-        # Price list
-        price_list = await shopify_service.get_catalog_price_list(market["id"])
+        # Price list (déjà dans le registre) et nombre de prix connus du cache
+        price_list = market.get("priceList")
+        cached = price_cache.snapshot().markets.get(market_name)
         
         return {
             "market": market,
             "config": config,
             "priceList": {
-                "id": price_list["id"] if price_list else None,
-                "currency": price_list["currency"] if price_list else None,
-                "pricesCount": len(price_list["prices"]["edges"]) if price_list else 0
+                "id": price_list["id"],
+                "currency": price_list["currency"],
+                "pricesCount": cached.count if cached else 0
             } if price_list else None
         }
     
@@ -136,12 +155,10 @@ async def update_exchange_rate(update: ExchangeRateUpdate):
     """
     Met à jour le taux de change d'un pays (temporaire, en mémoire)
     """
-    if update.country not in COUNTRIES:
-        raise HTTPException(status_code=404, detail=f"Country '{update.country}' not found")
-    
     # Note: Cette modification est en mémoire uniquement
     # Pour persister, il faudrait une base de données
-    COUNTRIES[update.country]["exchange_rate"] = update.rate
+    if not pricing_rules.update_market(update.country, exchange_rate=update.rate):
+        raise HTTPException(status_code=404, detail=f"Country '{update.country}' not found")
     
     return {
         "success": True,
@@ -155,11 +172,9 @@ async def update_vat(update: VatUpdate):
     """
     Met à jour la TVA d'un pays (temporaire, en mémoire)
     """
-    if update.country not in COUNTRIES:
+    if not pricing_rules.update_market(update.country, vat=update.vat):
         raise HTTPException(status_code=404, detail=f"Country '{update.country}' not found")
     
-    COUNTRIES[update.country]["vat"] = update.vat
-    
     return {
         "success": True,
         "country": update.country,
@@ -3,15 +3,23 @@ Router pour les opérations de pricing
 V3 - Calcul basé sur prix ACTUEL du marché + tous les produits
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from app.services.shopify import shopify_service
 from app.services.pricing_engine import pricing_engine, PricingOperation
 from app.services.price_cache import price_cache
+from app.services.price_store import MISSING, PriceBlock
+from app.services.pricing_kernel import VectorEnding, apply_endings, market_price_block
+from app.services.pricing_rules import pricing_rules
+from app.services.preview_store import SORT_FIELDS, PreviewSession, preview_store
+from app.services.product_catalog import product_catalog
+from app.services.variant_ids import variant_key, variant_key_set
 from app.config.countries import COUNTRIES, get_all_countries
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from pydantic import BaseModel
 from datetime import datetime
-import math
+import json
+import numpy as np
 
 router = APIRouter(tags=["pricing"])
 
@@ -22,7 +30,8 @@ apply_progress = {
     "markets_done": 0,
     "total_markets": 0,
     "variants_updated": 0,
-    "errors": []
+    "errors": [],
+    "markets": {}  # Résultat par marché terminé
 }
 
 
@@ -42,7 +51,7 @@ class PricingPreviewRequest(BaseModel):
 
 
 class PricingApplyRequest(BaseModel):
-    countries: List[str]
+    countries: List[str] = []  # Ignoré si preview_id
     product_ids: Optional[List[str]] = None
     variant_ids: Optional[List[str]] = None
     all_products: bool = False
@@ -51,6 +60,8 @@ class PricingApplyRequest(BaseModel):
     discount: float = 0.40
     use_market_price: bool = True
     dry_run: bool = False
+    cache_epoch: Optional[int] = None  # Époque du cache renvoyée par la preview
+    preview_id: Optional[str] = None  # Preview stockée : ses lignes sont poussées telles quelles
 
 
 class SingleProductPricingRequest(BaseModel):
@@ -69,164 +80,17 @@ class ExchangeRatesUpdate(BaseModel):
 # ========================================
 
 # ========================================
-# FONCTIONS DE TERMINAISON PAR CULTURE
+# TERMINAISONS PAR MARCHÉ (services/pricing_rules)
 # ========================================
 
-def round_99(price: float) -> float:
-    """Low-context: .99 (USA, UK, France, Canada, Australie...)"""
-    return float(math.floor(price)) + 0.99
-
-def round_95(price: float) -> float:
-    """Allemagne, Autriche, Suisse: .95"""
-    return float(math.floor(price)) + 0.95
-
-def round_00(price: float) -> float:
-    """High-context: .00 (Brésil, Argentine, Italie, Hong Kong, Singapour...)"""
-    return float(round(price))
-
-def round_9_int(price: float) -> float:
-    """Moyen-Orient: entier finissant en 9"""
-    base = int(price)
-    last = base % 10
-    if last == 9:
-        return float(base)
-    elif last < 9:
-        return float(base - last + 9) if base >= 10 else float(9)
-    return float(base - 1)
-
-def round_000(price: float) -> float:
-    """Grandes devises: milliers (Chili, Colombie, Paraguay)"""
-    thousands = round(price / 1000)
-    return float(max(thousands, 1) * 1000)
-
-def round_990(price: float) -> float:
-    """HUF, CZK, RSD: en 990/90/9"""
-    base = int(price)
-    if base >= 10000:
-        return float((base // 1000) * 1000 + 990)
-    elif base >= 1000:
-        return float((base // 100) * 100 + 90)
-    else:
-        return float((base // 10) * 10 + 9)
-
-def round_kr(price: float) -> float:
-    """Scandinave DKK/SEK: multiples de 5"""
-    return float(round(price / 5) * 5)
-
-
-# Mapping des pays vers leur fonction de terminaison
-COUNTRY_ROUNDING = {
-    # .99
-    'France': round_99,
-    'USA': round_99,
-    'UK': round_99,
-    'Canada': round_99,
-    'Australie': round_99,
-    'Nouvelle Zelande': round_99,
-    'Nouvelle-Zélande': round_99,
-    'Belgique': round_99,
-    'Espagne': round_99,
-    'Pays-Bas': round_99,
-    'Luxembourg': round_99,
-    'Estonie': round_99,
-    'Grece': round_99,
-    'Grèce': round_99,
-    'Irlande': round_99,
-    'Portugal': round_99,
-    'Croatie': round_99,
-    'Finlande': round_99,
-    'Pologne': round_99,
-    'Mexique': round_99,
-    'Israel': round_99,
-    'Israël': round_99,
-    'Perou': round_99,
-    'Pérou': round_99,
-    'Bolivie': round_99,
-    'Guatemala': round_99,
-    'Honduras': round_99,
-    'Turquie': round_99,
-    
-    # .95
-    'Allemagne': round_95,
-    'Germany': round_95,
-    'Autriche': round_95,
-    'Suisse': round_95,
-    
-    # .00 (high-context / entier)
-    'Italie': round_00,
-    'Bresil': round_00,
-    'Brésil': round_00,
-    'Hong Kong': round_00,
-    'Singapour': round_00,
-    'Argentine': round_00,
-    'Norvege': round_00,
-    'Norvège': round_00,
-    'Uruguay': round_00,
-    'Costa Rica': round_00,
-    'Afrique du Sud': round_00,
-    'Oman': round_00,
-    'Panama': round_00,
-    'Salvador': round_00,
-    'Malaisie': round_00,
-    'Jordanie': round_00,
-    'Koweit': round_00,
-    'Koweït': round_00,
-    'Liban': round_00,
-    'Bahrein': round_00,
-    'Bahreïn': round_00,
-    'Equateur': round_00,
-    'Équateur': round_00,
-    'Republique Dominicaine': round_00,
-    'République Dominicaine': round_00,
-    
-    # Scandinave (multiples de 5)
-    'Danemark': round_kr,
-    'Suede': round_kr,
-    'Suède': round_kr,
-    
-    # 990
-    'Hongrie': round_990,
-    'Republique Tcheque': round_990,
-    'République Tchèque': round_990,
-    'Tchéquie': round_990,
-    'Serbie': round_990,
-    
-    # Entier en 9 (Moyen-Orient)
-    'Arabie Saoudite': round_9_int,
-    'UAE': round_9_int,
-    'Émirats arabes unis': round_9_int,
-    'Qatar': round_9_int,
-    
-    # Milliers
-    'Chili': round_000,
-    'Colombie': round_000,
-    'Paraguay': round_000,
-}
-
-
 def apply_psychological_ending(price: float, country: str) -> float:
     """Applique la terminaison psychologique selon le pays"""
-    # Utiliser la fonction de terminaison appropriée
-    round_func = COUNTRY_ROUNDING.get(country)
-    
-    if round_func:
-        return round_func(price)
-    
-    # Fallback: utiliser la config COUNTRIES si disponible
-    config = COUNTRIES.get(country, {})
-    ending = config.get("ending", 0.99)
-    
-    try:
-        ending = float(ending)
-    except (ValueError, TypeError):
-        ending = 0.99
-    
-    # Si ending > 1, c'est en centimes (ex: 99), convertir en décimal (0.99)
-    if ending >= 1:
-        ending = ending / 100
-    
-    base = math.floor(price)
-    return round(base + ending, 2)
+    return pricing_rules.plan(country).round(price)
+
+
+def vector_ending(country: str) -> VectorEnding:
+    """Version vectorisée de apply_psychological_ending pour un pays"""
+    return pricing_rules.plan(country).vector
 
 
 def calculate_compare_at(price: float, discount_percent: float) -> float:
@@ -247,6 +111,46 @@ def calculate_compare_at(price: float, discount_percent: float) -> float:
 pricing_history = []
 
 
+def check_cache_epoch(cache_epoch: Optional[int], countries: List[str]):
+    """
+    Refuse (409) un Apply dont la preview a été calculée sur une époque du cache
+    où les prix d'un des marchés concernés ont changé depuis.
+    Une époque dépassée uniquement par d'autres marchés reste valide.
+    """
+    if cache_epoch is None:
+        return
+    
+    snapshot = price_cache.snapshot()
+    if cache_epoch == snapshot.epoch:
+        return
+    
+    markets = list(snapshot.markets) if "all" in countries else countries
+    changed = snapshot.changed_markets(cache_epoch, markets)
+    if cache_epoch > snapshot.epoch:
+        changed = markets
+    
+    if changed:
+        raise HTTPException(status_code=409, detail={
+            "message": "Les prix ont changé depuis la preview, relancer la preview",
+            "preview_epoch": cache_epoch,
+            "current_epoch": snapshot.epoch,
+            "changed_markets": changed
+        })
+
+
+def market_rules(market_name: str) -> dict:
+    """Règles affichées dans /config pour un marché (alias résolus)"""
+    plan = pricing_rules.plan(market_name)
+    if not plan.configured:
+        return {"ending": 0.99, "vat": 0, "exchange_rate": 1, "adjustment": "none"}
+    return {
+        "ending": plan.ending,
+        "vat": plan.vat,
+        "exchange_rate": plan.exchange_rate,
+        "adjustment": plan.adjustment
+    }
+
+
 def log_operation(operation_type: str, details: dict):
     pricing_history.append({
         "id": len(pricing_history) + 1,
@@ -274,17 +178,12 @@ async def get_pricing_config():
     if price_cache.is_loaded:
         print("CONFIG: Using cache for markets list")
         countries = []
-        for market_name, market_data in price_cache._cache.items():
-            currency = market_data.get("currency", "EUR")
-            config = COUNTRIES.get(market_name, {})
+        for market in price_cache.snapshot().markets_summary():
             countries.append({
-                "name": market_name,
-                "currency": currency,
-                "ending": config.get("ending", 0.99),
-                "vat": config.get("vat", 0),
-                "exchange_rate": config.get("exchange_rate", 1),
-                "adjustment": config.get("adjustment", "none"),
-                "prices_count": len(market_data.get("prices", {}))
+                "name": market["name"],
+                "currency": market["currency"],
+                **market_rules(market["name"]),
+                "prices_count": market["prices_count"]
             })
         countries.sort(key=lambda x: x["name"])
         return {"countries": countries, "source": "cache"}
@@ -300,14 +199,10 @@ async def get_pricing_config():
             market_name = market["name"]
             price_list = market.get("priceList")
             currency = price_list["currency"] if price_list else "EUR"
-            config = COUNTRIES.get(market_name, {})
             countries.append({
                 "name": market_name,
                 "currency": currency,
-                "ending": config.get("ending", 0.99),
-                "vat": config.get("vat", 0),
-                "exchange_rate": config.get("exchange_rate", 1),
-                "adjustment": config.get("adjustment", "none")
+                **market_rules(market_name)
             })
         countries.sort(key=lambda x: x["name"])
         print(f"CONFIG: Returning {len(countries)} countries from Shopify")
@@ -342,9 +237,8 @@ async def update_exchange_rates(update: ExchangeRatesUpdate):
     errors = []
     
     for country, rate in update.rates.items():
-        if country in COUNTRIES:
-            old_rate = COUNTRIES[country]["exchange_rate"]
-            COUNTRIES[country]["exchange_rate"] = rate
+        old_rate = pricing_rules.plan(country).exchange_rate
+        if pricing_rules.update_market(country, exchange_rate=rate):
             updated.append({"country": country, "old": old_rate, "new": rate})
         else:
             errors.append(f"Country '{country}' not found")
@@ -384,171 +278,241 @@ async def calculate_price(request: SingleProductPricingRequest):
     }
 
 
-@router.post("/preview")
-async def preview_pricing(request: PricingPreviewRequest):
+# ========================================
+# PREVIEW : PRÉPARATION + LIGNES EN FLUX
+# ========================================
+
+# Variantes calculées par passe du noyau (borne la mémoire des lignes en cours)
+PREVIEW_CHUNK_SIZE = 2000
+
+# Taille de page par défaut des previews JSON (affichage UI)
+PREVIEW_PAGE_SIZE = 1000
+PROMO_PAGE_SIZE = 500
+
+
+def paginate_rows(rows: Iterator[dict], offset: int, limit: int) -> Tuple[List[dict], int]:
+    """Parcourt toutes les lignes, ne garde que la page demandée ; retourne (page, total)"""
+    page = []
+    total = 0
+    for row in rows:
+        if offset <= total < offset + limit:
+            page.append(row)
+        total += 1
+    return page, total
+
+
+def page_info(offset: int, limit: int, returned: int, total: int) -> dict:
+    return {
+        "offset": offset,
+        "limit": limit,
+        "returned": returned,
+        "has_more": offset + returned < total
+    }
+
+
+def ndjson_lines(rows: Iterator[dict], summary: dict, total_key: str) -> Iterator[str]:
+    """Une ligne JSON par ligne de preview, puis {"summary": ...} avec le total"""
+    total = 0
+    for row in rows:
+        total += 1
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+    yield json.dumps({"summary": {**summary, total_key: total}}, ensure_ascii=False) + "\n"
+
+
+def group_updates(rows: Iterator[dict]) -> Dict[str, List[dict]]:
+    """Lignes de preview → mises à jour Shopify groupées par pays/marché"""
+    updates_by_country = {}
+    for item in rows:
+        country = item["country"]
+        if country not in updates_by_country:
+            updates_by_country[country] = []
+        updates_by_country[country].append({
+            "variant_id": item["variant_id"],
+            "price": item["new_price"],
+            "compare_at_price": item["compare_at_price"]
+        })
+    return updates_by_country
+
+
+def variant_row(product: dict, variant: dict) -> dict:
+    variant_id = variant.get("id")
+    return {
+        "variant_id": variant_id,
+        "variant_key": variant_key(variant_id) if variant_id else None,
+        "sku": variant.get("sku", ""),
+        "title": f"{product['title']} - {variant['title']}",
+        "product_title": product['title'],
+        "variant_title": variant['title'],
+        "base_price": float(variant["price"]) if variant.get("price") else 0
+    }
+
+
+async def prepare_pricing_preview(request: PricingPreviewRequest) -> dict:
     """
-    Prévisualise les changements de prix
-    V3: Calcul basé sur prix ACTUEL du marché
+    Partie asynchrone de la preview : variantes, prix actuels par marché
+    (cache puis API) et résumé. Les lignes sont produites ensuite par
+    iter_pricing_preview.
     """
-    try:
-        countries = get_all_countries() if "all" in request.countries else request.countries
-        
-        # ========================================
-        # 1. RÉCUPÉRER LES PRODUITS
-        # ========================================
-        variants_data = []
-        
-        if request.all_products:
-            # Récupérer TOUS les produits
-            products = await shopify_service.get_all_products(max_products=2000)
-            
-            for product in products:
-                for variant in product["variants"]:
-                    variant_id = variant.get("id")
-                    
-                    if request.variant_ids and variant_id not in request.variant_ids:
-                        continue
-                    
-                    variants_data.append({
-                        "variant_id": variant_id,
-                        "sku": variant.get("sku", ""),
-                        "title": f"{product['title']} - {variant['title']}",
-                        "product_title": product['title'],
-                        "variant_title": variant['title'],
-                        "base_price": float(variant["price"]) if variant.get("price") else 0
-                    })
-                    
-        elif request.product_ids:
-            # Produits spécifiques
-            for pid in request.product_ids:
+    # Une seule époque du cache pour toute la preview
+    snapshot = price_cache.snapshot()
+    countries = get_all_countries() if "all" in request.countries else request.countries
+    
+    # ========================================
+    # 1. RÉCUPÉRER LES PRODUITS (catalogue local)
+    # ========================================
+    if request.all_products:
+        # TOUS les produits, sans plafond
+        products = await product_catalog.get_products(shopify_service)
+    elif request.product_ids:
+        # Produits spécifiques (API si absent du catalogue : produit tout juste créé)
+        products = []
+        for pid in request.product_ids:
+            product = await product_catalog.get_product(shopify_service, pid)
+            if product is None:
                 product = await shopify_service.get_product_by_id(pid)
-                if product:
-                    for variant in product["variants"]:
-                        variant_id = variant.get("id")
-                        
-                        if request.variant_ids and variant_id not in request.variant_ids:
-                            continue
-                        
-                        variants_data.append({
-                            "variant_id": variant_id,
-                            "sku": variant.get("sku", ""),
-                            "title": f"{product['title']} - {variant['title']}",
-                            "product_title": product['title'],
-                            "variant_title": variant['title'],
-                            "base_price": float(variant["price"]) if variant.get("price") else 0
-                        })
-        else:
-            # Recherche (limité à 250)
-            raw_products = await shopify_service.search_products("", 250)
-            for product in raw_products:
-                for variant in product["variants"]:
-                    variant_id = variant.get("id")
-                    
-                    if request.variant_ids and variant_id not in request.variant_ids:
-                        continue
-                    
-                    variants_data.append({
-                        "variant_id": variant_id,
-                        "sku": variant.get("sku", ""),
-                        "title": f"{product['title']} - {variant['title']}",
-                        "product_title": product['title'],
-                        "variant_title": variant['title'],
-                        "base_price": float(variant["price"]) if variant.get("price") else 0
-                    })
-        
-        if not variants_data:
-            return {
-                "summary": {"total_products": 0, "total_countries": 0, "total_updates": 0},
-                "preview": []
-            }
-        
-        # ========================================
-        # 2. RÉCUPÉRER LES PRIX ACTUELS PAR MARCHÉ
-        # ========================================
-        all_variant_ids = [v["variant_id"] for v in variants_data if v["variant_id"]]
+            if product:
+                products.append(product)
+    else:
+        # Premiers produits du catalogue (limité à 250)
+        products = await product_catalog.search(shopify_service, "", 250)
+    
+    # Filtre et index en clés entières (GID ou ID numérique acceptés)
+    wanted_keys = variant_key_set(request.variant_ids)
+    variants_data = []
+    for product in products:
+        for variant in product["variants"]:
+            row = variant_row(product, variant)
+            if wanted_keys and row["variant_key"] not in wanted_keys:
+                continue
+            variants_data.append(row)
+    
+    # ========================================
+    # 2. RÉCUPÉRER LES PRIX ACTUELS PAR MARCHÉ
+    # ========================================
+    # Bloc variantes × marchés (ligne i = variants_data[i]) en unités mineures
+    market_prices = PriceBlock.missing(len(variants_data), [], [])
+    cache_used = False
+    markets_from_cache = []
+    markets_from_api = []
+    market_prices_error = None
+    
+    if variants_data and request.use_market_price:
+        # Essayer d'abord le cache : chaque marché déjà chargé est servi
+        # depuis le cache, même pendant un chargement en cours
+        markets_from_cache = snapshot.ready_markets(countries)
+        markets_from_api = [c for c in countries if c not in markets_from_cache]
         
-        market_prices = {}
-        cache_used = False
+        if markets_from_cache:
+            # Utiliser le cache (instantané!)
+            market_prices = snapshot.gather([v["variant_key"] for v in variants_data], markets_from_cache)
+            cache_used = True
+            print(f"Using cache: found prices for {market_prices.markets_with_prices()} markets")
         
-        if request.use_market_price:
-            # Essayer d'abord le cache
-            from app.services.price_cache import price_cache
-            
-            if price_cache.is_loaded:
-                # Utiliser le cache (instantané!)
-                market_prices = price_cache.get_prices_for_variants(
-                    variant_ids=all_variant_ids,
-                    market_names=countries
+        if markets_from_api:
+            # Fallback: requêtes API (lent) pour les marchés pas encore chargés
+            print(f"Markets not in cache, fetching from API: {markets_from_api}")
+            try:
+                api_prices = await shopify_service.get_variant_prices_by_market(
+                    variant_ids=[v["variant_id"] for v in variants_data if v["variant_id"]],
+                    market_names=markets_from_api
                 )
-                cache_used = True
-                print(f"Using cache: found prices for {len(market_prices)} markets")
-            else:
-                # Fallback: requêtes API (lent)
-                print("Cache not loaded, fetching from API...")
-                try:
-                    market_prices = await shopify_service.get_variant_prices_by_market(
-                        variant_ids=all_variant_ids,
-                        market_names=countries
-                    )
-                except Exception as e:
-                    print(f"Warning: Could not fetch market prices: {e}")
+                market_prices = market_prices.merge(
+                    PriceBlock.from_markets([v["variant_key"] for v in variants_data], api_prices)
+                )
+            except Exception as e:
+                # Signalé dans le résumé : les marchés concernés n'ont aucun prix actuel
+                print(f"Warning: Could not fetch market prices: {e}")
+                market_prices_error = str(e)
+    
+    if not variants_data:
+        summary = {"total_products": 0, "total_countries": 0, "cache_epoch": snapshot.epoch}
+    else:
+        summary = {
+            "total_products": len(variants_data),
+            "total_countries": len(countries),
+            "markets_with_prices": market_prices.markets_with_prices(),
+            "cache_used": cache_used,
+            "markets_from_cache": markets_from_cache,
+            "markets_from_api": markets_from_api,
+            "market_prices_error": market_prices_error,
+            "cache_epoch": snapshot.epoch
+        }
+    
+    return {
+        "countries": countries,
+        "variants": variants_data,
+        "market_prices": market_prices,
+        "summary": summary
+    }
+
+
+def iter_pricing_preview(context: dict, request: PricingPreviewRequest) -> Iterator[dict]:
+    """
+    Lignes de preview (variante × pays), dans l'ordre des variantes.
+    Le noyau tourne par tranches de PREVIEW_CHUNK_SIZE variantes : seules les
+    lignes de la tranche en cours sont matérialisées.
+    """
+    countries = context["countries"]
+    variants_data = context["variants"]
+    market_prices = context["market_prices"]
+    
+    # Colonnes du bloc alignées sur countries (None = pas de prix marché)
+    columns = [market_prices.columns.get(country) for country in countries]
+    current_currencies = [
+        # Devise du marché, sinon celle de la config
+        (market_prices.currencies[column] if column is not None else None)
+        or pricing_rules.plan(country).currency or "EUR"
+        for country, column in zip(countries, columns)
+    ]
+    endings = [vector_ending(country) for country in countries]
+    operation = PricingOperation(
+        base_adjustment=request.base_adjustment,
+        apply_vat=request.apply_vat,
+        compare_at_markup=request.discount
+    )
+    
+    for start in range(0, len(variants_data), PREVIEW_CHUNK_SIZE):
+        chunk = variants_data[start:start + PREVIEW_CHUNK_SIZE]
         
-        # ========================================
-        # 3. CALCULER LES NOUVEAUX PRIX
-        # ========================================
-        preview = []
+        # Prix actuels de la tranche alignés sur countries
+        current_minor = np.full((len(chunk), len(countries)), MISSING, dtype=np.int64)
+        compare_minor = current_minor.copy()
+        for j, column in enumerate(columns):
+            if column is not None:
+                current_minor[:, j] = market_prices.price[start:start + len(chunk), column]
+                compare_minor[:, j] = market_prices.compare_at[start:start + len(chunk), column]
         
-        for variant in variants_data:
-            variant_id = variant["variant_id"]
-            
-            for country in countries:
-                config = COUNTRIES.get(country, {})
-                currency = config.get("currency", "EUR")
-                
+        # *** MODE PRIX MARCHÉ: toute la tranche calculée en une fois (noyau vectorisé) ***
+        new_rows, compare_at_rows, discount_rows = market_price_block(
+            current_minor / 100,
+            endings,
+            request.base_adjustment,
+            request.discount
+        )
+        new_rows, compare_at_rows, discount_rows = new_rows.tolist(), compare_at_rows.tolist(), discount_rows.tolist()
+        present_rows = (current_minor != MISSING).tolist()
+        current_rows = (current_minor / 100).tolist()
+        compare_present_rows = (compare_minor != MISSING).tolist()
+        compare_rows = (compare_minor / 100).tolist()
+        
+        for i, variant in enumerate(chunk):
+            for j, country in enumerate(countries):
                 # Récupérer le prix actuel du marché
-                current_price = None
-                current_compare_at = None
-                current_currency = currency
-                
-                if country in market_prices:
-                    market_data = market_prices[country]
-                    current_currency = market_data.get("currency", currency)
-                    
-                    prices = market_data.get("prices", {})
-                    if variant_id in prices:
-                        price_info = prices[variant_id]
-                        current_price = float(price_info.get("price", 0)) if price_info.get("price") else None
-                        current_compare_at = float(price_info.get("compareAtPrice", 0)) if price_info.get("compareAtPrice") else None
+                current_price = current_rows[i][j] if present_rows[i][j] else None
+                current_compare_at = compare_rows[i][j] if compare_present_rows[i][j] else None
+                current_currency = current_currencies[j]
                 
                 # ========================================
                 # CALCUL DU NOUVEAU PRIX
                 # ========================================
                 if request.use_market_price and current_price is not None:
-                    # *** MODE PRIX MARCHÉ: Appliquer % sur prix actuel ***
-                    raw_price = current_price * (1 + request.base_adjustment)
-                    new_price = apply_psychological_ending(raw_price, country)
-                    
-                    # Compare At basé sur nouveau prix + discount
-                    if request.discount > 0:
-                        raw_compare_at = calculate_compare_at(new_price, request.discount)
-                        compare_at_price = apply_psychological_ending(raw_compare_at, country)
-                    else:
-                        compare_at_price = new_price
+                    # Résultat du noyau pour cette cellule
+                    new_price = new_rows[i][j]
+                    compare_at_price = compare_at_rows[i][j]
+                    discount_percentage = discount_rows[i][j]
                     
-                    # Calculer le vrai % de réduction
-                    if compare_at_price > new_price:
-                        discount_percentage = round((1 - new_price / compare_at_price) * 100)
-                    else:
-                        discount_percentage = 0
-                        
                 else:
                     # *** MODE FALLBACK: Utiliser pricing_engine (conversion EUR) ***
-                    operation = PricingOperation(
-                        base_adjustment=request.base_adjustment,
-                        apply_vat=request.apply_vat,
-                        compare_at_markup=request.discount
-                    )
-                    
                     calc = pricing_engine.calculate_price(variant["base_price"], country, operation)
                     
                     if calc:
@@ -559,12 +523,12 @@ async def preview_pricing(request: PricingPreviewRequest):
                     else:
                         continue
                 
-                preview.append({
+                yield {
                     "sku": variant["sku"],
                     "title": variant["title"],
                     "product_title": variant["product_title"],
                     "variant_title": variant["variant_title"],
-                    "variant_id": variant_id,
+                    "variant_id": variant["variant_id"],
                     "country": country,
                     "currency": current_currency,
                     # Prix actuels
@@ -576,17 +540,29 @@ async def preview_pricing(request: PricingPreviewRequest):
                     "discount_percentage": discount_percentage,
                     # Référence
                     "base_price_eur": variant["base_price"]
-                })
+                }
+
+
+@router.post("/preview")
+async def preview_pricing(
+    request: PricingPreviewRequest,
+    offset: int = Query(0, ge=0, description="Première ligne de la page"),
+    limit: int = Query(PREVIEW_PAGE_SIZE, ge=1, le=10000, description="Lignes par page")
+):
+    """
+    Prévisualise les changements de prix
+    V3: Calcul basé sur prix ACTUEL du marché
+    Toutes les lignes sont calculées (total_updates = total réel) ; seule la
+    page [offset, offset + limit) est renvoyée. Preview complète : /preview/stream
+    """
+    try:
+        context = await prepare_pricing_preview(request)
+        page, total = paginate_rows(iter_pricing_preview(context, request), offset, limit)
         
         return {
-            "summary": {
-                "total_products": len(variants_data),
-                "total_countries": len(countries),
-                "total_updates": len(preview),
-                "markets_with_prices": len(market_prices),
-                "cache_used": cache_used
-            },
-            "preview": preview[:1000]  # Limite à 1000 pour l'affichage
+            "summary": {**context["summary"], "total_updates": total},
+            "page": page_info(offset, limit, len(page), total),
+            "preview": page
         }
     
     except Exception as e:
@@ -595,6 +571,178 @@ async def preview_pricing(request: PricingPreviewRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/preview/stream")
+async def stream_preview_pricing(request: PricingPreviewRequest):
+    """
+    Preview complète en NDJSON : une ligne par changement de prix, sans limite,
+    puis une dernière ligne {"summary": {...}} avec total_updates
+    """
+    try:
+        context = await prepare_pricing_preview(request)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        ndjson_lines(iter_pricing_preview(context, request), context["summary"], "total_updates"),
+        media_type="application/x-ndjson"
+    )
+
+
+# ========================================
+# PREVIEWS STOCKÉES (preview_id)
+# ========================================
+
+def store_preview(kind: str, context: dict, rows: Iterator[dict], total_key: str) -> PreviewSession:
+    """Stocke toutes les lignes d'une preview sous un nouveau preview_id"""
+    session = PreviewSession(kind, context["summary"], context["countries"], context["summary"]["cache_epoch"])
+    for row in rows:
+        session.add(row)
+    session.seal()
+    session.summary = {**context["summary"], total_key: len(session)}
+    return preview_store.put(session)
+
+
+def load_preview(preview_id: str, kind: Optional[str] = None) -> PreviewSession:
+    session = preview_store.get(preview_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Preview expirée ou inconnue, relancer la preview")
+    if kind and session.kind != kind:
+        raise HTTPException(status_code=400, detail=f"La preview {preview_id} n'est pas de type {kind}")
+    return session
+
+
+def session_response(session: PreviewSession, indices: np.ndarray, offset: int, limit: int) -> dict:
+    page = list(session.rows(indices[offset:offset + limit]))
+    return {
+        **session.info(),
+        "summary": session.summary,
+        "total_matching": len(indices),
+        "page": page_info(offset, limit, len(page), len(indices)),
+        "preview": page
+    }
+
+
+@router.post("/preview/session")
+async def create_preview_session(
+    request: PricingPreviewRequest,
+    limit: int = Query(PREVIEW_PAGE_SIZE, ge=1, le=10000, description="Lignes de la première page")
+):
+    """
+    Calcule la preview complète et la stocke (TTL) : renvoie son preview_id et
+    la première page. Pages suivantes : GET /preview/session/{preview_id} ;
+    Apply : POST /apply avec preview_id.
+    """
+    try:
+        context = await prepare_pricing_preview(request)
+        session = store_preview("pricing", context, iter_pricing_preview(context, request), "total_updates")
+        return session_response(session, session.select(), 0, limit)
+    
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/preview/session/{preview_id}")
+async def get_preview_session(
+    preview_id: str,
+    offset: int = Query(0, ge=0, description="Première ligne de la page"),
+    limit: int = Query(PREVIEW_PAGE_SIZE, ge=1, le=10000, description="Lignes par page"),
+    sort: str = Query("row", description=f"Tri : {', '.join(SORT_FIELDS)}"),
+    descending: bool = Query(False, description="Tri décroissant"),
+    markets: Optional[List[str]] = Query(None, description="Marchés à garder"),
+    sku: Optional[str] = Query(None, description="SKU contenant ce texte"),
+    min_delta_pct: Optional[float] = Query(None, description="Écart prix actuel → nouveau prix minimum (%)"),
+    max_delta_pct: Optional[float] = Query(None, description="Écart prix actuel → nouveau prix maximum (%)")
+):
+    """Page d'une preview stockée (pricing ou promo), triée et filtrée"""
+    if sort not in SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Tri inconnu: {sort} ({', '.join(SORT_FIELDS)})")
+    
+    session = load_preview(preview_id)
+    indices = session.select(
+        markets=markets,
+        sku=sku,
+        min_delta_pct=min_delta_pct,
+        max_delta_pct=max_delta_pct,
+        sort=sort,
+        descending=descending
+    )
+    return session_response(session, indices, offset, limit)
+
+
+@router.delete("/preview/session/{preview_id}")
+async def delete_preview_session(preview_id: str):
+    """Libère une preview stockée"""
+    if not preview_store.discard(preview_id):
+        raise HTTPException(status_code=404, detail="Preview expirée ou inconnue")
+    return {"deleted": preview_id}
+
+
+@router.get("/preview/sessions")
+async def get_preview_sessions_status():
+    """Nombre de previews stockées, lignes en mémoire, TTL"""
+    return preview_store.get_status()
+
+
+async def push_market_updates(updates_by_country: Dict[str, List[dict]]) -> Tuple[dict, List[dict]]:
+    """
+    Envoie les mises à jour de tous les marchés (lots en parallèle, concurrence
+    adaptative) ; chaque marché terminé est reporté dans apply_progress.
+    Retourne (résultats, mises à jour du cache pour les marchés réussis).
+    """
+    results = {"success": [], "errors": [], "updated_count": 0}
+    cache_updates = []  # Pour mettre à jour le cache
+    apply_progress["markets"] = {}
+    
+    def market_done(country: str, update_result: dict):
+        updates = updates_by_country[country]
+        apply_progress["current_market"] = country
+        apply_progress["markets_done"] += 1
+        apply_progress["markets"][country] = {
+            "success": bool(update_result.get("success")),
+            "updated": update_result.get("updated", 0),
+            "errors": len(update_result.get("errors", [])) + (1 if update_result.get("error") else 0)
+        }
+        
+        if update_result.get("success"):
+            updated_count = update_result.get("updated", len(updates))
+            results["success"].append({
+                "country": country,
+                "updated": updated_count
+            })
+            results["updated_count"] += updated_count
+            apply_progress["variants_updated"] += updated_count
+            
+            # Préparer les mises à jour du cache
+            for update in updates:
+                cache_updates.append({
+                    "market": country,
+                    "variant_id": update["variant_id"],
+                    "price": update["price"],
+                    "compare_at_price": update["compare_at_price"]
+                })
+        else:
+            errors = [update_result["error"]] if update_result.get("error") else []
+            errors += update_result.get("errors", [])
+            for err in errors:
+                results["errors"].append(f"{country}: {err}")
+                apply_progress["errors"].append(f"{country}: {err}")
+    
+    try:
+        bulk = await shopify_service.bulk_update_markets(updates_by_country, on_market_done=market_done)
+        results["concurrency"] = bulk["concurrency"]
+    except Exception as e:
+        # Échec global (liste des marchés) : tous les marchés pas encore terminés en erreur
+        for country in updates_by_country:
+            if country not in apply_progress["markets"]:
+                market_done(country, {"success": False, "error": str(e)})
+    
+    return results, cache_updates
+
+
 @router.post("/apply")
 async def apply_pricing(request: PricingApplyRequest):
     """
@@ -603,96 +751,65 @@ async def apply_pricing(request: PricingApplyRequest):
     """
     global apply_progress
     
+    session = load_preview(request.preview_id, "pricing") if request.preview_id else None
+    countries = session.countries if session else request.countries
+    if not countries:
+        raise HTTPException(status_code=400, detail="countries ou preview_id requis")
+    
+    # Preview calculée sur des prix qui ont changé depuis : refuser
+    check_cache_epoch(session.cache_epoch if session else request.cache_epoch, countries)
+    
     try:
         # Initialiser la progression
         apply_progress = {
             "active": True,
             "current_market": "Préparation...",
             "markets_done": 0,
-            "total_markets": len(request.countries),
+            "total_markets": len(countries),
             "variants_updated": 0,
             "errors": []
         }
         
-        # Générer la preview pour avoir les prix calculés
-        preview_request = PricingPreviewRequest(
-            countries=request.countries,
-            product_ids=request.product_ids,
-            variant_ids=request.variant_ids,
-            all_products=request.all_products,
-            base_adjustment=request.base_adjustment,
-            apply_vat=request.apply_vat,
-            discount=request.discount,
-            use_market_price=request.use_market_price
-        )
-        
-        preview_result = await preview_pricing(preview_request)
-        preview_data = preview_result["preview"]
+        if session:
+            # Preview stockée : lignes poussées telles quelles, sans recalcul
+            preview_rows = None
+        else:
+            # Générer la preview pour avoir les prix calculés
+            preview_request = PricingPreviewRequest(
+                countries=request.countries,
+                product_ids=request.product_ids,
+                variant_ids=request.variant_ids,
+                all_products=request.all_products,
+                base_adjustment=request.base_adjustment,
+                apply_vat=request.apply_vat,
+                discount=request.discount,
+                use_market_price=request.use_market_price
+            )
+            
+            # Toutes les lignes de la preview (pas seulement la page affichée)
+            context = await prepare_pricing_preview(preview_request)
+            preview_rows = iter_pricing_preview(context, preview_request)
         
         if request.dry_run:
             apply_progress["active"] = False
+            if session:
+                sample, total = list(session.rows(session.select()[:50])), len(session)
+            else:
+                sample, total = paginate_rows(preview_rows, 0, 50)
             return {
                 "applied": False,
                 "dry_run": True,
-                "would_update": len(preview_data),
-                "preview": preview_data[:50]
+                "would_update": total,
+                "preview": sample
             }
         
         # Grouper les mises à jour par pays/marché
-        updates_by_country = {}
-        for item in preview_data:
-            country = item["country"]
-            if country not in updates_by_country:
-                updates_by_country[country] = []
-            updates_by_country[country].append({
-                "variant_id": item["variant_id"],
-                "price": item["new_price"],
-                "compare_at_price": item["compare_at_price"]
-            })
+        updates_by_country = session.updates_by_country() if session else group_updates(preview_rows)
         
         apply_progress["total_markets"] = len(updates_by_country)
         
-        results = {"success": [], "errors": [], "updated_count": 0}
-        cache_updates = []  # Pour mettre à jour le cache
-        
-        for idx, (country, updates) in enumerate(updates_by_country.items()):
-            # Mettre à jour la progression
-            apply_progress["current_market"] = country
-            apply_progress["markets_done"] = idx
-            
-            try:
-                update_result = await shopify_service.bulk_update_prices(country, updates)
-                
-                if update_result.get("success"):
-                    updated_count = update_result.get("updated", len(updates))
-                    results["success"].append({
-                        "country": country,
-                        "updated": updated_count
-                    })
-                    results["updated_count"] += updated_count
-                    apply_progress["variants_updated"] += updated_count
-                    
-                    # Préparer les mises à jour du cache
-                    for update in updates:
-                        cache_updates.append({
-                            "market": country,
-                            "variant_id": update["variant_id"],
-                            "price": update["price"],
-                            "compare_at_price": update["compare_at_price"]
-                        })
-                else:
-                    error_msg = f"{country}: {update_result.get('error')}"
-                    results["errors"].append(error_msg)
-                    apply_progress["errors"].append(error_msg)
-                    if update_result.get("errors"):
-                        for err in update_result["errors"]:
-                            results["errors"].append(f"{country}: {err}")
-                            apply_progress["errors"].append(f"{country}: {err}")
-                            
-            except Exception as e:
-                error_msg = f"{country}: {str(e)}"
-                results["errors"].append(error_msg)
-                apply_progress["errors"].append(error_msg)
+        # Tous les marchés en parallèle, résultats reportés marché par marché
+        results, cache_updates = await push_market_updates(updates_by_country)
         
         # Mettre à jour le cache avec les nouveaux prix
         if cache_updates:
@@ -711,9 +828,14 @@ async def apply_pricing(request: PricingApplyRequest):
             "errors_count": len(results["errors"])
         })
         
+        # Preview consommée : ses prix actuels ne sont plus ceux de Shopify
+        if session:
+            preview_store.discard(session.preview_id)
+        
         return {
             "applied": True,
-            "results": results
+            "results": results,
+            "cache_epoch": price_cache.epoch
         }
     
     except Exception as e:
@@ -756,125 +878,220 @@ class RandomPromoRequest(BaseModel):
 
 class RandomPromoApplyRequest(RandomPromoRequest):
     """Paramètres pour appliquer les promos"""
+    countries: List[str] = []               # Ignoré si preview_id
     dry_run: bool = False
+    cache_epoch: Optional[int] = None       # Époque du cache renvoyée par la preview
+    preview_id: Optional[str] = None        # Preview stockée : ses lignes sont poussées telles quelles
 
 
-@router.post("/random-promo/preview")
-async def preview_random_promo(request: RandomPromoRequest):
+async def prepare_random_promo(request: RandomPromoRequest) -> dict:
     """
-    Génère une preview des promos aléatoires.
-    - Sélectionne X% des PRODUITS (pas variantes) aléatoirement
-    - Attribue une réduction aléatoire entre min et max à chaque produit
-    - Toutes les variantes d'un produit ont la même réduction
+    Tirage des produits en promo et de leur réduction, prix actuels du cache.
+    Les lignes sont produites ensuite par iter_random_promo.
     """
-    try:
-        # Initialiser le générateur aléatoire
-        if request.seed is not None:
-            random.seed(request.seed)
-        else:
-            random.seed()
-        
-        # Récupérer tous les produits avec leurs variantes
-        all_products = await shopify_service.get_all_products_with_variants()
-        
-        if not all_products:
-            raise HTTPException(status_code=404, detail="Aucun produit trouvé")
-        
-        total_products = len(all_products)
-        
-        # Calculer combien de produits mettre en promo
-        promo_count = int(total_products * (request.catalog_percentage / 100))
-        promo_count = max(1, min(promo_count, total_products))  # Au moins 1, max tous
-        
-        # Sélectionner aléatoirement les produits
-        selected_products = random.sample(all_products, promo_count)
-        
-        # Attribuer une réduction aléatoire à chaque produit
-        product_discounts = {}
-        for product in selected_products:
-            discount = random.uniform(request.min_discount, request.max_discount)
-            discount = round(discount, 0)  # Arrondir au %
-            product_discounts[product["id"]] = discount
-        
-        # Déterminer les marchés
-        if 'all' in request.countries:
-            countries = price_cache.get_all_markets()
-        else:
-            countries = request.countries
+    # Une seule époque du cache pour toute la preview
+    snapshot = price_cache.snapshot()
+    
+    # Initialiser le générateur aléatoire
+    if request.seed is not None:
+        random.seed(request.seed)
+    else:
+        random.seed()
+    
+    # Tous les produits avec leurs variantes (catalogue local, sans plafond)
+    all_products = await product_catalog.get_products(shopify_service)
+    
+    if not all_products:
+        raise HTTPException(status_code=404, detail="Aucun produit trouvé")
+    
+    total_products = len(all_products)
+    
+    # Calculer combien de produits mettre en promo
+    promo_count = int(total_products * (request.catalog_percentage / 100))
+    promo_count = max(1, min(promo_count, total_products))  # Au moins 1, max tous
+    
+    # Sélectionner aléatoirement les produits
+    selected_products = random.sample(all_products, promo_count)
+    
+    # Attribuer une réduction aléatoire à chaque produit
+    product_discounts = {}
+    for product in selected_products:
+        discount = random.uniform(request.min_discount, request.max_discount)
+        discount = round(discount, 0)  # Arrondir au %
+        product_discounts[product["id"]] = discount
+    
+    # Déterminer les marchés
+    if 'all' in request.countries:
+        countries = list(snapshot.markets)
+    else:
+        countries = request.countries
+    
+    # Prix actuels du cache : un bloc variantes × marchés (ligne = variante)
+    selected_variants = [
+        (product, variant) for product in selected_products for variant in product.get("variants", [])
+    ]
+    block = snapshot.gather([variant_key(variant["id"]) for _, variant in selected_variants], countries)
+    
+    # Résumé par produit
+    products_summary = []
+    for product in selected_products:
+        products_summary.append({
+            "id": product["id"],
+            "title": product.get("title", ""),
+            "variants_count": len(product.get("variants", [])),
+            "discount": product_discounts[product["id"]]
+        })
+    
+    return {
+        "countries": countries,
+        "variants": selected_variants,
+        "discounts": product_discounts,
+        "block": block,
+        "products": products_summary,
+        "summary": {
+            "total_products_in_catalog": total_products,
+            "products_selected": promo_count,
+            "catalog_percentage": request.catalog_percentage,
+            "min_discount": request.min_discount,
+            "max_discount": request.max_discount,
+            "total_markets": len(countries),
+            "cache_epoch": snapshot.epoch
+        }
+    }
+
+
+def iter_random_promo(context: dict) -> Iterator[dict]:
+    """Lignes de promo (variante × pays), noyau par tranches de PREVIEW_CHUNK_SIZE variantes"""
+    countries = context["countries"]
+    selected_variants = context["variants"]
+    product_discounts = context["discounts"]
+    block = context["block"]
+    country_columns = [block.columns.get(country) for country in countries]
+    endings = [vector_ending(country) for country in block.markets]
+    
+    for start in range(0, len(selected_variants), PREVIEW_CHUNK_SIZE):
+        chunk = selected_variants[start:start + PREVIEW_CHUNK_SIZE]
         
-        # Générer la preview
-        preview_items = []
+        # Nouveaux prix de la tranche en une fois : prix actuel × (1 - réduction du produit)
+        reduction_factors = np.array([
+            1 - (product_discounts[product["id"]] / 100) for product, _ in chunk
+        ], dtype=np.float64)
+        current_block = block.price[start:start + len(chunk)] / 100
+        new_block = apply_endings(current_block * reduction_factors[:, None], endings)
+        present_rows = block.present[start:start + len(chunk)].tolist()
+        price_rows = current_block.tolist()
+        new_rows = new_block.tolist()
         
-        for product in selected_products:
+        for (product, variant), present, prices, new_prices in zip(chunk, present_rows, price_rows, new_rows):
             product_id = product["id"]
             discount_pct = product_discounts[product_id]
             
-            for variant in product.get("variants", []):
-                variant_id = variant["id"]
+            for country, column in zip(countries, country_columns):
+                # Récupérer le prix actuel du cache
+                if column is not None and present[column]:
+                    current_price = prices[column]
+                    currency = block.currencies[column]
+                else:
+                    continue  # Pas de prix pour ce marché
                 
-                for country in countries:
-                    # Récupérer le prix actuel du cache
-                    cached = price_cache.get_price(country, variant_id)
-                    
-                    if cached:
-                        current_price = float(cached.get("price", 0))
-                        currency = cached.get("currency", "EUR")
-                    else:
-                        continue  # Pas de prix pour ce marché
-                    
-                    if current_price <= 0:
-                        continue
-                    
-                    # Calculer le nouveau prix (prix actuel = nouveau compare_at, prix réduit = nouveau prix)
-                    compare_at_price = current_price  # L'ancien prix devient le compare_at
-                    reduction_factor = 1 - (discount_pct / 100)
-                    new_price_raw = current_price * reduction_factor
-                    
-                    # Appliquer la terminaison psychologique
-                    new_price = apply_psychological_ending(new_price_raw, country)
-                    
-                    # Formater
-                    new_price_str = format_price_for_country(new_price, country)
-                    compare_at_str = format_price_for_country(compare_at_price, country)
-                    
-                    preview_items.append({
-                        "product_id": product_id,
-                        "product_title": product.get("title", ""),
-                        "variant_id": variant_id,
-                        "variant_title": variant.get("title", ""),
-                        "sku": variant.get("sku", ""),
-                        "country": country,
-                        "currency": currency,
-                        "current_price": f"{current_price:.2f}",
-                        "new_price": new_price_str,
-                        "compare_at_price": compare_at_str,
-                        "discount_percentage": discount_pct
-                    })
-        
-        # Résumé par produit
-        products_summary = []
-        for product in selected_products:
-            products_summary.append({
-                "id": product["id"],
-                "title": product.get("title", ""),
-                "variants_count": len(product.get("variants", [])),
-                "discount": product_discounts[product["id"]]
-            })
+                if current_price <= 0:
+                    continue
+                
+                # Prix actuel = nouveau compare_at, prix réduit (terminaison appliquée par le noyau) = nouveau prix
+                compare_at_price = current_price  # L'ancien prix devient le compare_at
+                new_price = new_prices[column]
+                
+                # Formater
+                plan = pricing_rules.plan(country)
+                
+                yield {
+                    "product_id": product_id,
+                    "product_title": product.get("title", ""),
+                    "variant_id": variant["id"],
+                    "variant_title": variant.get("title", ""),
+                    "sku": variant.get("sku", ""),
+                    "country": country,
+                    "currency": currency,
+                    "current_price": f"{current_price:.2f}",
+                    "new_price": plan.format(new_price),
+                    "compare_at_price": plan.format(compare_at_price),
+                    "discount_percentage": discount_pct
+                }
+
+
+@router.post("/random-promo/preview")
+async def preview_random_promo(
+    request: RandomPromoRequest,
+    offset: int = Query(0, ge=0, description="Première ligne de la page"),
+    limit: int = Query(PROMO_PAGE_SIZE, ge=1, le=10000, description="Lignes par page")
+):
+    """
+    Génère une preview des promos aléatoires.
+    - Sélectionne X% des PRODUITS (pas variantes) aléatoirement
+    - Attribue une réduction aléatoire entre min et max à chaque produit
+    - Toutes les variantes d'un produit ont la même réduction
+    total_price_changes compte toutes les lignes ; seule la page est renvoyée.
+    Preview complète : /random-promo/preview/stream
+    """
+    try:
+        context = await prepare_random_promo(request)
+        page, total = paginate_rows(iter_random_promo(context), offset, limit)
         
         return {
-            "summary": {
-                "total_products_in_catalog": total_products,
-                "products_selected": promo_count,
-                "catalog_percentage": request.catalog_percentage,
-                "min_discount": request.min_discount,
-                "max_discount": request.max_discount,
-                "total_markets": len(countries),
-                "total_price_changes": len(preview_items)
-            },
-            "products": products_summary[:100],  # Limiter pour l'affichage
-            "preview": preview_items[:500]  # Limiter pour l'affichage
+            "summary": {**context["summary"], "total_price_changes": total},
+            "products": context["products"][:100],  # Limiter pour l'affichage
+            "page": page_info(offset, limit, len(page), total),
+            "preview": page
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/random-promo/preview/stream")
+async def stream_preview_random_promo(request: RandomPromoRequest):
+    """
+    Preview complète des promos en NDJSON : une ligne par changement de prix,
+    puis une dernière ligne {"summary": {...}} avec total_price_changes
+    """
+    try:
+        context = await prepare_random_promo(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return StreamingResponse(
+        ndjson_lines(iter_random_promo(context), context["summary"], "total_price_changes"),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.post("/random-promo/preview/session")
+async def create_random_promo_session(
+    request: RandomPromoRequest,
+    limit: int = Query(PROMO_PAGE_SIZE, ge=1, le=10000, description="Lignes de la première page")
+):
+    """
+    Tire les promos, stocke la preview complète (TTL) et renvoie son preview_id.
+    L'Apply avec ce preview_id pousse exactement ces promos, sans nouveau tirage.
+    """
+    try:
+        context = await prepare_random_promo(request)
+        session = store_preview("random_promo", context, iter_random_promo(context), "total_price_changes")
+        return {
+            **session_response(session, session.select(), 0, limit),
+            "products": context["products"][:100]  # Limiter pour l'affichage
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -889,25 +1106,41 @@ async def apply_random_promo(request: RandomPromoApplyRequest):
     """
     global apply_progress
     
+    session = load_preview(request.preview_id, "random_promo") if request.preview_id else None
+    countries = session.countries if session else request.countries
+    if not countries:
+        raise HTTPException(status_code=400, detail="countries ou preview_id requis")
+    
+    # Preview calculée sur des prix qui ont changé depuis : refuser
+    check_cache_epoch(session.cache_epoch if session else request.cache_epoch, countries)
+    
     try:
-        # Générer la même preview (avec le même seed si fourni)
-        preview_request = RandomPromoRequest(
-            countries=request.countries,
-            catalog_percentage=request.catalog_percentage,
-            min_discount=request.min_discount,
-            max_discount=request.max_discount,
-            seed=request.seed
-        )
-        
-        preview_result = await preview_random_promo(preview_request)
-        preview_data = preview_result["preview"]
+        if session:
+            # Preview stockée : mêmes produits et réductions, sans nouveau tirage
+            preview_rows = None
+            summary = session.summary
+        else:
+            # Générer la même preview (avec le même seed si fourni)
+            preview_request = RandomPromoRequest(
+                countries=request.countries,
+                catalog_percentage=request.catalog_percentage,
+                min_discount=request.min_discount,
+                max_discount=request.max_discount,
+                seed=request.seed
+            )
+            
+            # Toutes les lignes de la preview (pas seulement la page affichée)
+            context = await prepare_random_promo(preview_request)
+            preview_rows = iter_random_promo(context)
+            summary = context["summary"]
         
         if request.dry_run:
+            total = len(session) if session else paginate_rows(preview_rows, 0, 0)[1]
             return {
                 "applied": False,
                 "dry_run": True,
-                "would_update": len(preview_data),
-                "summary": preview_result["summary"]
+                "would_update": total,
+                "summary": {**summary, "total_price_changes": total}
             }
         
         # Initialiser la progression
@@ -921,55 +1154,12 @@ async def apply_random_promo(request: RandomPromoApplyRequest):
         }
         
         # Grouper par pays
-        updates_by_country = {}
-        for item in preview_data:
-            country = item["country"]
-            if country not in updates_by_country:
-                updates_by_country[country] = []
-            updates_by_country[country].append({
-                "variant_id": item["variant_id"],
-                "price": item["new_price"],
-                "compare_at_price": item["compare_at_price"]
-            })
+        updates_by_country = session.updates_by_country() if session else group_updates(preview_rows)
         
         apply_progress["total_markets"] = len(updates_by_country)
         
-        results = {"success": [], "errors": [], "updated_count": 0}
-        cache_updates = []
-        
-        for idx, (country, updates) in enumerate(updates_by_country.items()):
-            apply_progress["current_market"] = country
-            apply_progress["markets_done"] = idx
-            
-            try:
-                update_result = await shopify_service.bulk_update_prices(country, updates)
-                
-                if update_result.get("success"):
-                    updated_count = update_result.get("updated", len(updates))
-                    results["success"].append({
-                        "country": country,
-                        "updated": updated_count
-                    })
-                    results["updated_count"] += updated_count
-                    apply_progress["variants_updated"] += updated_count
-                    
-                    # Préparer les mises à jour du cache
-                    for update in updates:
-                        cache_updates.append({
-                            "market": country,
-                            "variant_id": update["variant_id"],
-                            "price": update["price"],
-                            "compare_at_price": update["compare_at_price"]
-                        })
-                else:
-                    error_msg = f"{country}: {update_result.get('error')}"
-                    results["errors"].append(error_msg)
-                    apply_progress["errors"].append(error_msg)
-                    
-            except Exception as e:
-                error_msg = f"{country}: {str(e)}"
-                results["errors"].append(error_msg)
-                apply_progress["errors"].append(error_msg)
+        # Tous les marchés en parallèle, résultats reportés marché par marché
+        results, cache_updates = await push_market_updates(updates_by_country)
         
         # Mettre à jour le cache
         if cache_updates:
@@ -982,17 +1172,24 @@ async def apply_random_promo(request: RandomPromoApplyRequest):
         apply_progress["active"] = False
         
         log_operation("random_promo_apply", {
-            "products_count": preview_result["summary"]["products_selected"],
-            "catalog_percentage": request.catalog_percentage,
-            "discount_range": f"{request.min_discount}%-{request.max_discount}%",
+            "products_count": summary["products_selected"],
+            "catalog_percentage": summary["catalog_percentage"],
+            "discount_range": f"{summary['min_discount']}%-{summary['max_discount']}%",
             "total_updates": results["updated_count"],
             "errors_count": len(results["errors"])
         })
         
+        if session:
+            preview_store.discard(session.preview_id)
+        
         return {
             "applied": True,
-            "summary": preview_result["summary"],
-            "results": results
+            "summary": {
+                **summary,
+                "total_price_changes": sum(len(updates) for updates in updates_by_country.values())
+            },
+            "results": results,
+            "cache_epoch": price_cache.epoch
         }
     
     except Exception as e:
@@ -3,6 +3,8 @@ Router pour la gestion des produits Shopify
 """
 from fastapi import APIRouter, HTTPException, Query
 from app.services.shopify import shopify_service
+from app.services.product_catalog import product_catalog
+from app.services.variant_ids import variant_gid
 from typing import List, Optional
 
 router = APIRouter(tags=["products"])
@@ -14,10 +16,10 @@ async def get_products(
     limit: int = Query(50, ge=1, le=250, description="Nombre de produits à retourner")
 ):
     """
-    Recherche des produits
+    Recherche des produits (catalogue local : titre, handle ou SKU contenant chaque mot)
     """
     try:
-        products = await shopify_service.search_products(search or "", limit)
+        products = await product_catalog.search(shopify_service, search or "", limit)
         
         # Formatter pour le frontend
         formatted = []
@@ -52,6 +54,26 @@ async def get_products(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/catalog/status")
+async def get_catalog_status():
+    """
+    État du catalogue local (produits, variantes, dernières synchronisations)
+    """
+    return product_catalog.get_status()
+
+
+@router.post("/catalog/sync")
+async def sync_catalog(full: bool = Query(False, description="Synchronisation complète (détecte les suppressions)")):
+    """
+    Synchronise le catalogue local avec Shopify (incrémentale par défaut)
+    """
+    try:
+        changes = await product_catalog.sync(shopify_service, full=full)
+        return {"success": True, "changes": changes, "status": product_catalog.get_status()}
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Synchronisation du catalogue échouée: {e}")
+
+
 @router.get("/prices-by-market")
 async def get_prices_by_market(
     variant_ids: str = Query(..., description="IDs des variantes séparés par des virgules"),
@@ -71,12 +93,10 @@ async def get_prices_by_market(
             raise HTTPException(status_code=400, detail="Au moins un variant_id est requis")
         
         # Convertir en GIDs si nécessaire
-        gid_list = []
-        for vid in variant_id_list:
-            if vid.startswith("gid://"):
-                gid_list.append(vid)
-            else:
-                gid_list.append(f"gid://shopify/ProductVariant/{vid}")
+        try:
+            gid_list = [variant_gid(vid) for vid in variant_id_list]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="variant_id invalide")
         
         # Récupérer les prix par marché
         prices_by_market = await shopify_service.get_variant_prices_by_market(gid_list)
@@ -170,26 +190,23 @@ async def get_product_market_prices(product_id: str):
 @router.get("/by-sku/{sku}")
 async def get_product_by_sku(sku: str):
     """
-    Recherche un produit par SKU
+    Recherche un produit par SKU (catalogue local)
     """
     try:
-        products = await shopify_service.search_products(f"sku:{sku}", 10)
-        
-        # Trouver le produit avec le bon SKU
-        for product in products:
-            for variant in product["variants"]:
-                if variant["sku"] == sku:
-                    return {
-                        "found": True,
-                        "product": {
-                            "id": product["id"],
-                            "title": product["title"],
-                            "handle": product["handle"]
-                        },
-                        "variant": variant
-                    }
+        found = await product_catalog.find_sku(shopify_service, sku)
+        if found is None:
+            return {"found": False}
         
-        return {"found": False}
+        product, variant = found
+        return {
+            "found": True,
+            "product": {
+                "id": product["id"],
+                "title": product["title"],
+                "handle": product["handle"]
+            },
+            "variant": variant
+        }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
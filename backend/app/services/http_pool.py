@@ -0,0 +1,126 @@
+"""
+Pool de connexions HTTP partagé pour l'API Shopify
+Un seul httpx.AsyncClient par boutique : keep-alive + multiplexage HTTP/2
+"""
+
+import logging
+import os
+from typing import Dict
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Limites du pool (configurables via variables d'environnement)
+HTTP_MAX_CONNECTIONS = int(os.environ.get("SHOPIFY_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("SHOPIFY_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("SHOPIFY_HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.environ.get("SHOPIFY_HTTP_TIMEOUT", "60"))
+HTTP2_ENABLED = os.environ.get("SHOPIFY_HTTP2", "1") == "1"
+
+# HTTP/2 nécessite le paquet h2 (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HTTPPool:
+    """
+    Clients HTTP longue durée, un par boutique.
+    Ouvert dans le lifespan de l'app, fermé à l'arrêt.
+    Compte les connexions ouvertes pour vérifier leur réutilisation.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, dict] = {}
+
+    def _new_stats(self) -> dict:
+        return {
+            "requests": 0,
+            "connections_opened": 0,
+            "http2_requests": 0,
+        }
+
+    def _create_client(self, shop_domain: str) -> httpx.AsyncClient:
+        http2 = HTTP2_ENABLED and HTTP2_AVAILABLE
+        if HTTP2_ENABLED and not HTTP2_AVAILABLE:
+            logger.warning("HTTP/2 requested but 'h2' is not installed, falling back to HTTP/1.1")
+
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+        logger.info(
+            f"Opening HTTP pool for {shop_domain} "
+            f"(http2={http2}, max_connections={HTTP_MAX_CONNECTIONS}, keepalive={HTTP_MAX_KEEPALIVE})"
+        )
+        return httpx.AsyncClient(http2=http2, limits=limits, timeout=HTTP_TIMEOUT)
+
+    def get_client(self, shop_domain: str) -> httpx.AsyncClient:
+        """Retourne le client de la boutique (créé à la demande si besoin)"""
+        client = self._clients.get(shop_domain)
+        if client is None or client.is_closed:
+            client = self._create_client(shop_domain)
+            self._clients[shop_domain] = client
+            self._stats.setdefault(shop_domain, self._new_stats())
+        return client
+
+    def open(self, shop_domain: str) -> httpx.AsyncClient:
+        """Ouvre le client de la boutique au démarrage"""
+        return self.get_client(shop_domain)
+
+    async def close(self):
+        """Ferme tous les clients (appelé à l'arrêt)"""
+        for shop_domain, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+                logger.info(f"HTTP pool closed for {shop_domain}")
+            except Exception as e:
+                logger.warning(f"Error closing HTTP pool for {shop_domain}: {e}")
+        self._clients = {}
+
+    async def post(self, shop_domain: str, url: str, **kwargs) -> httpx.Response:
+        """POST via le client partagé, en traçant l'ouverture des connexions"""
+        client = self.get_client(shop_domain)
+        stats = self._stats[shop_domain]
+
+        async def trace(event_name: str, info: dict):
+            if event_name == "connection.connect_tcp.complete":
+                stats["connections_opened"] += 1
+
+        response = await client.post(url, extensions={"trace": trace}, **kwargs)
+
+        stats["requests"] += 1
+        if response.http_version == "HTTP/2":
+            stats["http2_requests"] += 1
+        return response
+
+    def get_stats(self) -> dict:
+        """Statistiques de réutilisation des connexions par boutique"""
+        shops = {}
+        for shop_domain, stats in self._stats.items():
+            requests = stats["requests"]
+            opened = stats["connections_opened"]
+            shops[shop_domain] = {
+                **stats,
+                "connections_reused": max(requests - opened, 0),
+                "reuse_ratio": round(1 - opened / requests, 4) if requests else 0,
+                "open": shop_domain in self._clients and not self._clients[shop_domain].is_closed
+            }
+        return {
+            "http2": HTTP2_ENABLED and HTTP2_AVAILABLE,
+            "limits": {
+                "max_connections": HTTP_MAX_CONNECTIONS,
+                "max_keepalive_connections": HTTP_MAX_KEEPALIVE,
+                "keepalive_expiry": HTTP_KEEPALIVE_EXPIRY
+            },
+            "shops": shops
+        }
+
+
+# Instance globale partagée par tous les ShopifyService
+http_pool = HTTPPool()
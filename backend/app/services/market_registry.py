@@ -0,0 +1,141 @@
+"""
+Registre des marchés Shopify (en mémoire, par boutique)
+La liste des marchés (id, nom, PriceList, devise) change rarement : elle est
+chargée une fois puis servie depuis la mémoire pendant MARKETS_TTL_SECONDS,
+indexée par nom, GID et ID numérique.
+Les appelants concurrents d'un chargement partagent la même requête (single-flight).
+Un échec de chargement sert la dernière liste connue ; s'il n'y en a jamais
+eu, l'erreur remonte (une liste vide ferait croire qu'aucun marché n'existe).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Durée de validité de la liste des marchés (secondes)
+MARKETS_TTL_SECONDS = int(os.environ.get("SHOPIFY_MARKETS_TTL", "600"))
+
+MarketLoader = Callable[[], Awaitable[List[Dict]]]
+
+
+class MarketRegistry:
+    """
+    Marchés d'une boutique. Les dicts renvoyés sont partagés : lecture seule.
+    En cas d'échec du chargement, la dernière liste connue reste servie.
+    """
+
+    def __init__(self, ttl: float = MARKETS_TTL_SECONDS):
+        self.ttl = ttl
+        self._markets: List[Dict] = []
+        self._by_name: Dict[str, Dict] = {}
+        self._by_id: Dict[str, Dict] = {}
+        self._loaded_at: Optional[float] = None
+        # Au moins un chargement réussi (invalidate ne le remet pas à False)
+        self._has_loaded = False
+        self._loading: Optional[asyncio.Task] = None
+        self._stats = {"loads": 0, "hits": 0, "coalesced": 0, "invalidations": 0, "errors": 0}
+
+    @property
+    def fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def get_all(self, loader: MarketLoader, force_refresh: bool = False) -> List[Dict]:
+        """
+        Tous les marchés (chargés via loader si absents, expirés ou force_refresh).
+        Lève l'erreur du chargement si aucune liste n'a jamais été chargée.
+        """
+        if self.fresh and not force_refresh:
+            self._stats["hits"] += 1
+            return list(self._markets)
+        await self._load(loader)
+        return list(self._markets)
+
+    async def by_name(self, name: str, loader: MarketLoader) -> Optional[Dict]:
+        await self.get_all(loader)
+        return self._by_name.get(name)
+
+    async def by_id(self, market_id: str, loader: MarketLoader) -> Optional[Dict]:
+        """Marché par GID (gid://shopify/Market/123) ou ID numérique"""
+        await self.get_all(loader)
+        return self._by_id.get(str(market_id))
+
+    def invalidate(self):
+        """La prochaine lecture recharge la liste depuis Shopify"""
+        self._loaded_at = None
+        self._stats["invalidations"] += 1
+
+    async def _load(self, loader: MarketLoader):
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.create_task(self._fetch(loader))
+            self._loading.add_done_callback(self._loading_done)
+        else:
+            self._stats["coalesced"] += 1
+        # shield : l'annulation d'un appelant n'interrompt pas le chargement partagé
+        await asyncio.shield(self._loading)
+
+    def _loading_done(self, task: asyncio.Task):
+        if self._loading is task:
+            self._loading = None
+        # Exception non récupérée si tous les appelants ont été annulés
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self, loader: MarketLoader):
+        started = time.monotonic()
+        try:
+            markets = await loader()
+        except Exception as e:
+            self._stats["errors"] += 1
+            if not self._has_loaded:
+                logger.error(f"Market registry load failed, no market list known: {e}")
+                raise
+            logger.error(f"Market registry load failed, serving {len(self._markets)} known markets: {e}")
+            return
+
+        by_name = {}
+        by_id = {}
+        for market in markets:
+            by_name[market["name"]] = market
+            by_id[market["id"]] = market
+            by_id[market["id"].rsplit("/", 1)[-1]] = market
+
+        self._markets, self._by_name, self._by_id = markets, by_name, by_id
+        self._loaded_at = time.monotonic()
+        self._has_loaded = True
+        self._stats["loads"] += 1
+        logger.info(f"Market registry loaded {len(markets)} markets in {time.monotonic() - started:.2f}s")
+
+    def get_stats(self) -> dict:
+        age = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+        return {
+            **self._stats,
+            "markets": len(self._markets),
+            "ttl_seconds": self.ttl,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "fresh": self.fresh,
+            "loading": self._loading is not None
+        }
+
+
+# Un registre par boutique, partagé par tous les ShopifyService
+_registries: Dict[str, MarketRegistry] = {}
+
+
+def get_market_registry(shop_domain: str) -> MarketRegistry:
+    """Retourne le registre de la boutique (créé à la demande)"""
+    registry = _registries.get(shop_domain)
+    if registry is None:
+        registry = MarketRegistry()
+        _registries[shop_domain] = registry
+    return registry
+
+
+def get_market_registry_stats() -> dict:
+    """Statistiques des registres par boutique"""
+    return {
+        "shops": {shop: r.get_stats() for shop, r in _registries.items()}
+    }
@@ -0,0 +1,254 @@
+"""
+Sessions de preview côté serveur
+Une preview calculée est conservée sous un preview_id (TTL) : l'UI la pagine,
+la trie et la filtre sans la recalculer, et l'Apply pousse exactement les
+lignes stockées.
+
+Stockage compact : les champs propres à la variante (titre, SKU...) sont
+stockés une fois par variante, chaque ligne ne garde que ses champs de
+cellule (pays, devise, prix). Tri et filtres passent par des colonnes NumPy
+(pays, rang du SKU, écart de prix) calculées à la fermeture de la session.
+"""
+
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Durée de vie d'une preview stockée (secondes) et nombre max de previews
+# gardées en mémoire (les plus anciennes sont évincées au-delà)
+PREVIEW_TTL_SECONDS = int(os.environ.get("PREVIEW_TTL_SECONDS", "1800"))
+PREVIEW_MAX_SESSIONS = int(os.environ.get("PREVIEW_MAX_SESSIONS", "20"))
+
+# Par type de preview : (champs de la variante, champs de la cellule)
+ROW_LAYOUTS: Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    "pricing": (
+        ("sku", "title", "product_title", "variant_title", "variant_id", "base_price_eur"),
+        ("country", "currency", "current_price", "current_compare_at",
+         "new_price", "compare_at_price", "discount_percentage"),
+    ),
+    "random_promo": (
+        ("product_id", "product_title", "variant_id", "variant_title", "sku", "discount_percentage"),
+        ("country", "currency", "current_price", "new_price", "compare_at_price"),
+    ),
+}
+
+# Tris disponibles ("row" = ordre de calcul)
+SORT_FIELDS = ("row", "country", "sku", "current_price", "new_price", "delta", "delta_pct")
+
+
+def _price(value) -> float:
+    """Prix d'une ligne (float ou chaîne formatée) → float, NaN si absent"""
+    if value is None or value == "":
+        return np.nan
+    return float(value)
+
+
+class PreviewSession:
+    """Lignes d'une preview + colonnes de tri/filtre"""
+
+    def __init__(self, kind: str, summary: dict, countries: List[str], cache_epoch: Optional[int]):
+        self.preview_id = uuid.uuid4().hex
+        self.kind = kind
+        self.summary = summary
+        self.countries = countries
+        self.cache_epoch = cache_epoch
+        self.created_at = datetime.now()
+        self.expires_at = self.created_at + timedelta(seconds=PREVIEW_TTL_SECONDS)
+        self._deadline = time.monotonic() + PREVIEW_TTL_SECONDS
+
+        self._variant_fields, self._cell_fields = ROW_LAYOUTS[kind]
+        self._keys: Optional[Tuple[str, ...]] = None
+        self._variants: List[tuple] = []
+        self._variant_rows: Dict[str, int] = {}
+        self._row_variant: List[int] = []
+        self._cells: List[tuple] = []
+
+        # Colonnes calculées par seal()
+        self._country = np.empty(0, dtype=np.int32)
+        self._variant_of_row = np.empty(0, dtype=np.int64)
+        self._sku_rank = np.empty(0, dtype=np.int64)
+        self._current = np.empty(0, dtype=np.float64)
+        self._new = np.empty(0, dtype=np.float64)
+        self._market_names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self._deadline
+
+    def add(self, row: dict):
+        if self._keys is None:
+            self._keys = tuple(row)
+        variant_id = row["variant_id"]
+        index = self._variant_rows.get(variant_id)
+        if index is None:
+            index = len(self._variants)
+            self._variant_rows[variant_id] = index
+            self._variants.append(tuple(row.get(field) for field in self._variant_fields))
+        self._row_variant.append(index)
+        self._cells.append(tuple(row.get(field) for field in self._cell_fields))
+
+    def seal(self):
+        """Construit les colonnes de tri/filtre une fois toutes les lignes ajoutées"""
+        cell = {field: i for i, field in enumerate(self._cell_fields)}
+        markets: Dict[str, int] = {}
+        self._country = np.fromiter(
+            (markets.setdefault(c[cell["country"]], len(markets)) for c in self._cells),
+            dtype=np.int32, count=len(self._cells)
+        )
+        self._market_names = list(markets)
+        self._current = np.fromiter(
+            (_price(c[cell["current_price"]]) for c in self._cells), dtype=np.float64, count=len(self._cells)
+        )
+        self._new = np.fromiter(
+            (_price(c[cell["new_price"]]) for c in self._cells), dtype=np.float64, count=len(self._cells)
+        )
+
+        # Rang du SKU de chaque variante (ordre alphabétique), reporté sur les lignes
+        sku = self._variant_fields.index("sku")
+        order = sorted(range(len(self._variants)), key=lambda i: self._variants[i][sku] or "")
+        rank = np.empty(len(self._variants), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        self._variant_of_row = np.asarray(self._row_variant, dtype=np.int64)
+        self._sku_rank = rank[self._variant_of_row]
+
+    def row(self, index: int) -> dict:
+        values = dict(zip(self._variant_fields, self._variants[self._row_variant[index]]))
+        values.update(zip(self._cell_fields, self._cells[index]))
+        return {key: values[key] for key in self._keys}
+
+    def rows(self, indices: Optional[np.ndarray] = None) -> Iterator[dict]:
+        for index in (range(len(self._cells)) if indices is None else indices.tolist()):
+            yield self.row(index)
+
+    def _sort_values(self, sort: str) -> np.ndarray:
+        if sort == "country":
+            names = self._market_names
+            rank = np.empty(len(names), dtype=np.int64)
+            rank[sorted(range(len(names)), key=lambda i: names[i])] = np.arange(len(names))
+            return rank[self._country]
+        if sort == "sku":
+            return self._sku_rank
+        if sort == "current_price":
+            return self._current
+        if sort == "new_price":
+            return self._new
+        delta = self._new - self._current
+        if sort == "delta":
+            return delta
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self._current > 0, delta / self._current * 100, np.nan)
+
+    def select(
+        self,
+        markets: Optional[List[str]] = None,
+        sku: Optional[str] = None,
+        min_delta_pct: Optional[float] = None,
+        max_delta_pct: Optional[float] = None,
+        sort: str = "row",
+        descending: bool = False
+    ) -> np.ndarray:
+        """
+        Indices des lignes filtrées (marchés, SKU contenant `sku`, écart en %
+        entre prix actuel et nouveau prix) puis triées ; tri stable, lignes
+        sans écart calculable en dernier.
+        """
+        mask = np.ones(len(self._cells), dtype=bool)
+        if markets:
+            wanted = [i for i, name in enumerate(self._market_names) if name in markets]
+            mask &= np.isin(self._country, wanted)
+        if sku:
+            needle = sku.casefold()
+            field = self._variant_fields.index("sku")
+            matching = np.array([needle in (v[field] or "").casefold() for v in self._variants], dtype=bool)
+            mask &= matching[self._variant_of_row]
+        if min_delta_pct is not None or max_delta_pct is not None:
+            delta_pct = self._sort_values("delta_pct")
+            if min_delta_pct is not None:
+                mask &= delta_pct >= min_delta_pct
+            if max_delta_pct is not None:
+                mask &= delta_pct <= max_delta_pct
+
+        indices = np.flatnonzero(mask)
+        if sort == "row":
+            return indices[::-1] if descending else indices
+        values = self._sort_values(sort)[indices]
+        order = np.argsort(-values if descending else values, kind="stable")
+        return indices[order]
+
+    def updates_by_country(self) -> Dict[str, List[dict]]:
+        """Mises à jour Shopify groupées par marché, dans l'ordre des lignes"""
+        cell = {field: i for i, field in enumerate(self._cell_fields)}
+        variant_id = self._variant_fields.index("variant_id")
+        updates: Dict[str, List[dict]] = {}
+        for index, values in enumerate(self._cells):
+            updates.setdefault(values[cell["country"]], []).append({
+                "variant_id": self._variants[self._row_variant[index]][variant_id],
+                "price": values[cell["new_price"]],
+                "compare_at_price": values[cell["compare_at_price"]]
+            })
+        return updates
+
+    def info(self) -> dict:
+        return {
+            "preview_id": self.preview_id,
+            "kind": self.kind,
+            "rows": len(self._cells),
+            "variants": len(self._variants),
+            "cache_epoch": self.cache_epoch,
+            "created_at": self.created_at.isoformat(),
+            "expires_at": self.expires_at.isoformat()
+        }
+
+
+class PreviewStore:
+    """Previews en mémoire, par preview_id ; expirées au TTL ou évincées (LRU création)"""
+
+    def __init__(self, max_sessions: int = PREVIEW_MAX_SESSIONS):
+        self._max_sessions = max_sessions
+        self._sessions: Dict[str, PreviewSession] = {}
+
+    def put(self, session: PreviewSession) -> PreviewSession:
+        self._purge()
+        self._sessions[session.preview_id] = session
+        while len(self._sessions) > self._max_sessions:
+            evicted = next(iter(self._sessions))
+            del self._sessions[evicted]
+            logger.info(f"Preview {evicted} evicted (max {self._max_sessions} sessions)")
+        return session
+
+    def get(self, preview_id: str) -> Optional[PreviewSession]:
+        session = self._sessions.get(preview_id)
+        if session is not None and session.expired:
+            del self._sessions[preview_id]
+            return None
+        return session
+
+    def discard(self, preview_id: str) -> bool:
+        return self._sessions.pop(preview_id, None) is not None
+
+    def _purge(self):
+        for preview_id in [pid for pid, session in self._sessions.items() if session.expired]:
+            del self._sessions[preview_id]
+
+    def get_status(self) -> dict:
+        self._purge()
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self._max_sessions,
+            "ttl_seconds": PREVIEW_TTL_SECONDS,
+            "rows": sum(len(session) for session in self._sessions.values())
+        }
+
+
+# Instance globale
+preview_store = PreviewStore()
@@ -1,106 +1,246 @@
 """
 Service de cache des prix - Charge tous les prix au démarrage
-Avec persistance JSON pour éviter de recharger à chaque redémarrage
+Avec persistance dans un snapshot binaire (mappé en mémoire) pour éviter
+de recharger à chaque redémarrage
 """
 import asyncio
 import json
 import logging
 import os
+import random
+import time
 from typing import Dict, List, Optional
 from datetime import datetime
-from pathlib import Path
+
+from app.services.price_snapshot import SnapshotWriter, read_snapshot, write_snapshot
+from app.services.price_store import (
+    PriceSnapshot,
+    PriceStore,
+    MarketPrices,
+    PriceBlock,
+    to_minor
+)
+from app.services.price_wal import PriceWAL
+from app.services.product_catalog import product_catalog
+from app.services.variant_ids import variant_gid, variant_key, variant_keys
 
 logger = logging.getLogger(__name__)
 
 # Chemin du fichier cache (utiliser un volume persistant sur Railway)
 CACHE_DIR = os.environ.get("CACHE_DIR", "/app/cache")
+SNAPSHOT_FILE = os.path.join(CACHE_DIR, "price_cache.bin")
+# Journal des mises à jour (Apply) rejoué par-dessus le snapshot
+WAL_FILE = os.path.join(CACHE_DIR, "price_cache.wal")
+# Ancien format JSON, migré une seule fois vers le snapshot
 CACHE_FILE = os.path.join(CACHE_DIR, "price_cache.json")
 
+# Chargement parallèle : nombre de marchés chargés en même temps
+# et nombre max de requêtes Shopify en vol (tous marchés confondus)
+CACHE_LOAD_WORKERS = int(os.environ.get("CACHE_LOAD_WORKERS", "8"))
+CACHE_LOAD_MAX_IN_FLIGHT = int(os.environ.get("CACHE_LOAD_MAX_IN_FLIGHT", "8"))
 
-class PriceCache:
-    """
-    Cache global des prix par marché avec persistance JSON.
-    Structure:
-    {
-        "France": {
-            "currency": "EUR",
-            "priceListId": "gid://...",
-            "prices": {
-                "gid://shopify/ProductVariant/123": {
-                    "price": "99.99",
-                    "compareAtPrice": "149.99"
-                },
-                ...
+# Fraîcheur : un marché chargé il y a plus de CACHE_TTL_SECONDS est rechargé
+# par le planificateur (jitter pour regrouper et étaler les rafraîchissements)
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "21600"))
+CACHE_REFRESH_JITTER = int(os.environ.get("CACHE_REFRESH_JITTER", "300"))
+CACHE_REFRESH_MIN_INTERVAL = int(os.environ.get("CACHE_REFRESH_MIN_INTERVAL", "60"))
+
+# Rafraîchissement ciblé demandé pendant un autre chargement : attente max
+# (secondes) de la fin de ce chargement avant de refuser la demande
+CACHE_SCOPED_REFRESH_WAIT = float(os.environ.get("CACHE_SCOPED_REFRESH_WAIT", "300"))
+
+# Compaction du journal dans le snapshot : périodique, ou dès N enregistrements
+CACHE_WAL_COMPACT_INTERVAL = int(os.environ.get("CACHE_WAL_COMPACT_INTERVAL", "300"))
+CACHE_WAL_COMPACT_RECORDS = int(os.environ.get("CACHE_WAL_COMPACT_RECORDS", "50000"))
+CACHE_WAL_CHECK_INTERVAL = 10
+
+# Écriture du snapshot dans un thread : les demandes arrivées pendant ce délai
+# (secondes) sont fusionnées en une seule écriture
+CACHE_SAVE_COALESCE_DELAY = float(os.environ.get("CACHE_SAVE_COALESCE_DELAY", "1.0"))
+
+# Requête Bulk Operation : toutes les PriceLists et leurs prix fixes
+BULK_PRICES_QUERY = """
+{
+    priceLists {
+        edges {
+            node {
+                id
+                currency
+                prices {
+                    edges {
+                        node {
+                            variant { id }
+                            price { amount currencyCode }
+                            compareAtPrice { amount }
+                        }
+                    }
+                }
             }
-        },
-        ...
+        }
     }
+}
+"""
+
+
+class PriceCache:
+    """
+    Cache global des prix par marché avec persistance en snapshot binaire
+    + journal des mises à jour (WAL) compacté périodiquement.
+    Stockage colonnaire (voir price_store) :
+    - un index de variantes partagé (ids entiers)
+    - par marché : currency, priceListId, loadedAt + colonnes prix / compare-at
+      en unités mineures, alignées sur l'index
+    Les lectures renvoient toujours {"price": "99.99", "compareAtPrice": "149.99", "currency": "EUR"}.
+    
+    Chaque publication de marché ou lot de mises à jour crée une nouvelle
+    époque immuable : une requête qui doit rester cohérente épingle
+    snapshot() une fois et lit tout dessus.
     """
     
     def __init__(self):
-        self._cache: Dict[str, Dict] = {}
+        self._store = PriceStore()
         self._loading = False
         self._loaded = False
         self._last_refresh: Optional[datetime] = None
+        # Signalé à la fin de chaque chargement (file d'attente des rechargements ciblés)
+        self._load_finished = asyncio.Event()
+        self._load_finished.set()
+        # Dernier chargement complet / ciblé : durée et fin
+        self._last_load_duration: Optional[float] = None
+        # Date (timestamp) du snapshot sur disque, None si aucun
+        self._snapshot_written_at: Optional[float] = None
         self._load_progress = {
             "current_market": "",
             "markets_done": 0,
             "total_markets": 0,
-            "total_prices": 0
+            "total_prices": 0,
+            "markets": {}
         }
         
+        # Requêtes Shopify simultanées max pendant un chargement
+        self._request_budget = asyncio.Semaphore(CACHE_LOAD_MAX_IN_FLIGHT)
+        
+        # Journal des Apply depuis le dernier snapshot
+        self._wal = PriceWAL(WAL_FILE)
+        # Écritures du snapshot hors de la boucle asyncio
+        self._writer = SnapshotWriter(SNAPSHOT_FILE, CACHE_SAVE_COALESCE_DELAY)
+        self._last_compaction = datetime.now()
+        
         # Essayer de charger depuis le fichier au démarrage
         self._load_from_file()
     
     def _load_from_file(self) -> bool:
-        """Charge le cache depuis le fichier JSON si disponible"""
-        try:
-            if os.path.exists(CACHE_FILE):
-                logger.info(f"Loading cache from file: {CACHE_FILE}")
-                with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                self._cache = data.get("cache", {})
-                self._last_refresh = datetime.fromisoformat(data["last_refresh"]) if data.get("last_refresh") else None
+        """Charge le cache depuis le snapshot, sinon migre l'ancien fichier JSON"""
+        if os.path.exists(SNAPSHOT_FILE):
+            try:
+                logger.info(f"Loading cache from snapshot: {SNAPSHOT_FILE}")
+                self._store, meta = read_snapshot(SNAPSHOT_FILE)
+                self._snapshot_written_at = os.path.getmtime(SNAPSHOT_FILE)
+                last_refresh = meta.get("last_refresh")
+                self._last_refresh = datetime.fromisoformat(last_refresh) if last_refresh else None
                 self._loaded = True
                 
-                total_prices = sum(len(m.get("prices", {})) for m in self._cache.values())
-                logger.info(f"Cache loaded from file: {len(self._cache)} markets, {total_prices} prices")
+                total_prices = self._store.current.total_prices
+                logger.info(f"Cache loaded from snapshot: {len(self._store.markets)} markets, {total_prices} prices")
                 logger.info(f"Last refresh: {self._last_refresh}")
                 
+                self._replay_wal()
                 return True
-        except Exception as e:
-            logger.warning(f"Could not load cache from file: {e}")
+            except Exception as e:
+                logger.warning(f"Could not load cache snapshot: {e}")
+                self._store = PriceStore()
+        
+        if os.path.exists(CACHE_FILE) and self._load_from_json():
+            self._replay_wal()
+            # Migration : écrire le snapshot puis écarter le JSON
+            if self._save_to_file():
+                os.replace(CACHE_FILE, CACHE_FILE + ".migrated")
+                logger.info(f"Cache migrated from {CACHE_FILE} to {SNAPSHOT_FILE}")
+            return True
         
         return False
     
-    def _save_to_file(self) -> bool:
-        """Sauvegarde le cache dans le fichier JSON"""
+    def _replay_wal(self):
+        """Rejoue les mises à jour enregistrées depuis le dernier snapshot"""
+        changes = {}
+        for market_name, variant, price, compare_at in self._wal.replay():
+            changes.setdefault(market_name, []).append((variant, price, compare_at))
+        replayed = self._store.update(changes)
+        if replayed:
+            logger.info(f"Replayed {replayed} price updates from {WAL_FILE}")
+    
+    def _load_from_json(self) -> bool:
+        """Charge le cache depuis l'ancien fichier JSON"""
         try:
-            # Créer le dossier si nécessaire
-            os.makedirs(CACHE_DIR, exist_ok=True)
+            logger.info(f"Loading cache from JSON file: {CACHE_FILE}")
+            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
             
-            data = {
-                "cache": self._cache,
-                "last_refresh": self._last_refresh.isoformat() if self._last_refresh else None,
-                "saved_at": datetime.now().isoformat()
-            }
+            for market_name, market_data in data.get("cache", {}).items():
+                market = self._store.new_market(
+                    market_data.get("marketId", ""),
+                    market_data.get("currency", "EUR"),
+                    market_data.get("priceListId", "")
+                )
+                for variant_id, price_info in market_data.get("prices", {}).items():
+                    self._store.put(market, variant_id, price_info.get("price"), price_info.get("compareAtPrice"))
+                self._store.publish(market_name, market)
+                market.loaded_at = market_data.get("loadedAt") or market.loaded_at
             
-            # Écrire dans un fichier temporaire puis renommer (atomique)
-            temp_file = CACHE_FILE + ".tmp"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f)
+            self._last_refresh = datetime.fromisoformat(data["last_refresh"]) if data.get("last_refresh") else None
+            self._loaded = True
             
-            os.replace(temp_file, CACHE_FILE)
+            total_prices = self._store.current.total_prices
+            logger.info(f"Cache loaded from JSON file: {len(self._store.markets)} markets, {total_prices} prices")
             
-            file_size = os.path.getsize(CACHE_FILE) / (1024 * 1024)  # MB
-            logger.info(f"Cache saved to file: {CACHE_FILE} ({file_size:.1f} MB)")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not load cache from JSON file: {e}")
+            self._store = PriceStore()
+        
+        return False
+    
+    def _save_to_file(self) -> bool:
+        """Sauvegarde synchrone du snapshot (démarrage / migration uniquement)"""
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            segment = self._wal.seal()
+            size = write_snapshot(
+                SNAPSHOT_FILE,
+                self._store.current,
+                self._last_refresh.isoformat() if self._last_refresh else None
+            )
+            # Le snapshot contient toutes les mises à jour du journal
+            self._wal.discard_sealed(segment)
+            self._last_compaction = datetime.now()
+            self._snapshot_written_at = time.time()
+            
+            logger.info(f"Cache saved to snapshot: {SNAPSHOT_FILE} ({size / (1024 * 1024):.1f} MB)")
             
             return True
         except Exception as e:
-            logger.error(f"Could not save cache to file: {e}")
+            logger.error(f"Error saving cache snapshot: {e}")
             return False
     
+    def _schedule_save(self):
+        """
+        Demande l'écriture du snapshot courant au thread d'écriture (non bloquant).
+        Le journal est scellé maintenant : tout ce qu'il contient est dans
+        l'époque épinglée, et ses segments sont supprimés une fois écrits.
+        """
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        segment = self._wal.seal()
+        self._writer.submit(
+            self._store.current,
+            self._last_refresh.isoformat() if self._last_refresh else None,
+            lambda: self._wal.discard_sealed(segment)
+        )
+        self._last_compaction = datetime.now()
+    
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """Attend la fin des écritures de snapshot en cours (arrêt de l'application)"""
+        return await asyncio.to_thread(self._writer.flush, timeout)
+    
     @property
     def is_loaded(self) -> bool:
         return self._loaded
@@ -109,6 +249,23 @@ class PriceCache:
     def is_loading(self) -> bool:
         return self._loading
     
+    async def wait_until_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        Attend qu'aucun chargement ne soit en cours (False si timeout).
+        Sans await entre le retour et l'appel à load_all_prices, l'appelant
+        est assuré de lancer le chargement suivant.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._loading:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._load_finished.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+    
     @property
     def last_refresh(self) -> Optional[datetime]:
         return self._last_refresh
@@ -118,49 +275,69 @@ class PriceCache:
         return self._load_progress
     
     def get_status(self) -> dict:
-        """Retourne le statut du cache"""
-        total_prices = sum(
-            len(market_data.get("prices", {})) 
-            for market_data in self._cache.values()
-        )
+        """
+        Retourne le statut du cache
+        Temps constant vis-à-vis du catalogue : agrégats tenus à jour à chaque
+        époque, compteurs du journal en mémoire, aucun accès disque.
+        """
+        snapshot = self._store.current
+        writer = self._writer.get_stats()
+        written_at = writer["last_written_at"] or self._snapshot_written_at
+        now = datetime.now()
+        
+        markets = {}
+        stale_markets = []
+        for name, market in snapshot.markets.items():
+            age = (now - datetime.fromisoformat(market.loaded_at)).total_seconds() if market.loaded_at else None
+            markets[name] = {
+                "prices": market.count,
+                "currency": market.currency,
+                "loaded_at": market.loaded_at,
+                "age_seconds": round(age) if age is not None else None
+            }
+            if age is None or age >= CACHE_TTL_SECONDS:
+                stale_markets.append(name)
+        
         return {
             "loaded": self._loaded,
             "loading": self._loading,
             "last_refresh": self._last_refresh.isoformat() if self._last_refresh else None,
-            "markets_count": len(self._cache),
-            "total_prices": total_prices,
+            "last_load_duration_seconds": self._last_load_duration,
+            "markets_count": len(snapshot.markets),
+            "total_prices": snapshot.total_prices,
+            "variants_indexed": len(snapshot.variants),
+            "epoch": snapshot.epoch,
+            "memory_bytes": snapshot.variants.memory_bytes() + snapshot.markets_bytes,
+            "markets": markets,
             "progress": self._load_progress,
-            "persisted": os.path.exists(CACHE_FILE)
+            "persisted": written_at is not None,
+            "snapshot_age_seconds": round(time.time() - written_at) if written_at else None,
+            "ttl_seconds": CACHE_TTL_SECONDS,
+            "stale_markets": stale_markets,
+            "wal_records": self._wal.records,
+            "wal_bytes": self._wal.size_bytes(),
+            "writer": writer
         }
     
+    @property
+    def epoch(self) -> int:
+        return self._store.epoch
+    
+    def snapshot(self) -> PriceSnapshot:
+        """Snapshot immuable de l'époque courante (à épingler pour toute une requête)"""
+        return self._store.current
+    
     def get_price(self, market_name: str, variant_id: str) -> Optional[dict]:
-        """Récupère le prix d'une variante pour un marché"""
-        if market_name not in self._cache:
-            return None
-        
-        market_data = self._cache[market_name]
-        prices = market_data.get("prices", {})
-        
-        # Essayer les deux formats d'ID
-        if variant_id in prices:
-            return prices[variant_id]
-        
-        # Essayer avec le format GID complet
-        if not variant_id.startswith("gid://"):
-            gid = f"gid://shopify/ProductVariant/{variant_id}"
-            if gid in prices:
-                return prices[gid]
-        else:
-            # Essayer avec juste l'ID numérique
-            numeric_id = variant_id.split("/")[-1]
-            if numeric_id in prices:
-                return prices[numeric_id]
-        
-        return None
+        """Récupère le prix d'une variante pour un marché (GID ou ID numérique)"""
+        return self._store.current.get(market_name, variant_id)
     
     def get_market_data(self, market_name: str) -> Optional[dict]:
         """Récupère toutes les données d'un marché"""
-        return self._cache.get(market_name)
+        return self._store.current.market_data(market_name)
+    
+    def get_markets_summary(self) -> List[dict]:
+        """Marchés du cache avec devise et nombre de prix"""
+        return self._store.current.markets_summary()
     
     def get_prices_for_variants(
         self, 
@@ -171,114 +348,128 @@ class PriceCache:
         Récupère les prix pour plusieurs variantes et marchés
         Retourne le même format que get_variant_prices_by_market
         """
-        result = {}
-        
-        for market_name in market_names:
-            if market_name not in self._cache:
-                continue
-            
-            market_data = self._cache[market_name]
-            market_prices = {}
-            
-            for variant_id in variant_ids:
-                price_info = self.get_price(market_name, variant_id)
-                if price_info:
-                    # Normaliser l'ID
-                    if variant_id.startswith("gid://"):
-                        key = variant_id
-                    else:
-                        key = f"gid://shopify/ProductVariant/{variant_id}"
-                    market_prices[key] = price_info
-            
-            if market_prices:
-                result[market_name] = {
-                    "marketId": market_data.get("marketId", ""),
-                    "currency": market_data.get("currency", "EUR"),
-                    "priceListId": market_data.get("priceListId", ""),
-                    "prices": market_prices
-                }
-        
-        return result
+        return self._store.current.prices_for_variants(variant_ids, market_names)
+    
+    def get_price_block(self, variant_ids: List, market_names: List[str]) -> PriceBlock:
+        """Prix variantes × marchés en unités mineures (ids de tous formats)"""
+        return self._store.current.gather([variant_key(vid) for vid in variant_ids], market_names)
     
-    async def load_all_prices(self, shopify_service) -> bool:
+    async def load_all_prices(
+        self,
+        shopify_service,
+        mode: str = "paginated",
+        max_age: Optional[float] = None,
+        markets: Optional[List[str]] = None,
+        price_list_ids: Optional[List[str]] = None
+    ) -> bool:
         """
         Charge tous les prix de tous les marchés.
         Sauvegarde automatiquement dans le fichier après chargement.
+        
+        Args:
+            mode: "paginated" (pagination par PriceList) ou "bulk" (Bulk Operation JSONL)
+            max_age: si fourni, ne recharge que les marchés absents du cache
+                     ou chargés il y a plus de max_age secondes
+            markets / price_list_ids: si fournis, ne recharge que ces marchés
+                     (par nom ou par ID de PriceList) ; les autres restent servis
         """
         if self._loading:
             logger.warning("Price cache is already loading")
             return False
         
         self._loading = True
+        self._load_finished.clear()
+        started = time.monotonic()
         self._load_progress = {
             "current_market": "Initialisation...",
             "markets_done": 0,
             "total_markets": 0,
-            "total_prices": 0
+            "total_prices": 0,
+            "mode": mode,
+            "scope": (markets or []) + (price_list_ids or []) or None,
+            "unknown": [],
+            "markets": {}
         }
         
         try:
-            logger.info("=== STARTING PRICE CACHE LOAD ===")
+            logger.info(f"=== STARTING PRICE CACHE LOAD ({mode}) ===")
+            http_before = self._http_counters(shopify_service)
             
-            # Récupérer tous les marchés
-            markets = await shopify_service.get_all_markets()
-            markets_with_pricelist = [m for m in markets if m.get("priceList")]
-            
-            self._load_progress["total_markets"] = len(markets_with_pricelist)
+            # Récupérer tous les marchés : liste rechargée pour un rechargement
+            # complet (marchés et PriceLists créés depuis) ; un rechargement ciblé
+            # part du registre et ne le recharge que si la cible y est inconnue
+            scoped = bool(markets or price_list_ids)
+            all_markets = await shopify_service.get_all_markets(force_refresh=not scoped)
+            if scoped:
+                known = {m["name"] for m in all_markets} | {
+                    m["priceList"]["id"] for m in all_markets if m.get("priceList")
+                }
+                if any(key not in known for key in (markets or []) + (price_list_ids or [])):
+                    all_markets = await shopify_service.get_all_markets(force_refresh=True)
+            markets_with_pricelist = [m for m in all_markets if m.get("priceList")]
             logger.info(f"Found {len(markets_with_pricelist)} markets with PriceLists")
+            if not markets_with_pricelist:
+                # Liste vide = réponse anormale : ne pas retirer tous les marchés du cache
+                raise RuntimeError("No market with a PriceList returned by Shopify, cache left untouched")
             
-            new_cache = {}
+            markets_to_load = markets_with_pricelist
+            if scoped:
+                markets_to_load = [
+                    m for m in markets_with_pricelist
+                    if m["name"] in (markets or []) or m["priceList"]["id"] in (price_list_ids or [])
+                ]
+                found = {m["name"] for m in markets_to_load} | {m["priceList"]["id"] for m in markets_to_load}
+                self._load_progress["unknown"] = [
+                    key for key in (markets or []) + (price_list_ids or []) if key not in found
+                ]
+                if self._load_progress["unknown"]:
+                    logger.warning(f"Unknown markets / price lists in refresh scope: {self._load_progress['unknown']}")
+            if max_age is not None:
+                markets_to_load = [m for m in markets_to_load if self._is_stale(m["name"], max_age)]
+                logger.info(f"{len(markets_to_load)} markets older than {max_age:.0f}s to refresh")
             
-            for idx, market in enumerate(markets_with_pricelist):
-                market_name = market["name"]
-                price_list = market["priceList"]
-                
-                self._load_progress["current_market"] = market_name
-                self._load_progress["markets_done"] = idx
-                
-                logger.info(f"Loading prices for {market_name} ({idx + 1}/{len(markets_with_pricelist)})")
-                
-                try:
-                    # Charger TOUS les prix de ce marché (pas de limite)
-                    prices = await self._load_all_pricelist_prices(
-                        shopify_service, 
-                        price_list["id"]
-                    )
-                    
-                    # Organiser par variant_id
-                    prices_dict = {}
-                    for p in prices:
-                        prices_dict[p["variantId"]] = {
-                            "price": p["price"],
-                            "compareAtPrice": p["compareAtPrice"],
-                            "currency": p["currency"]
-                        }
-                    
-                    new_cache[market_name] = {
-                        "marketId": market["id"],
-                        "currency": price_list["currency"],
-                        "priceListId": price_list["id"],
-                        "prices": prices_dict
-                    }
-                    
-                    self._load_progress["total_prices"] += len(prices_dict)
-                    logger.info(f"  → {len(prices_dict)} prices loaded for {market_name}")
-                    
-                except Exception as e:
-                    logger.error(f"Error loading prices for {market_name}: {e}")
+            self._load_progress["total_markets"] = len(markets_to_load)
+            
+            if not markets_to_load:
+                new_cache = {}
+            elif mode == "bulk":
+                new_cache = await self._load_all_prices_bulk(shopify_service, markets_to_load)
+            else:
+                new_cache = await self._load_all_prices_paginated(shopify_service, markets_to_load)
             
-            # Remplacer le cache
-            self._cache = new_cache
+            # Chaque marché a déjà été publié dès la fin de son chargement ;
+            # retirer ceux qui n'existent plus côté Shopify. Un marché en échec
+            # garde ses anciens prix plutôt que de disparaître.
+            active_markets = {m["name"] for m in markets_with_pricelist}
+            self._store.remove([name for name in self._store.markets if name not in active_markets])
             self._loaded = True
-            self._last_refresh = datetime.now()
+            # Rechargement ciblé : seuls les marchés concernés sont rafraîchis
+            # (leur date est dans refreshed_at / loaded_at), pas tout le cache
+            if not scoped:
+                self._last_refresh = datetime.now()
             self._load_progress["current_market"] = "Terminé"
-            self._load_progress["markets_done"] = len(markets_with_pricelist)
+            self._load_progress["markets_done"] = len(markets_to_load)
+            
+            failed = [name for name, p in self._load_progress["markets"].items() if p["status"] == "error"]
+            if failed:
+                logger.warning(f"Markets failed during load (previous prices kept): {', '.join(failed)}")
             
-            total_prices = sum(len(m.get("prices", {})) for m in self._cache.values())
-            logger.info(f"=== PRICE CACHE LOADED: {len(self._cache)} markets, {total_prices} prices ===")
+            total_prices = self._store.current.total_prices
+            logger.info(f"=== PRICE CACHE LOADED: {len(self._store.markets)} markets, {total_prices} prices ===")
             
-            # SAUVEGARDER DANS LE FICHIER
-            self._save_to_file()
+            # Réutilisation des connexions HTTP pendant le chargement
+            http_after = self._http_counters(shopify_service)
+            self._load_progress["http_requests"] = http_after["requests"] - http_before["requests"]
+            self._load_progress["http_connections_opened"] = (
+                http_after["connections_opened"] - http_before["connections_opened"]
+            )
+            logger.info(
+                f"HTTP: {self._load_progress['http_requests']} requests over "
+                f"{self._load_progress['http_connections_opened']} new connections"
+            )
+            
+            # SAUVEGARDER DANS LE FICHIER (thread d'écriture, sans bloquer les requêtes)
+            self._schedule_save()
             
             return True
             
@@ -287,11 +478,257 @@ class PriceCache:
             return False
         finally:
             self._loading = False
+            self._load_finished.set()
+            self._last_load_duration = round(time.monotonic() - started, 2)
+    
+    async def _load_all_prices_paginated(
+        self,
+        shopify_service,
+        markets_with_pricelist: List[dict]
+    ) -> Dict[str, MarketPrices]:
+        """
+        Charge les prix des marchés en parallèle, par pagination de chaque PriceList.
+        Un pool borné de workers se partage les marchés ; toutes les pages passent
+        par le même budget de requêtes en vol. L'échec d'un marché n'arrête pas les autres.
+        """
+        new_cache = {}
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        for market in markets_with_pricelist:
+            queue.put_nowait(market)
+            self._load_progress["markets"][market["name"]] = {
+                "status": "pending",
+                "pages": 0,
+                "prices": 0
+            }
+        
+        async def worker():
+            while True:
+                try:
+                    market = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                
+                market_data = await self._load_market(shopify_service, market)
+                if market_data is not None:
+                    new_cache[market["name"]] = market_data
+                    self._publish_market(market["name"], market_data)
+        
+        workers = min(CACHE_LOAD_WORKERS, len(markets_with_pricelist))
+        logger.info(f"Loading {len(markets_with_pricelist)} markets with {workers} workers")
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        
+        return new_cache
+    
+    async def _load_market(self, shopify_service, market: dict) -> Optional[MarketPrices]:
+        """Charge tous les prix d'un marché ; retourne None en cas d'échec"""
+        market_name = market["name"]
+        price_list = market["priceList"]
+        market_progress = self._load_progress["markets"].setdefault(
+            market_name, {"status": "pending", "pages": 0, "prices": 0}
+        )
+        
+        market_progress["status"] = "loading"
+        self._update_current_markets()
+        logger.info(f"Loading prices for {market_name}")
+        started = time.monotonic()
+        
+        try:
+            # Charger TOUS les prix de ce marché (pas de limite)
+            prices = await self._load_all_pricelist_prices(
+                shopify_service, 
+                price_list["id"],
+                market_progress
+            )
+            
+            # Colonnes du marché, indexées par variante
+            market_prices = self._store.new_market(market["id"], price_list["currency"], price_list["id"])
+            for p in prices:
+                self._store.put(market_prices, p["variantId"], p["price"], p["compareAtPrice"])
+            
+            market_progress["status"] = "done"
+            market_progress["prices"] = market_prices.count
+            self._load_progress["total_prices"] += market_prices.count
+            logger.info(f"  → {market_prices.count} prices loaded for {market_name}")
+            
+            return market_prices
+            
+        except Exception as e:
+            market_progress["status"] = "error"
+            market_progress["error"] = str(e)
+            logger.error(f"Error loading prices for {market_name}: {e}")
+            return None
+        finally:
+            market_progress["duration_ms"] = round((time.monotonic() - started) * 1000)
+            self._load_progress["markets_done"] += 1
+            self._update_current_markets()
+    
+    def _publish_market(self, market_name: str, market_prices: MarketPrices):
+        """Rend un marché disponible dans le cache dès que son chargement est fini"""
+        market_progress = self._load_progress["markets"].setdefault(market_name, {})
+        market_progress["changed"] = market_prices.changed_rows(self._store.markets.get(market_name))
+        self._store.publish(market_name, market_prices)
+        market_progress["refreshed_at"] = market_prices.loaded_at
+    
+    def _market_age(self, market_name: str) -> Optional[float]:
+        """Secondes depuis le chargement du marché (None si absent ou inconnu)"""
+        market = self._store.markets.get(market_name)
+        if market is None or not market.loaded_at:
+            return None
+        return (datetime.now() - datetime.fromisoformat(market.loaded_at)).total_seconds()
+    
+    def _is_stale(self, market_name: str, max_age: float = CACHE_TTL_SECONDS) -> bool:
+        age = self._market_age(market_name)
+        return age is None or age >= max_age
+    
+    def get_stale_markets(self, max_age: float = CACHE_TTL_SECONDS) -> List[str]:
+        """Marchés du cache chargés il y a plus de max_age secondes"""
+        return [name for name in self._store.markets if self._is_stale(name, max_age)]
+    
+    def _next_refresh_delay(self) -> float:
+        """Secondes avant l'expiration du plus ancien marché, plus un jitter"""
+        ages = [self._market_age(name) for name in self._store.markets]
+        oldest = max((age for age in ages if age is not None), default=CACHE_TTL_SECONDS)
+        delay = CACHE_TTL_SECONDS - oldest + random.uniform(0, CACHE_REFRESH_JITTER)
+        return max(delay, CACHE_REFRESH_MIN_INTERVAL)
+    
+    async def run_refresh_scheduler(self, shopify_service):
+        """
+        Tâche de fond : au démarrage, sert le snapshot tel quel s'il est frais
+        et ne recharge que les marchés expirés ; ensuite, se réveille à
+        l'expiration du plus ancien marché (avec jitter) pour rafraîchir
+        les marchés expirés ou sur le point de l'être.
+        """
+        if not self._loaded:
+            logger.info("No persisted cache, starting full load...")
+            await self.load_all_prices(shopify_service)
+        elif self.get_stale_markets():
+            logger.info(f"Persisted cache has stale markets, refreshing: {', '.join(self.get_stale_markets())}")
+            await self.load_all_prices(shopify_service, max_age=CACHE_TTL_SECONDS)
+        else:
+            logger.info("Persisted cache is fresh, skipping startup reload")
+        
+        while True:
+            delay = self._next_refresh_delay()
+            logger.info(f"Next cache refresh in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            try:
+                # Regrouper les marchés qui expirent dans la fenêtre de jitter
+                await self.load_all_prices(
+                    shopify_service,
+                    max_age=max(CACHE_TTL_SECONDS - CACHE_REFRESH_JITTER, 0)
+                )
+            except Exception as e:
+                logger.error(f"Scheduled cache refresh failed: {e}")
+    
+    def is_market_ready(self, market_name: str) -> bool:
+        """Vrai si le marché peut être servi depuis le cache"""
+        return market_name in self._store.markets
+    
+    def get_ready_markets(self, market_names: List[str]) -> List[str]:
+        """Filtre les marchés déjà disponibles dans le cache"""
+        return self._store.current.ready_markets(market_names)
+    
+    def _update_current_markets(self):
+        """current_market = marchés en cours de chargement"""
+        loading = [
+            name for name, progress in self._load_progress["markets"].items()
+            if progress["status"] == "loading"
+        ]
+        self._load_progress["current_market"] = ", ".join(loading)
+    
+    async def _load_all_prices_bulk(
+        self,
+        shopify_service,
+        markets_with_pricelist: List[dict]
+    ) -> Dict[str, MarketPrices]:
+        """
+        Charge les prix de toutes les PriceLists en une Bulk Operation.
+        Le JSONL résultat est lu ligne par ligne : une ligne PriceList,
+        puis une ligne par prix avec __parentId = id de la PriceList.
+        Un marché est publié dès que ses lignes sont terminées ; si sa PriceList
+        réapparaît plus loin dans le fichier, la suite est écrite dans une copie
+        republiée à la fin (un marché publié n'est jamais modifié en place).
+        """
+        markets_by_pricelist = {}
+        new_cache = {}
+        for market in markets_with_pricelist:
+            price_list = market["priceList"]
+            markets_by_pricelist[price_list["id"]] = market["name"]
+            new_cache[market["name"]] = self._store.new_market(
+                market["id"], price_list["currency"], price_list["id"]
+            )
+        
+        self._load_progress["current_market"] = "Bulk operation en cours..."
+        operation = await shopify_service.run_bulk_query(BULK_PRICES_QUERY)
+        
+        self._load_progress["current_market"] = "Lecture du fichier JSONL..."
+        current_parent = None
+        published = set()
+        skipped = 0
+        
+        async for record in shopify_service.stream_bulk_results(operation.get("url")):
+            parent_id = record.get("__parentId")
+            if not parent_id:
+                continue  # Ligne PriceList elle-même
+            
+            market_name = markets_by_pricelist.get(parent_id)
+            if not market_name:
+                skipped += 1  # PriceList non rattachée à un marché
+                continue
+            
+            if parent_id != current_parent:
+                if current_parent is not None:
+                    # Lignes groupées par PriceList : la précédente est complète
+                    previous = markets_by_pricelist[current_parent]
+                    self._publish_market(previous, new_cache[previous])
+                    published.add(previous)
+                    self._load_progress["markets_done"] += 1
+                current_parent = parent_id
+                self._load_progress["current_market"] = market_name
+                if market_name in published:
+                    # Lignes non groupées : copie-sur-écriture du marché déjà publié
+                    logger.warning(f"Bulk load: price list of {market_name} reappeared after publication")
+                    new_cache[market_name] = new_cache[market_name].clone()
+                    published.discard(market_name)
+                    self._load_progress["markets_done"] -= 1
+            
+            self._store.put(
+                new_cache[market_name],
+                record["variant"]["id"],
+                record["price"]["amount"],
+                record["compareAtPrice"]["amount"] if record.get("compareAtPrice") else None
+            )
+            self._load_progress["total_prices"] += 1
+        
+        if skipped:
+            logger.info(f"Bulk load: skipped {skipped} prices from price lists without market")
+        
+        for market_name, market_prices in new_cache.items():
+            if market_name not in published:
+                self._publish_market(market_name, market_prices)
+            self._load_progress["markets"][market_name].update({
+                "status": "done",
+                "pages": 0,
+                "prices": market_prices.count
+            })
+            logger.info(f"  → {market_prices.count} prices loaded for {market_name}")
+        
+        return new_cache
+    
+    def _http_counters(self, shopify_service) -> dict:
+        """Compteurs HTTP de la boutique (requêtes, connexions ouvertes)"""
+        stats = shopify_service.get_http_stats()["shops"].get(shopify_service.shop_domain, {})
+        return {
+            "requests": stats.get("requests", 0),
+            "connections_opened": stats.get("connections_opened", 0)
+        }
     
     async def _load_all_pricelist_prices(
         self, 
         shopify_service, 
-        price_list_id: str
+        price_list_id: str,
+        market_progress: Optional[dict] = None
     ) -> List[dict]:
         """Charge TOUS les prix d'une PriceList (sans limite)"""
         
@@ -326,33 +763,41 @@ class PriceCache:
             if cursor:
                 variables["after"] = cursor
             
+            # Un échec (après retries) remonte : une liste tronquée remplacerait
+            # le cache du marché, _load_market garde alors les anciens prix
             try:
-                result = await shopify_service.execute_query(query, variables)
-                
-                if "data" in result and result["data"]["priceList"]:
-                    price_list = result["data"]["priceList"]
-                    edges = price_list["prices"]["edges"]
-                    
-                    if not edges:
-                        break
-                    
-                    for edge in edges:
-                        node = edge["node"]
-                        all_prices.append({
-                            "variantId": node["variant"]["id"],
-                            "price": node["price"]["amount"],
-                            "currency": node["price"]["currencyCode"],
-                            "compareAtPrice": node["compareAtPrice"]["amount"] if node.get("compareAtPrice") else None
-                        })
-                        cursor = edge["cursor"]
-                    
-                    has_next = price_list["prices"]["pageInfo"]["hasNextPage"]
-                else:
-                    break
-                    
+                # Budget global de requêtes en vol, partagé par tous les marchés
+                async with self._request_budget:
+                    result = await shopify_service.execute_query(query, variables)
             except Exception as e:
-                logger.error(f"Error fetching prices: {e}")
+                logger.error(f"Error fetching prices after {len(all_prices)} prices: {e}")
+                raise
+            
+            if market_progress is not None:
+                market_progress["pages"] += 1
+            
+            if not result.get("data"):
+                raise RuntimeError(f"Price list page failed after {len(all_prices)} prices: {result.get('errors')}")
+            
+            price_list = result["data"]["priceList"]
+            if not price_list:
                 break
+            
+            edges = price_list["prices"]["edges"]
+            if not edges:
+                break
+            
+            for edge in edges:
+                node = edge["node"]
+                all_prices.append({
+                    "variantId": node["variant"]["id"],
+                    "price": node["price"]["amount"],
+                    "currency": node["price"]["currencyCode"],
+                    "compareAtPrice": node["compareAtPrice"]["amount"] if node.get("compareAtPrice") else None
+                })
+                cursor = edge["cursor"]
+            
+            has_next = price_list["prices"]["pageInfo"]["hasNextPage"]
         
         return all_prices
 
@@ -363,12 +808,14 @@ class PriceCache:
         
         Args:
             updates: Liste de {"market": str, "variant_id": str, "price": str, "compare_at_price": str}
-            save: Sauvegarder dans le fichier après mise à jour
+            save: Enregistrer les mises à jour dans le journal (WAL)
             
         Returns:
             Nombre de prix mis à jour
         """
         updated_count = 0
+        records = []
+        changes = {}
         
         for update in updates:
             market_name = update.get("market")
@@ -379,39 +826,130 @@ class PriceCache:
             if not market_name or not variant_id:
                 continue
             
-            if market_name not in self._cache:
+            if market_name not in self._store.markets:
                 logger.warning(f"Market {market_name} not in cache, skipping update")
                 continue
             
-            # Normaliser l'ID variant
-            if not variant_id.startswith("gid://"):
-                gid = f"gid://shopify/ProductVariant/{variant_id}"
-            else:
-                gid = variant_id
-            
-            # Mettre à jour le prix
-            if "prices" not in self._cache[market_name]:
-                self._cache[market_name]["prices"] = {}
-            
-            self._cache[market_name]["prices"][gid] = {
-                "price": str(new_price),
-                "compareAtPrice": str(compare_at) if compare_at else None,
-                "currency": self._cache[market_name].get("currency", "EUR")
-            }
+            record = (market_name, variant_key(variant_id), to_minor(new_price), to_minor(compare_at or None))
+            changes.setdefault(market_name, []).append(record[1:])
+            records.append(record)
             updated_count += 1
         
+        # Une seule nouvelle époque pour tout le lot (marchés touchés copiés)
+        self._store.update(changes)
+        
         if updated_count > 0:
             logger.info(f"Cache updated with {updated_count} new prices")
             self._last_refresh = datetime.now()
             
             if save:
-                self._save_to_file()
+                # Coût proportionnel au nombre de changements, pas à la taille du cache
+                try:
+                    self._wal.append(records)
+                except OSError as e:
+                    logger.error(f"Error writing price updates to WAL: {e}")
         
         return updated_count
     
+    async def refresh_variants(
+        self,
+        shopify_service,
+        variant_ids: Optional[List[str]] = None,
+        skus: Optional[List[str]] = None
+    ) -> dict:
+        """
+        Recharge les prix fixes de quelques variantes dans tous les marchés du cache
+        (lookups groupés, sans re-paginer les PriceLists) puis les applique
+        via update_prices. Les ids invalides sont signalés dans invalid_ids
+        sans empêcher le rafraîchissement des autres. Une requête Shopify en
+        échec lève une exception et rien n'est appliqué.
+        """
+        started = time.monotonic()
+        http_before = self._http_counters(shopify_service)
+        
+        keys = []
+        invalid_ids = []
+        for vid in variant_ids or []:
+            try:
+                keys.append(variant_key(vid))
+            except ValueError:
+                invalid_ids.append(vid)
+        keys = variant_keys(keys)
+        unknown_skus = []
+        if skus:
+            # Catalogue local d'abord, API pour les SKUs qu'il ne connaît pas (encore)
+            by_sku = product_catalog.variant_ids_by_sku(skus)
+            missing_skus = [sku for sku in skus if sku not in by_sku]
+            if missing_skus:
+                by_sku.update(await shopify_service.get_variant_ids_by_sku(missing_skus))
+            unknown_skus = [sku for sku in skus if sku not in by_sku]
+            keys = variant_keys(keys + variant_keys(by_sku.values()))
+        variant_ids = [variant_gid(key) for key in keys]
+        
+        markets_by_pricelist = {
+            market.price_list_id: name for name, market in self._store.markets.items()
+        }
+        
+        prices_by_pricelist = {}
+        if variant_ids and markets_by_pricelist:
+            prices_by_pricelist = await shopify_service.get_fixed_prices_for_variants(
+                variant_ids, list(markets_by_pricelist)
+            )
+        
+        updates = []
+        missing = {}
+        for price_list_id, prices in prices_by_pricelist.items():
+            market_name = markets_by_pricelist[price_list_id]
+            for p in prices:
+                updates.append({
+                    "market": market_name,
+                    "variant_id": p["variantId"],
+                    "price": p["price"],
+                    "compare_at_price": p["compareAtPrice"]
+                })
+            returned = {variant_key(p["variantId"]) for p in prices}
+            absent = [variant_gid(key) for key in keys if key not in returned]
+            if absent:
+                missing[market_name] = absent
+        
+        updated = self.update_prices(updates, save=True)
+        http_after = self._http_counters(shopify_service)
+        
+        logger.info(f"Variant refresh: {len(variant_ids)} variants × {len(markets_by_pricelist)} markets, {updated} prices updated")
+        return {
+            "variants": variant_ids,
+            "unknown_skus": unknown_skus,
+            "invalid_ids": invalid_ids,
+            "markets": len(markets_by_pricelist),
+            "updated": updated,
+            "missing": missing,
+            "http_requests": http_after["requests"] - http_before["requests"],
+            "duration_ms": round((time.monotonic() - started) * 1000)
+        }
+    
+    def compact(self) -> bool:
+        """Demande la réécriture du snapshot avec les mises à jour du journal"""
+        if not self._wal.records or self._loading:
+            return False
+        logger.info(f"Compacting {self._wal.records} WAL records into snapshot")
+        self._schedule_save()
+        return True
+    
+    async def run_compaction_loop(self):
+        """Tâche de fond : compacte le journal périodiquement ou quand il grossit"""
+        while True:
+            await asyncio.sleep(CACHE_WAL_CHECK_INTERVAL)
+            age = (datetime.now() - self._last_compaction).total_seconds()
+            if self._wal.records >= CACHE_WAL_COMPACT_RECORDS or age >= CACHE_WAL_COMPACT_INTERVAL:
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"WAL compaction failed: {e}")
+                self._last_compaction = datetime.now()
+    
     def get_all_markets(self) -> List[str]:
         """Retourne la liste de tous les marchés dans le cache"""
-        return list(self._cache.keys())
+        return list(self._store.markets.keys())
 
 
 # Instance globale du cache
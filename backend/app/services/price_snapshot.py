@@ -0,0 +1,255 @@
+"""
+Snapshot binaire du cache de prix, mappé en mémoire au démarrage
+
+Format (petit-boutiste pour l'en-tête, colonnes dans l'ordre natif) :
+    en-tête   : magic, version, nb marchés, nb variantes, taille méta, CRC32
+    méta      : JSON (table des marchés, époque, last_refresh, byteorder), aligné sur 8 octets
+    variantes : nb variantes × int64 (ids)
+    marchés   : pour chaque marché, colonne prix puis colonne compare-at
+                (nb variantes × int64 chacune, MISSING = pas de prix)
+
+Le CRC32 couvre tout ce qui suit l'en-tête.
+
+Les écritures passent par SnapshotWriter : un thread dédié, hors de la
+boucle asyncio, qui fusionne les demandes rapprochées en une seule écriture.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from typing import Callable, Optional, Tuple
+
+from app.services.price_store import MISSING, MarketPrices, PriceSnapshot, PriceStore, VariantIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"PRCACHE\x00"
+SNAPSHOT_VERSION = 1
+
+# magic, version, markets, variants, meta_size, crc32
+HEADER = struct.Struct("<8sIIQQI")
+
+ITEM_SIZE = array("q").itemsize
+
+
+def _padding(size: int) -> int:
+    return (-size) % 8
+
+
+def write_snapshot(path: str, snapshot: PriceSnapshot, last_refresh: Optional[str] = None) -> int:
+    """
+    Écrit le snapshot dans un fichier temporaire puis renomme (atomique).
+    Retourne la taille du fichier en octets.
+    """
+    # L'index est partagé et peut grandir pendant l'écriture : en figer une copie
+    ids = snapshot.variants.ids[:]
+    variants = len(ids)
+
+    market_table = []
+    for name, market in snapshot.markets.items():
+        market_table.append({
+            "name": name,
+            "marketId": market.market_id,
+            "currency": market.currency,
+            "priceListId": market.price_list_id,
+            "loadedAt": market.loaded_at,
+            "epoch": market.epoch,
+            "count": market.count
+        })
+
+    meta = json.dumps({
+        "markets": market_table,
+        "epoch": snapshot.epoch,
+        "last_refresh": last_refresh,
+        "byteorder": sys.byteorder
+    }).encode("utf-8")
+    meta += b"\x00" * _padding(len(meta))
+
+    temp_file = path + ".tmp"
+    crc = 0
+    with open(temp_file, "wb") as f:
+        # En-tête provisoire, réécrit avec le CRC à la fin
+        f.write(b"\x00" * HEADER.size)
+
+        def write(chunk):
+            nonlocal crc
+            crc = zlib.crc32(chunk, crc)
+            f.write(chunk)
+
+        write(meta)
+        write(ids)
+        for market in snapshot.markets.values():
+            for column in (market.price, market.compare_at):
+                write(column)
+                # Colonnes plus courtes que l'index : compléter avec MISSING
+                missing = variants - len(column)
+                if missing > 0:
+                    write(array("q", [MISSING]) * missing)
+
+        f.seek(0)
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(market_table), variants, len(meta), crc))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temp_file, path)
+    return os.path.getsize(path)
+
+
+def read_snapshot(path: str) -> Tuple[PriceStore, dict]:
+    """
+    Mappe le snapshot et reconstruit un PriceStore dont les colonnes
+    pointent directement dans le fichier (copiées seulement à l'écriture).
+    Lève ValueError si le fichier est invalide, d'une autre version ou corrompu.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mapped) < HEADER.size:
+        raise ValueError("Snapshot too short")
+
+    magic, version, markets_count, variants, meta_size, crc = HEADER.unpack_from(mapped, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Not a price cache snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version} (expected {SNAPSHOT_VERSION})")
+
+    view = memoryview(mapped)
+    expected_size = HEADER.size + meta_size + variants * ITEM_SIZE * (1 + 2 * markets_count)
+    if len(mapped) != expected_size:
+        raise ValueError(f"Snapshot size mismatch ({len(mapped)} bytes, expected {expected_size})")
+    if zlib.crc32(view[HEADER.size:]) != crc:
+        raise ValueError("Snapshot checksum mismatch")
+
+    offset = HEADER.size
+    meta = json.loads(bytes(view[offset:offset + meta_size]).rstrip(b"\x00"))
+    if meta.get("byteorder") != sys.byteorder:
+        raise ValueError(f"Snapshot written on a {meta.get('byteorder')}-endian host")
+    offset += meta_size
+
+    def column():
+        nonlocal offset
+        size = variants * ITEM_SIZE
+        data = view[offset:offset + size].cast("q")
+        offset += size
+        return data
+
+    variant_index = VariantIndex.from_ids(column())
+
+    markets = {}
+    for entry in meta["markets"]:
+        market = MarketPrices(entry["marketId"], entry["currency"], entry["priceListId"])
+        market.loaded_at = entry.get("loadedAt")
+        market.epoch = entry.get("epoch", 0)
+        market.price = column()
+        market.compare_at = column()
+        market.count = entry["count"]
+        markets[entry["name"]] = market
+
+    return PriceStore.restore(variant_index, markets, meta.get("epoch", 0)), meta
+
+
+class SnapshotWriter:
+    """
+    Thread d'écriture des snapshots.
+    submit() ne bloque jamais : la demande remplace celle en attente
+    (seule l'époque la plus récente est écrite), et le thread attend
+    coalesce_delay secondes avant d'écrire pour regrouper les demandes proches.
+    """
+
+    def __init__(self, path: str, coalesce_delay: float = 1.0):
+        self.path = path
+        self.coalesce_delay = coalesce_delay
+        self._condition = threading.Condition()
+        self._pending: Optional[tuple] = None
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "requested": 0,
+            "written": 0,
+            "coalesced": 0,
+            "failed": 0,
+            "last_epoch": None,
+            "last_written_at": None,
+            "last_duration_ms": None,
+            "last_size_bytes": None,
+            "last_error": None
+        }
+
+    def submit(
+        self,
+        snapshot: PriceSnapshot,
+        last_refresh: Optional[str],
+        on_written: Optional[Callable[[], None]] = None
+    ):
+        """Demande l'écriture de ce snapshot ; on_written est appelé (dans le thread) après succès"""
+        with self._condition:
+            self._stats["requested"] += 1
+            # Les callbacks des demandes fusionnées restent dus
+            callbacks = []
+            if self._pending is not None:
+                self._stats["coalesced"] += 1
+                callbacks = self._pending[2]
+            if on_written:
+                callbacks.append(on_written)
+            self._pending = (snapshot, last_refresh, callbacks)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="price-snapshot-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                self._busy = True
+
+            # Laisser arriver d'autres demandes, fusionnées dans _pending
+            time.sleep(self.coalesce_delay)
+
+            with self._condition:
+                snapshot, last_refresh, callbacks = self._pending
+                self._pending = None
+
+            started = time.monotonic()
+            try:
+                size = write_snapshot(self.path, snapshot, last_refresh)
+                for callback in callbacks:
+                    callback()
+                self._stats["written"] += 1
+                self._stats["last_epoch"] = snapshot.epoch
+                self._stats["last_written_at"] = time.time()
+                self._stats["last_size_bytes"] = size
+                self._stats["last_error"] = None
+                logger.info(f"Cache saved to snapshot: {self.path} ({size / (1024 * 1024):.1f} MB, epoch {snapshot.epoch})")
+            except Exception as e:
+                self._stats["failed"] += 1
+                self._stats["last_error"] = str(e)
+                logger.error(f"Error saving cache snapshot: {e}")
+            finally:
+                self._stats["last_duration_ms"] = round((time.monotonic() - started) * 1000)
+                with self._condition:
+                    self._busy = self._pending is not None
+                    self._condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Attend (bloquant) que toutes les demandes soient écrites ; False si timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending is not None or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            return {**self._stats, "pending": self._pending is not None, "busy": self._busy}
@@ -0,0 +1,506 @@
+"""
+Stockage colonnaire des prix du cache
+Un index de variantes partagé (ids entiers) + des colonnes typées par marché,
+avec les montants en unités mineures (centimes)
+
+Les lecteurs travaillent sur un PriceSnapshot immuable (une époque) : chaque
+publication ou lot de mises à jour crée un nouveau snapshot, les marchés
+modifiés étant copiés (copy-on-write) plutôt que modifiés en place.
+
+Les colonnes peuvent être des memoryview en lecture seule sur un snapshot
+mappé en mémoire (voir price_snapshot) : elles sont copiées en array
+à la première écriture.
+"""
+
+import sys
+from array import array
+from datetime import datetime
+from itertools import zip_longest
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from app.services.variant_ids import variant_gid, variant_key
+
+# Valeur sentinelle : pas de prix / pas de compare-at
+MISSING = -1
+
+def to_minor(amount) -> int:
+    """Montant ("129.99", 129.99, None) → unités mineures (12999) ou MISSING"""
+    if amount is None or amount == "":
+        return MISSING
+    return int(round(float(amount) * 100))
+
+
+def _writable(column) -> array:
+    """Colonne mappée (memoryview) → array modifiable ; array inchangé"""
+    if isinstance(column, array):
+        return column
+    copy = array("q")
+    copy.frombytes(column.cast("B"))
+    return copy
+
+
+def _copy_column(column) -> array:
+    if isinstance(column, array):
+        return column[:]
+    return _writable(column)
+
+
+def column_bytes(column) -> int:
+    if isinstance(column, array):
+        return column.buffer_info()[1] * column.itemsize
+    return column.nbytes
+
+
+def from_minor(value: int) -> Optional[str]:
+    """Unités mineures → montant texte ("129.99") ou None"""
+    if value == MISSING:
+        return None
+    return f"{value // 100}.{value % 100:02d}"
+
+
+def minor_amount(value: int) -> Optional[float]:
+    """Unités mineures → montant float (129.99) ou None"""
+    if value == MISSING:
+        return None
+    return value / 100
+
+
+class VariantIndex:
+    """Index partagé par tous les marchés : id de variante (int) → ligne"""
+
+    def __init__(self):
+        self.ids = array("q")
+        self._rows: Dict[int, int] = {}
+
+    @classmethod
+    def from_ids(cls, ids) -> "VariantIndex":
+        """Index reconstruit depuis une colonne d'ids (array ou memoryview)"""
+        index = cls()
+        index.ids = ids
+        index._rows = dict(zip(ids, range(len(ids))))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row(self, key: int) -> Optional[int]:
+        return self._rows.get(key)
+
+    def intern(self, key: int) -> int:
+        """Retourne la ligne de la variante, en l'ajoutant si besoin"""
+        row = self._rows.get(key)
+        if row is None:
+            row = len(self.ids)
+            self.ids = _writable(self.ids)
+            self.ids.append(key)
+            self._rows[key] = row
+        return row
+
+    def memory_bytes(self) -> int:
+        return (
+            column_bytes(self.ids)
+            + sys.getsizeof(self._rows)
+            + len(self._rows) * 2 * sys.getsizeof(2 ** 40)
+        )
+
+
+class MarketPrices:
+    """
+    Colonnes d'un marché, alignées sur l'index de variantes.
+    Une ligne au-delà de la longueur des colonnes = pas de prix.
+    """
+
+    __slots__ = ("market_id", "currency", "price_list_id", "loaded_at", "epoch", "price", "compare_at", "count")
+
+    def __init__(self, market_id: str, currency: str, price_list_id: str):
+        self.market_id = market_id
+        self.currency = currency
+        self.price_list_id = price_list_id
+        self.loaded_at: Optional[str] = None
+        # Époque à laquelle ces colonnes ont été publiées
+        self.epoch = 0
+        self.price = array("q")
+        self.compare_at = array("q")
+        self.count = 0
+
+    def clone(self) -> "MarketPrices":
+        """Copie modifiable (les colonnes publiées ne sont jamais modifiées en place)"""
+        market = MarketPrices(self.market_id, self.currency, self.price_list_id)
+        market.loaded_at = self.loaded_at
+        market.price = _copy_column(self.price)
+        market.compare_at = _copy_column(self.compare_at)
+        market.count = self.count
+        return market
+
+    def _ensure(self, row: int):
+        self.price = _writable(self.price)
+        self.compare_at = _writable(self.compare_at)
+        missing = row + 1 - len(self.price)
+        if missing > 0:
+            filler = array("q", [MISSING]) * missing
+            self.price.extend(filler)
+            self.compare_at.extend(filler)
+
+    def set(self, row: int, price: int, compare_at: int):
+        self._ensure(row)
+        # count = nombre de lignes avec un prix (MISSING efface une ligne)
+        self.count += (price != MISSING) - (self.price[row] != MISSING)
+        self.price[row] = price
+        self.compare_at[row] = compare_at
+
+    def get(self, row: Optional[int]) -> Optional[Tuple[int, int]]:
+        if row is None or row >= len(self.price):
+            return None
+        price = self.price[row]
+        if price == MISSING:
+            return None
+        return price, self.compare_at[row]
+
+    def memory_bytes(self) -> int:
+        return column_bytes(self.price) + column_bytes(self.compare_at)
+
+    def changed_rows(self, other: Optional["MarketPrices"]) -> int:
+        """Nombre de lignes dont le prix ou le compare-at diffère d'un autre chargement"""
+        if other is None:
+            return self.count
+        rows = zip_longest(self.price, self.compare_at, other.price, other.compare_at, fillvalue=MISSING)
+        return sum(1 for price, compare_at, old_price, old_compare_at in rows
+                   if price != old_price or compare_at != old_compare_at)
+
+
+class PriceBlock:
+    """
+    Prix de N variantes × M marchés : matrices (N, M) en unités mineures
+    + masque de présence (False = pas de prix, valeurs à MISSING)
+    """
+
+    __slots__ = ("markets", "columns", "currencies", "price", "compare_at", "present")
+
+    def __init__(self, markets: List[str], currencies: List[str], price: np.ndarray, compare_at: np.ndarray):
+        self.markets = markets
+        self.columns = {name: j for j, name in enumerate(markets)}
+        self.currencies = currencies
+        self.price = price
+        self.compare_at = compare_at
+        self.present = price != MISSING
+
+    @classmethod
+    def missing(cls, rows: int, markets: List[str], currencies: List[str]) -> "PriceBlock":
+        shape = (rows, len(markets))
+        return cls(markets, currencies, np.full(shape, MISSING, dtype=np.int64), np.full(shape, MISSING, dtype=np.int64))
+
+    @classmethod
+    def from_markets(cls, keys: List[Optional[int]], market_prices: Dict[str, Dict]) -> "PriceBlock":
+        """
+        Format get_variant_prices_by_market (clés GID, montants texte) → bloc
+        aligné sur keys, converti une seule fois
+        """
+        names = list(market_prices)
+        block = cls.missing(len(keys), names, [market_prices[name].get("currency") for name in names])
+        for j, name in enumerate(names):
+            prices = {
+                variant_key(variant_id): info
+                for variant_id, info in market_prices[name].get("prices", {}).items()
+            }
+            for i, key in enumerate(keys):
+                info = prices.get(key)
+                if info:
+                    block.price[i, j] = to_minor(info.get("price"))
+                    block.compare_at[i, j] = to_minor(info.get("compareAtPrice"))
+        block.present = block.price != MISSING
+        return block
+
+    def merge(self, other: "PriceBlock") -> "PriceBlock":
+        """Ajoute les marchés d'un autre bloc (mêmes variantes, même ordre)"""
+        if not other.markets:
+            return self
+        return PriceBlock(
+            self.markets + other.markets,
+            self.currencies + other.currencies,
+            np.hstack((self.price, other.price)),
+            np.hstack((self.compare_at, other.compare_at))
+        )
+
+    def markets_with_prices(self) -> int:
+        return int(self.present.any(axis=0).sum())
+
+
+class PriceMatrix:
+    """
+    Matrice dense variantes × marchés d'une époque (ligne = ligne de l'index
+    de variantes, colonne = marché), en ordre ligne : les prix d'une variante
+    dans tous les marchés sont contigus. Construite une fois par snapshot
+    depuis les colonnes des marchés, jamais modifiée ensuite.
+    """
+
+    __slots__ = ("columns", "currencies", "price", "compare_at", "present")
+
+    def __init__(self, rows: int, markets: Mapping[str, MarketPrices]):
+        self.columns = {name: j for j, name in enumerate(markets)}
+        self.currencies = [market.currency for market in markets.values()]
+        shape = (rows, len(self.columns))
+        self.price = np.full(shape, MISSING, dtype=np.int64)
+        self.compare_at = np.full(shape, MISSING, dtype=np.int64)
+        for j, market in enumerate(markets.values()):
+            for target, column in ((self.price, market.price), (self.compare_at, market.compare_at)):
+                values = np.frombuffer(column, dtype=np.int64)[:rows]
+                target[:len(values), j] = values
+        self.present = self.price != MISSING
+
+    def gather(self, rows: List[Optional[int]], market_names: List[str]) -> PriceBlock:
+        """Extrait le bloc (lignes × marchés) ; ligne None ou hors matrice = pas de prix"""
+        names = [name for name in market_names if name in self.columns]
+        currencies = [self.currencies[self.columns[name]] for name in names]
+        if not rows or not names or not len(self.price):
+            return PriceBlock.missing(len(rows), names, currencies)
+
+        index = np.fromiter((MISSING if row is None else row for row in rows), dtype=np.intp, count=len(rows))
+        valid = (index >= 0) & (index < len(self.price))
+        grid = np.ix_(np.where(valid, index, 0), [self.columns[name] for name in names])
+        keep = self.present[grid] & valid[:, None]
+        return PriceBlock(
+            names,
+            currencies,
+            np.where(keep, self.price[grid], MISSING),
+            np.where(keep, self.compare_at[grid], MISSING)
+        )
+
+    def memory_bytes(self) -> int:
+        return self.price.nbytes + self.compare_at.nbytes + self.present.nbytes
+
+
+def _price_info(market: MarketPrices, entry: Tuple[int, int]) -> dict:
+    return {
+        "price": from_minor(entry[0]),
+        "compareAtPrice": from_minor(entry[1]),
+        "currency": market.currency
+    }
+
+
+class PriceSnapshot:
+    """
+    Vue immuable du cache à une époque donnée.
+    Un lecteur qui garde une référence voit des prix cohérents même si
+    un chargement ou un Apply publie une nouvelle époque entre-temps.
+    """
+
+    __slots__ = ("epoch", "variants", "markets", "total_prices", "markets_bytes", "_matrix")
+
+    def __init__(
+        self,
+        epoch: int,
+        variants: VariantIndex,
+        markets: Dict[str, MarketPrices],
+        total_prices: int = 0,
+        markets_bytes: int = 0
+    ):
+        self.epoch = epoch
+        # Index partagé en ajout seul : les lignes existantes ne changent jamais
+        self.variants = variants
+        self.markets: Mapping[str, MarketPrices] = MappingProxyType(markets)
+        # Agrégats tenus à jour par PriceStore à chaque époque (status en O(1))
+        self.total_prices = total_prices
+        self.markets_bytes = markets_bytes
+        self._matrix: Optional[PriceMatrix] = None
+
+    def get(self, market_name: str, variant_id) -> Optional[dict]:
+        """Prix d'une variante au format du cache : {price, compareAtPrice, currency}"""
+        market = self.markets.get(market_name)
+        if market is None:
+            return None
+        entry = market.get(self.variants.row(variant_key(variant_id)))
+        if entry is None:
+            return None
+        return _price_info(market, entry)
+
+    def iter_market(self, market_name: str) -> Iterator[Tuple[int, int, int]]:
+        """(id variante, prix, compare-at) de tous les prix d'un marché"""
+        market = self.markets[market_name]
+        ids = self.variants.ids
+        for row, price in enumerate(market.price):
+            if price != MISSING:
+                yield ids[row], price, market.compare_at[row]
+
+    def ready_markets(self, market_names: List[str]) -> List[str]:
+        return [name for name in market_names if name in self.markets]
+
+    def market_data(self, market_name: str) -> Optional[dict]:
+        """Marché au format JSON historique (prix en texte, clés GID)"""
+        market = self.markets.get(market_name)
+        if market is None:
+            return None
+        return {
+            "marketId": market.market_id,
+            "currency": market.currency,
+            "priceListId": market.price_list_id,
+            "loadedAt": market.loaded_at,
+            "prices": {
+                variant_gid(key): _price_info(market, (price, compare_at))
+                for key, price, compare_at in self.iter_market(market_name)
+            }
+        }
+
+    def markets_summary(self) -> List[dict]:
+        return [
+            {"name": name, "currency": market.currency, "prices_count": market.count}
+            for name, market in self.markets.items()
+        ]
+
+    def prices_for_variants(self, variant_ids: List[str], market_names: List[str]) -> Dict[str, Dict]:
+        """Même format que ShopifyService.get_variant_prices_by_market"""
+        # Résoudre une seule fois les lignes de l'index
+        rows = []
+        for variant_id in variant_ids:
+            key = variant_key(variant_id)
+            row = self.variants.row(key)
+            if row is not None:
+                rows.append((variant_gid(key), row))
+
+        result = {}
+        for market_name in market_names:
+            market = self.markets.get(market_name)
+            if market is None:
+                continue
+
+            market_prices = {}
+            for gid, row in rows:
+                entry = market.get(row)
+                if entry:
+                    market_prices[gid] = _price_info(market, entry)
+
+            if market_prices:
+                result[market_name] = {
+                    "marketId": market.market_id,
+                    "currency": market.currency,
+                    "priceListId": market.price_list_id,
+                    "prices": market_prices
+                }
+        return result
+
+    def matrix(self) -> "PriceMatrix":
+        """Matrice variantes × marchés de cette époque, construite au premier appel"""
+        if self._matrix is None:
+            self._matrix = PriceMatrix(len(self.variants), self.markets)
+        return self._matrix
+
+    def gather(self, keys: List[Optional[int]], market_names: List[str]) -> "PriceBlock":
+        """
+        Prix de variantes (clés entières, None = inconnue) pour plusieurs marchés :
+        une seule indexation de la matrice, ligne i du bloc = keys[i]
+        """
+        rows = [None if key is None else self.variants.row(key) for key in keys]
+        return self.matrix().gather(rows, market_names)
+
+    def changed_markets(self, since_epoch: int, market_names: List[str]) -> List[str]:
+        """Marchés republiés ou modifiés après l'époque since_epoch"""
+        return [
+            name for name in market_names
+            if name in self.markets and self.markets[name].epoch > since_epoch
+        ]
+
+
+class PriceStore:
+    """
+    Index de variantes partagé + snapshot courant des marchés publiés.
+    Les écritures produisent un nouveau snapshot (époque + 1).
+    """
+
+    def __init__(self, epoch: int = 0):
+        self.variants = VariantIndex()
+        self.current = PriceSnapshot(epoch, self.variants, {})
+
+    @classmethod
+    def restore(cls, variants: VariantIndex, markets: Dict[str, MarketPrices], epoch: int) -> "PriceStore":
+        """Store reconstruit depuis un snapshot persisté"""
+        store = cls(epoch)
+        store.variants = variants
+        store.current = PriceSnapshot(
+            epoch,
+            variants,
+            markets,
+            sum(m.count for m in markets.values()),
+            sum(m.memory_bytes() for m in markets.values())
+        )
+        return store
+
+    @property
+    def markets(self) -> Mapping[str, MarketPrices]:
+        return self.current.markets
+
+    @property
+    def epoch(self) -> int:
+        return self.current.epoch
+
+    def _swap(self, markets: Dict[str, MarketPrices], changed_names: List[str]):
+        """Publie une nouvelle époque ; les agrégats ne sont recalculés que pour les marchés touchés"""
+        previous = self.current
+        epoch = previous.epoch + 1
+        total_prices = previous.total_prices
+        markets_bytes = previous.markets_bytes
+        for name in changed_names:
+            old = previous.markets.get(name)
+            if old is not None:
+                total_prices -= old.count
+                markets_bytes -= old.memory_bytes()
+            new = markets.get(name)
+            if new is not None:
+                new.epoch = epoch
+                total_prices += new.count
+                markets_bytes += new.memory_bytes()
+        self.current = PriceSnapshot(epoch, self.variants, markets, total_prices, markets_bytes)
+
+    def new_market(self, market_id: str, currency: str, price_list_id: str) -> MarketPrices:
+        """Colonnes vides d'un marché en cours de chargement (pas encore publiées)"""
+        return MarketPrices(market_id, currency, price_list_id)
+
+    def put(self, market: MarketPrices, variant_id, price, compare_at):
+        """Écrit un prix (montants texte ou float) dans un marché non publié"""
+        self.put_minor(market, variant_key(variant_id), to_minor(price), to_minor(compare_at))
+
+    def put_minor(self, market: MarketPrices, key: int, price: int, compare_at: int):
+        """Écrit un prix déjà converti (id entier, unités mineures) dans un marché non publié"""
+        market.set(self.variants.intern(key), price, compare_at)
+
+    def publish(self, market_name: str, market: MarketPrices):
+        market.loaded_at = datetime.now().isoformat()
+        self._swap({**self.current.markets, market_name: market}, [market_name])
+
+    def remove(self, market_names: List[str]):
+        removed = [name for name in market_names if name in self.current.markets]
+        if removed:
+            markets = {n: m for n, m in self.current.markets.items() if n not in removed}
+            self._swap(markets, removed)
+
+    def update(self, changes: Dict[str, List[Tuple[int, int, int]]]) -> int:
+        """
+        Applique des prix (id entier, prix, compare-at en unités mineures) à des
+        marchés publiés : chaque marché touché est copié, puis une seule nouvelle
+        époque est publiée. Retourne le nombre de prix écrits.
+        """
+        markets = dict(self.current.markets)
+        changed = []
+        written = 0
+        for market_name, rows in changes.items():
+            if market_name not in markets or not rows:
+                continue
+            market = markets[market_name].clone()
+            for key, price, compare_at in rows:
+                self.put_minor(market, key, price, compare_at)
+                written += 1
+            markets[market_name] = market
+            changed.append(market_name)
+        if changed:
+            self._swap(markets, changed)
+        return written
+
+    def get(self, market_name: str, variant_id) -> Optional[dict]:
+        return self.current.get(market_name, variant_id)
+
+    def iter_market(self, market_name: str) -> Iterator[Tuple[int, int, int]]:
+        return self.current.iter_market(market_name)
+
+    def memory_bytes(self) -> int:
+        return self.variants.memory_bytes() + self.current.markets_bytes
@@ -0,0 +1,107 @@
+"""
+Journal d'écriture (write-ahead log) des mises à jour du cache de prix
+Un enregistrement JSON par ligne, ajouté après chaque Apply (un fsync par lot)
+et rejoué au démarrage par-dessus le snapshot
+
+Avant chaque écriture de snapshot, le journal actif est scellé
+(price_cache.wal → price_cache.wal.<n>) ; les segments scellés ne sont
+supprimés qu'une fois le snapshot qui les contient écrit sur disque.
+"""
+
+import glob
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (marché, id variante, prix, compare-at) — montants en unités mineures
+WalRecord = Tuple[str, int, int, int]
+
+
+class PriceWAL:
+    """Fichier journal en ajout seul + segments scellés en attente de snapshot"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # Enregistrements du journal actif (pas encore scellés)
+        self.records = 0
+        self._next_segment = max(self._segments(), default=0) + 1
+        # Taille sur disque tenue à jour (pas de stat à chaque status)
+        self._active_bytes = os.path.getsize(path) if os.path.exists(path) else 0
+        self._sealed_bytes: Dict[int, int] = {
+            number: os.path.getsize(f"{path}.{number}") for number in self._segments()
+        }
+
+    def _segments(self) -> List[int]:
+        numbers = []
+        for segment in glob.glob(glob.escape(self.path) + ".*"):
+            suffix = segment.rsplit(".", 1)[-1]
+            if suffix.isdigit():
+                numbers.append(int(suffix))
+        return sorted(numbers)
+
+    def append(self, records: List[WalRecord]):
+        """Ajoute un lot d'enregistrements (une seule écriture + fsync)"""
+        if not records:
+            return
+        lines = "".join(
+            json.dumps({"m": market, "v": variant, "p": price, "c": compare_at}) + "\n"
+            for market, variant, price, compare_at in records
+        ).encode("utf-8")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.records += len(records)
+        self._active_bytes += len(lines)
+
+    def _read(self, path: str) -> Iterator[WalRecord]:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                    yield record["m"], record["v"], record["p"], record["c"]
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Skipping invalid WAL record at {path}:{line_number}: {e}")
+
+    def replay(self) -> Iterator[WalRecord]:
+        """
+        Relit les segments scellés puis le journal actif, dans l'ordre.
+        Une dernière ligne tronquée (arrêt brutal) est ignorée.
+        """
+        self.records = 0
+        paths = [f"{self.path}.{number}" for number in self._segments()]
+        if os.path.exists(self.path):
+            paths.append(self.path)
+        for path in paths:
+            for record in self._read(path):
+                self.records += 1
+                yield record
+
+    def seal(self) -> int:
+        """
+        Scelle le journal actif avant une écriture de snapshot.
+        Retourne le numéro de segment à passer à discard_sealed une fois
+        le snapshot écrit.
+        """
+        segment = self._next_segment
+        self._next_segment += 1
+        if os.path.exists(self.path):
+            os.replace(self.path, f"{self.path}.{segment}")
+            self._sealed_bytes[segment] = self._active_bytes
+        self.records = 0
+        self._active_bytes = 0
+        return segment
+
+    def discard_sealed(self, upto: int):
+        """Supprime les segments scellés désormais contenus dans le snapshot"""
+        for number in self._segments():
+            if number <= upto:
+                os.remove(f"{self.path}.{number}")
+                self._sealed_bytes.pop(number, None)
+
+    def size_bytes(self) -> int:
+        return self._active_bytes + sum(self._sealed_bytes.values())
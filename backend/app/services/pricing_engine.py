@@ -3,14 +3,8 @@ Moteur de calcul des prix pour Luxarmonie
 Gère toutes les transformations de prix selon les règles par pays
 """
 
-from app.config.countries import (
-    COUNTRIES, 
-    ENDINGS, 
-    NO_DECIMAL_CURRENCIES,
-    get_country_config,
-    get_ending_function,
-    format_price
-)
+from app.config.countries import COUNTRIES
+from app.services.pricing_rules import pricing_rules
 from typing import List, Dict, Optional
 from pydantic import BaseModel
 
@@ -40,18 +34,12 @@ class PricingEngine:
         self.countries = COUNTRIES.copy()
     
     def update_exchange_rate(self, country: str, new_rate: float) -> bool:
-        """Met à jour le taux de change d'un pays"""
-        if country in self.countries:
-            self.countries[country]["exchange_rate"] = new_rate
-            return True
-        return False
+        """Met à jour le taux de change d'un pays (plan de prix recompilé)"""
+        return pricing_rules.update_market(country, exchange_rate=new_rate) is not None
     
     def update_vat(self, country: str, new_vat: float) -> bool:
-        """Met à jour la TVA d'un pays"""
-        if country in self.countries:
-            self.countries[country]["vat"] = new_vat
-            return True
-        return False
+        """Met à jour la TVA d'un pays (plan de prix recompilé)"""
+        return pricing_rules.update_market(country, vat=new_vat) is not None
     
     def calculate_price(
         self, 
@@ -70,39 +58,30 @@ class PricingEngine:
         Returns:
             PriceCalculation avec tous les détails
         """
-        config = self.countries.get(country)
-        if not config:
+        plan = pricing_rules.plan(country)
+        if not plan.configured:
             return None
         
-        # 1. Ajustement de base
-        if config["adjustment"] == "vat" and operation.apply_vat:
-            # -12% puis +TVA
-            adjusted = base_price_eur * (1 + operation.base_adjustment) * (1 + config["vat"])
-        else:
-            # -10% simple
-            adjusted = base_price_eur * 0.90
-        
-        # 2. Conversion devise
-        converted = adjusted * config["exchange_rate"]
+        # 1-2. Ajustement de base (-12% puis +TVA, ou -10% simple) et conversion devise
+        converted = plan.convert(base_price_eur, operation.base_adjustment, operation.apply_vat)
         
         # 3. Appliquer la terminaison psychologique
-        ending_func = get_ending_function(config["ending"])
-        final_price = ending_func(converted)
+        final_price = plan.round(converted)
         
         # 4. Calculer le Compare At pour avoir exactement X% de réduction
         discount = operation.custom_discount if operation.custom_discount else operation.compare_at_markup
         compare_at_raw = final_price / (1 - discount)
-        compare_at = ending_func(compare_at_raw)
+        compare_at = plan.round(compare_at_raw)
         
         # 5. Calculer le % réel de réduction
         actual_discount = (compare_at - final_price) / compare_at if compare_at > 0 else 0
         
         return PriceCalculation(
             country=country,
-            currency=config["currency"],
+            currency=plan.currency,
             original_price=base_price_eur,
-            final_price=format_price(final_price, config["currency"]),
-            compare_at_price=format_price(compare_at, config["currency"]),
+            final_price=plan.format(final_price),
+            compare_at_price=plan.format(compare_at),
             discount_percentage=round(actual_discount * 100, 1)
         )
     
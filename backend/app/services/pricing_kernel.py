@@ -0,0 +1,124 @@
+"""
+Calcul vectorisé (NumPy) des prix sur un bloc variantes × marchés
+Une opération par famille de terminaison au lieu d'un appel Python par cellule ;
+résultats identiques aux fonctions scalaires ENDINGS de config/countries
+(mêmes opérations flottantes, arrondis au pair le plus proche comme round())
+"""
+
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+VectorEnding = Callable[[np.ndarray], np.ndarray]
+
+
+# ========================================
+# TERMINAISONS VECTORISÉES
+# ========================================
+
+def end_99(price: np.ndarray) -> np.ndarray:
+    """.99 (cf. round_99)"""
+    return np.floor(price) + 0.99
+
+
+def end_95(price: np.ndarray) -> np.ndarray:
+    """.95 (cf. round_95)"""
+    return np.floor(price) + 0.95
+
+
+def end_00(price: np.ndarray) -> np.ndarray:
+    """Entier le plus proche (cf. round_00)"""
+    return np.round(price)
+
+
+def end_9_int(price: np.ndarray) -> np.ndarray:
+    """Entier finissant en 9 (cf. round_9_int)"""
+    base = np.trunc(price)
+    last = np.mod(base, 10)
+    return np.where(last == 9, base, np.where(base >= 10, base - last + 9, 9.0))
+
+
+def end_000(price: np.ndarray) -> np.ndarray:
+    """Milliers, au moins 1000 (cf. round_000)"""
+    return np.maximum(np.round(price / 1000), 1) * 1000
+
+
+def end_990(price: np.ndarray) -> np.ndarray:
+    """990 / 90 / 9 selon l'ordre de grandeur (cf. round_990)"""
+    base = np.trunc(price)
+    return np.where(
+        base >= 10000,
+        np.floor_divide(base, 1000) * 1000 + 990,
+        np.where(base >= 1000, np.floor_divide(base, 100) * 100 + 90, np.floor_divide(base, 10) * 10 + 9)
+    )
+
+
+def end_kr(price: np.ndarray) -> np.ndarray:
+    """Multiples de 5 (cf. round_kr)"""
+    return np.round(price / 5) * 5
+
+
+VECTOR_ENDINGS: Dict[str, VectorEnding] = {
+    "99": end_99,
+    "95": end_95,
+    "00": end_00,
+    "9_int": end_9_int,
+    "000": end_000,
+    "990": end_990,
+    "kr": end_kr,
+}
+
+
+# ========================================
+# NOYAUX
+# ========================================
+
+def apply_endings(prices: np.ndarray, endings: List[VectorEnding]) -> np.ndarray:
+    """
+    Applique à chaque colonne (marché) sa terminaison : les colonnes qui
+    partagent une terminaison sont traitées en une seule opération
+    """
+    result = np.empty_like(prices, dtype=np.float64)
+    columns: Dict[VectorEnding, List[int]] = {}
+    for j, ending in enumerate(endings):
+        columns.setdefault(ending, []).append(j)
+    for ending, group in columns.items():
+        if len(group) == 1:
+            result[:, group[0]] = ending(prices[:, group[0]])
+        else:
+            result[:, group] = ending(prices[:, group])
+    return result
+
+
+def compare_at_block(prices: np.ndarray, discount_percent: float) -> np.ndarray:
+    """Compare-at affichant discount_percent de réduction (cf. calculate_compare_at)"""
+    if discount_percent <= 0 or discount_percent >= 1:
+        return prices
+    return prices / (1 - discount_percent)
+
+
+def discount_block(prices: np.ndarray, compare_at: np.ndarray) -> np.ndarray:
+    """% de réduction réel, entier arrondi ; 0 si compare-at ≤ prix"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percent = np.round((1 - prices / compare_at) * 100)
+    return np.where(compare_at > prices, percent, 0).astype(np.int64)
+
+
+def market_price_block(
+    current: np.ndarray,
+    endings: List[VectorEnding],
+    base_adjustment: float,
+    discount: float
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Mode prix marché de la preview, pour tout le bloc :
+    prix actuel × (1 + ajustement) → terminaison, compare-at avec terminaison
+    si discount > 0, puis % de réduction réel.
+    Retourne (nouveau prix, compare-at, % réduction).
+    """
+    new_price = apply_endings(current * (1 + base_adjustment), endings)
+    if discount > 0:
+        compare_at = apply_endings(compare_at_block(new_price, discount), endings)
+    else:
+        compare_at = new_price
+    return new_price, compare_at, discount_block(new_price, compare_at)
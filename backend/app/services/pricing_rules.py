@@ -0,0 +1,167 @@
+"""
+Registre des règles de prix par marché
+Compilé au démarrage depuis config/countries : chaque nom de marché (nom de la
+config, alias, variantes d'orthographe ou de casse des exports CSV) est résolu
+vers un PricingPlan précalculé — terminaison (scalaire et vectorisée),
+TVA / change / type d'ajustement, formatage de la devise.
+
+Les trois chemins de calcul (preview/apply, pricing_engine, CSV) passent par
+ce registre ; une résolution coûte un accès dict après le premier appel.
+"""
+
+import logging
+import unicodedata
+from typing import Dict, Optional
+
+from app.config.countries import COUNTRIES, ENDINGS, NO_DECIMAL_CURRENCIES
+from app.services.pricing_kernel import VECTOR_ENDINGS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENDING = "99"
+
+# Ajustement des marchés hors TVA (-10%)
+FLAT_ADJUSTMENT = 0.90
+
+# Noms rencontrés côté Shopify / CSV → nom de la config
+MARKET_ALIASES = {
+    "Germany": "Allemagne",
+    "Hong Kong": "Honk Hong",
+    "Tchéquie": "République tchèque",
+    "UAE": "Émirats Arabes Unis",
+    "Nouvelle": "Nouvelle Zélande",
+    "République Dominique": "République dominicaine",
+    "sal": "Salvador",
+    # Clé de config en majuscules : l'ancienne table du router ('Singapour')
+    # ne la trouvait pas et tronquait (floor) au lieu d'arrondir en .00
+    "Singapour": "SINGAPOUR",
+}
+
+# Marchés sans config pays mais avec une terminaison connue
+EXTRA_ENDINGS = {
+    "Autres": "00",
+}
+
+
+def normalize_market_name(name: str) -> str:
+    """'Bahrëin', 'BAHREÏN', 'bahrein ' → 'bahrein' (casse, accents, tirets, espaces)"""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.replace("-", " ").casefold().split())
+
+
+class PricingPlan:
+    """Règles précalculées d'un marché"""
+
+    __slots__ = (
+        "market", "ending", "round", "vector", "configured", "currency",
+        "vat", "exchange_rate", "adjustment", "vat_multiplier", "uses_vat", "decimals"
+    )
+
+    def __init__(self, market: str, ending: str, config: Optional[dict] = None):
+        self.market = market
+        self.ending = ending if ending in ENDINGS else DEFAULT_ENDING
+        self.round = ENDINGS[self.ending]
+        self.vector = VECTOR_ENDINGS[self.ending]
+        # Sans config pays : terminaison seulement (pas de conversion EUR)
+        self.configured = config is not None
+        config = config or {}
+        self.currency = config.get("currency")
+        self.vat = config.get("vat", 0)
+        self.exchange_rate = config.get("exchange_rate", 1)
+        self.adjustment = config.get("adjustment", "none")
+        self.uses_vat = self.adjustment == "vat"
+        self.vat_multiplier = 1 + self.vat
+        self.decimals = self.currency not in NO_DECIMAL_CURRENCIES
+
+    def convert(self, base_price_eur: float, base_adjustment: float, apply_vat: bool) -> float:
+        """
+        Prix EUR → prix local avant terminaison (-12% puis +TVA, ou -10% simple,
+        puis change). Les multiplications gardent l'ordre historique : un facteur
+        unique pré-multiplié changerait l'arrondi flottant de certains prix
+        pile sur une frontière de terminaison.
+        """
+        if self.uses_vat and apply_vat:
+            adjusted = base_price_eur * (1 + base_adjustment) * self.vat_multiplier
+        else:
+            adjusted = base_price_eur * FLAT_ADJUSTMENT
+        return adjusted * self.exchange_rate
+
+    def format(self, price: float) -> str:
+        """Prix affiché : entier pour les devises sans décimales"""
+        if self.decimals:
+            return f"{price:.2f}"
+        return str(int(price))
+
+
+class PricingRules:
+    """
+    Index nom de marché → PricingPlan
+    Noms exacts et normalisés indexés à la compilation ; les noms inconnus
+    reçoivent un plan par défaut (.99), mémorisé lui aussi.
+    """
+
+    def __init__(self, countries: Dict[str, dict]):
+        self._countries = countries
+        self._plans: Dict[str, PricingPlan] = {}
+        self._index: Dict[str, PricingPlan] = {}
+        self._resolved: Dict[str, PricingPlan] = {}
+        self.compile()
+
+    def compile(self):
+        plans = {
+            name: PricingPlan(name, config.get("ending", DEFAULT_ENDING), config)
+            for name, config in self._countries.items()
+        }
+        for name, ending in EXTRA_ENDINGS.items():
+            plans.setdefault(name, PricingPlan(name, ending))
+
+        index = {}
+        for name, plan in plans.items():
+            index[name] = plan
+            index.setdefault(normalize_market_name(name), plan)
+        for alias, name in MARKET_ALIASES.items():
+            index[alias] = plans[name]
+            index.setdefault(normalize_market_name(alias), plans[name])
+
+        self._plans = plans
+        self._index = index
+        self._resolved = {}
+        logger.info(f"Pricing rules compiled: {len(plans)} markets, {len(index)} names")
+
+    def plan(self, market: str) -> PricingPlan:
+        plan = self._resolved.get(market)
+        if plan is None:
+            plan = self._index.get(market) or self._index.get(normalize_market_name(market))
+            if plan is None:
+                plan = PricingPlan(market, DEFAULT_ENDING)
+            self._resolved[market] = plan
+        return plan
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+    def update_market(
+        self,
+        market: str,
+        exchange_rate: Optional[float] = None,
+        vat: Optional[float] = None
+    ) -> Optional[PricingPlan]:
+        """
+        Modifie le taux de change / la TVA d'un marché configuré (en mémoire)
+        et recompile son plan. Retourne None si le marché est inconnu.
+        """
+        plan = self.plan(market)
+        if not plan.configured:
+            return None
+        config = self._countries[plan.market]
+        if exchange_rate is not None:
+            config["exchange_rate"] = exchange_rate
+        if vat is not None:
+            config["vat"] = vat
+        self.compile()
+        return self._plans[plan.market]
+
+
+# Instance globale
+pricing_rules = PricingRules(COUNTRIES)
@@ -0,0 +1,500 @@
+"""
+Catalogue local des produits et variantes
+Les previews, la recherche produits et la résolution des SKU lisent ce
+catalogue en mémoire au lieu de re-télécharger le catalogue Shopify à chaque
+appel (et sans plafond de taille).
+
+Stockage : un enregistrement à slots par produit et par variante (ids en
+entiers, prix en unités mineures), persisté en lignes JSON compactes.
+
+Synchronisation :
+    - complète : tous les produits, puis toutes les variantes (connexion
+      productVariants à plat : pas de limite de variantes par produit) ;
+    - incrémentale : même requêtes filtrées par updated_at:>'…' depuis le
+      début de la synchronisation précédente (moins CATALOG_SYNC_OVERLAP pour
+      absorber le décalage d'horloge) ;
+    - les suppressions ne sont vues que par la synchronisation complète,
+      relancée toutes les CATALOG_FULL_SYNC_SECONDS.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.services.price_store import from_minor, to_minor
+from app.services.variant_ids import variant_gid, variant_key
+
+logger = logging.getLogger(__name__)
+
+# Même volume persistant que le cache de prix
+CACHE_DIR = os.environ.get("CACHE_DIR", "/app/cache")
+CATALOG_FILE = os.path.join(CACHE_DIR, "product_catalog.json")
+CATALOG_VERSION = 1
+
+# Lecture : synchronisation incrémentale si la dernière date de plus de N secondes
+CATALOG_MAX_AGE = int(os.environ.get("CATALOG_MAX_AGE", "60"))
+# Tâche de fond : synchronisation incrémentale périodique, complète plus rarement
+CATALOG_SYNC_INTERVAL = int(os.environ.get("CATALOG_SYNC_INTERVAL", "300"))
+CATALOG_FULL_SYNC_SECONDS = int(os.environ.get("CATALOG_FULL_SYNC_SECONDS", "86400"))
+# Recouvrement de la fenêtre updated_at (secondes)
+CATALOG_SYNC_OVERLAP = int(os.environ.get("CATALOG_SYNC_OVERLAP", "120"))
+
+# Coût d'une page ≈ 2 + 250 (un objet imbriqué par nœud) : sous la limite de 1000
+CATALOG_PAGE_SIZE = 250
+
+PRODUCT_GID_PREFIX = "gid://shopify/Product/"
+
+PRODUCTS_QUERY = """
+query CatalogProducts($first: Int!, $after: String, $query: String) {
+    products(first: $first, after: $after, query: $query) {
+        edges {
+            node {
+                id
+                title
+                handle
+                status
+                updatedAt
+                featuredImage {
+                    url(transform: {maxWidth: 100})
+                }
+            }
+            cursor
+        }
+        pageInfo {
+            hasNextPage
+        }
+    }
+}
+"""
+
+VARIANTS_QUERY = """
+query CatalogVariants($first: Int!, $after: String, $query: String) {
+    productVariants(first: $first, after: $after, query: $query) {
+        edges {
+            node {
+                id
+                sku
+                title
+                price
+                compareAtPrice
+                updatedAt
+                product {
+                    id
+                }
+            }
+            cursor
+        }
+        pageInfo {
+            hasNextPage
+        }
+    }
+}
+"""
+
+
+def product_key(product_id) -> int:
+    """gid://shopify/Product/123, "123" ou 123 → 123"""
+    if isinstance(product_id, int):
+        return product_id
+    return int(str(product_id).rsplit("/", 1)[-1])
+
+
+class VariantRecord:
+    """Variante du catalogue (prix en unités mineures)"""
+
+    __slots__ = ("key", "product_key", "sku", "title", "price", "compare_at", "updated_at")
+
+    def __init__(self, key: int, product_key: int, sku: str, title: str, price: int, compare_at: int, updated_at: str):
+        self.key = key
+        self.product_key = product_key
+        self.sku = sku
+        self.title = title
+        self.price = price
+        self.compare_at = compare_at
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_node(cls, node: dict) -> "VariantRecord":
+        return cls(
+            variant_key(node["id"]),
+            product_key(node["product"]["id"]),
+            node.get("sku") or "",
+            node.get("title") or "",
+            to_minor(node.get("price")),
+            to_minor(node.get("compareAtPrice")),
+            node.get("updatedAt") or ""
+        )
+
+    def to_row(self) -> list:
+        return [self.key, self.product_key, self.sku, self.title, self.price, self.compare_at, self.updated_at]
+
+    def to_dict(self) -> dict:
+        """Format des réponses Shopify (produit["variants"][i])"""
+        return {
+            "id": variant_gid(self.key),
+            "numericId": str(self.key),
+            "sku": self.sku,
+            "title": self.title,
+            "price": from_minor(self.price),
+            "compareAtPrice": from_minor(self.compare_at)
+        }
+
+
+class ProductRecord:
+    """Produit du catalogue ; variant_keys dans l'ordre de chargement"""
+
+    __slots__ = ("key", "title", "handle", "status", "image", "updated_at", "variant_keys", "search_text")
+
+    def __init__(self, key: int, title: str, handle: str, status: str, image: Optional[str], updated_at: str):
+        self.key = key
+        self.title = title
+        self.handle = handle
+        self.status = status
+        self.image = image
+        self.updated_at = updated_at
+        self.variant_keys: List[int] = []
+        self.search_text = ""
+
+    @classmethod
+    def from_node(cls, node: dict) -> "ProductRecord":
+        image = node.get("featuredImage")
+        return cls(
+            product_key(node["id"]),
+            node.get("title") or "",
+            node.get("handle") or "",
+            node.get("status") or "",
+            image.get("url") if image else None,
+            node.get("updatedAt") or ""
+        )
+
+    def to_row(self) -> list:
+        return [self.key, self.title, self.handle, self.status, self.image, self.updated_at]
+
+    def index(self, variants: Dict[int, VariantRecord]):
+        """Texte de recherche : titre, handle et SKUs en minuscules"""
+        skus = " ".join(variants[key].sku for key in self.variant_keys if key in variants)
+        self.search_text = f"{self.title} {self.handle} {skus}".casefold()
+
+    def to_dict(self, variants: Dict[int, VariantRecord]) -> dict:
+        """Format de get_all_products / search_products"""
+        return {
+            "id": f"{PRODUCT_GID_PREFIX}{self.key}",
+            "numericId": str(self.key),
+            "title": self.title,
+            "handle": self.handle,
+            "status": self.status,
+            "updatedAt": self.updated_at,
+            "featuredImage": {"url": self.image} if self.image else None,
+            "variants": [variants[key].to_dict() for key in self.variant_keys if key in variants]
+        }
+
+
+def _utc_iso(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class ProductCatalog:
+    """
+    Produits et variantes indexés par clé entière, SKU → variante.
+    Une synchronisation récupère toutes ses pages avant de modifier le
+    catalogue : les lecteurs ne voient jamais une synchronisation à moitié appliquée.
+    """
+
+    def __init__(self, path: str = CATALOG_FILE):
+        self.path = path
+        self._products: Dict[int, ProductRecord] = {}
+        self._variants: Dict[int, VariantRecord] = {}
+        self._by_sku: Dict[str, int] = {}
+        # Début de la dernière synchronisation réussie (UTC) : borne du filtre updated_at
+        self._synced_from: Optional[datetime] = None
+        self._last_full_sync: Optional[datetime] = None
+        self._last_sync_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._syncing = False
+        self._stats = {
+            "full_syncs": 0,
+            "incremental_syncs": 0,
+            "errors": 0,
+            "last_error": None,
+            "last_duration_ms": None,
+            "last_changes": None
+        }
+        self._load_from_file()
+
+    # ========================================
+    # PERSISTANCE
+    # ========================================
+
+    def _load_from_file(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CATALOG_VERSION:
+                logger.warning(f"Ignoring product catalog {self.path}: version {data.get('version')}")
+                return False
+
+            products = {row[0]: ProductRecord(*row) for row in data["products"]}
+            variants = {row[0]: VariantRecord(*row) for row in data["variants"]}
+            for variant in variants.values():
+                if variant.product_key in products:
+                    products[variant.product_key].variant_keys.append(variant.key)
+            self._replace(products, variants)
+            self._synced_from = datetime.fromisoformat(data["synced_from"]) if data.get("synced_from") else None
+            self._last_full_sync = datetime.fromisoformat(data["last_full_sync"]) if data.get("last_full_sync") else None
+            logger.info(f"Product catalog loaded from {self.path}: {len(products)} products, {len(variants)} variants")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading product catalog: {e}")
+            return False
+
+    def _serialize(self) -> bytes:
+        return json.dumps({
+            "version": CATALOG_VERSION,
+            "synced_from": self._synced_from.isoformat() if self._synced_from else None,
+            "last_full_sync": self._last_full_sync.isoformat() if self._last_full_sync else None,
+            "products": [p.to_row() for p in self._products.values()],
+            "variants": [v.to_row() for v in self._variants.values()]
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def _save(self):
+        """
+        Écriture atomique (fichier temporaire puis renommage), dans un thread.
+        Appelée sous le verrou de synchronisation : le catalogue ne change pas pendant l'écriture.
+        """
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_file = self.path + ".tmp"
+            with open(temp_file, "wb") as f:
+                f.write(self._serialize())
+            os.replace(temp_file, self.path)
+        except Exception as e:
+            logger.error(f"Error saving product catalog: {e}")
+
+    # ========================================
+    # SYNCHRONISATION
+    # ========================================
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._synced_from is not None
+
+    def _full_sync_due(self) -> bool:
+        return (
+            self._last_full_sync is None
+            or datetime.now(timezone.utc) - self._last_full_sync >= timedelta(seconds=CATALOG_FULL_SYNC_SECONDS)
+        )
+
+    async def sync(self, shopify_service, full: bool = False, max_age: Optional[float] = None) -> dict:
+        """
+        Synchronise le catalogue (complet si demandé, si jamais chargé ou si
+        la dernière synchronisation complète est trop ancienne).
+        Avec max_age, ne fait rien si la dernière synchronisation est plus récente.
+        Les appels concurrents s'attendent : le suivant voit le catalogue à jour.
+        """
+        async with self._lock:
+            if (
+                max_age is not None and not full and self.is_loaded
+                and self._last_sync_at is not None and time.monotonic() - self._last_sync_at < max_age
+            ):
+                return {"skipped": True}
+
+            full = full or not self.is_loaded or self._full_sync_due()
+            self._syncing = True
+            try:
+                return await self._run_sync(shopify_service, full)
+            except Exception as e:
+                self._stats["errors"] += 1
+                self._stats["last_error"] = str(e)
+                raise
+            finally:
+                self._syncing = False
+
+    async def _run_sync(self, shopify_service, full: bool) -> dict:
+        started = time.monotonic()
+        sync_start = datetime.now(timezone.utc)
+        search = None
+        if not full:
+            since = self._synced_from - timedelta(seconds=CATALOG_SYNC_OVERLAP)
+            search = f"updated_at:>'{_utc_iso(since)}'"
+
+        product_nodes = await self._fetch_all(shopify_service, PRODUCTS_QUERY, "products", search)
+        variant_nodes = await self._fetch_all(shopify_service, VARIANTS_QUERY, "productVariants", search)
+
+        # Toutes les pages sont là : appliquer sans point d'attente
+        products = {} if full else self._products
+        variants = {} if full else self._variants
+        touched = set()
+        for node in product_nodes:
+            record = ProductRecord.from_node(node)
+            previous = products.get(record.key)
+            if previous is not None:
+                record.variant_keys = previous.variant_keys
+            products[record.key] = record
+            touched.add(record.key)
+
+        orphans = 0
+        for node in variant_nodes:
+            record = VariantRecord.from_node(node)
+            product = products.get(record.product_key)
+            if product is None:
+                # Produit créé entre les deux requêtes : repris à la synchronisation suivante
+                orphans += 1
+                continue
+            previous = variants.get(record.key)
+            if previous is not None and previous.product_key != record.product_key:
+                old_product = products.get(previous.product_key)
+                if old_product is not None and record.key in old_product.variant_keys:
+                    old_product.variant_keys.remove(record.key)
+                    touched.add(old_product.key)
+            if record.key not in product.variant_keys:
+                product.variant_keys.append(record.key)
+            variants[record.key] = record
+            touched.add(product.key)
+
+        if full:
+            self._replace(products, variants)
+            self._last_full_sync = sync_start
+            self._stats["full_syncs"] += 1
+        else:
+            for key in touched:
+                products[key].index(variants)
+            self._reindex_skus()
+            self._stats["incremental_syncs"] += 1
+
+        self._synced_from = sync_start
+        self._last_sync_at = time.monotonic()
+        changes = {
+            "mode": "full" if full else "incremental",
+            "products": len(product_nodes),
+            "variants": len(variant_nodes),
+            "orphan_variants": orphans
+        }
+        self._stats["last_changes"] = changes
+        self._stats["last_duration_ms"] = round((time.monotonic() - started) * 1000)
+
+        if product_nodes or variant_nodes or full:
+            await asyncio.to_thread(self._save)
+
+        logger.info(
+            f"Product catalog {changes['mode']} sync: {changes['products']} products, "
+            f"{changes['variants']} variants changed ({len(self._products)} / {len(self._variants)} total) "
+            f"in {self._stats['last_duration_ms']}ms"
+        )
+        return changes
+
+    async def _fetch_all(self, shopify_service, query: str, field: str, search: Optional[str]) -> List[dict]:
+        """Toutes les pages d'une connexion ; un échec remonte (jamais de catalogue tronqué)"""
+        nodes = []
+        cursor = None
+        while True:
+            variables = {"first": CATALOG_PAGE_SIZE, "query": search}
+            if cursor:
+                variables["after"] = cursor
+            result = await shopify_service.execute_query(query, variables)
+            connection = (result.get("data") or {}).get(field)
+            if connection is None:
+                raise RuntimeError(f"Catalog {field} page failed after {len(nodes)} items: {result.get('errors')}")
+
+            for edge in connection["edges"]:
+                nodes.append(edge["node"])
+                cursor = edge["cursor"]
+            if not connection["edges"] or not connection["pageInfo"]["hasNextPage"]:
+                return nodes
+
+    def _replace(self, products: Dict[int, ProductRecord], variants: Dict[int, VariantRecord]):
+        for product in products.values():
+            product.index(variants)
+        self._products = products
+        self._variants = variants
+        self._reindex_skus()
+
+    def _reindex_skus(self):
+        self._by_sku = {v.sku: v.key for v in self._variants.values() if v.sku}
+
+    async def run_sync_scheduler(self, shopify_service):
+        """Tâche de fond : synchronisation incrémentale périodique (complète quand elle est due)"""
+        while True:
+            try:
+                await self.sync(shopify_service, max_age=CATALOG_SYNC_INTERVAL / 2)
+            except Exception as e:
+                logger.error(f"Scheduled catalog sync failed: {e}")
+            await asyncio.sleep(CATALOG_SYNC_INTERVAL)
+
+    async def ensure_fresh(self, shopify_service, max_age: float = CATALOG_MAX_AGE):
+        """
+        Avant une lecture : synchronisation incrémentale si le catalogue a plus
+        de max_age secondes. En cas d'échec, le catalogue connu reste servi
+        (s'il n'a jamais été chargé, l'erreur remonte).
+        """
+        try:
+            await self.sync(shopify_service, max_age=max_age)
+        except Exception as e:
+            if not self.is_loaded:
+                raise
+            logger.error(f"Catalog sync failed, serving {len(self._products)} known products: {e}")
+
+    # ========================================
+    # LECTURES
+    # ========================================
+
+    async def get_products(self, shopify_service) -> List[Dict]:
+        """Tous les produits avec leurs variantes (format get_all_products, sans plafond)"""
+        await self.ensure_fresh(shopify_service)
+        variants = self._variants
+        return [product.to_dict(variants) for product in self._products.values()]
+
+    async def get_product(self, shopify_service, product_id: str) -> Optional[Dict]:
+        await self.ensure_fresh(shopify_service)
+        try:
+            product = self._products.get(product_key(product_id))
+        except ValueError:
+            return None
+        return product.to_dict(self._variants) if product is not None else None
+
+    async def search(self, shopify_service, search: str = "", limit: int = 50) -> List[Dict]:
+        """Produits dont le titre, le handle ou un SKU contient tous les mots de la recherche"""
+        await self.ensure_fresh(shopify_service)
+        terms = search.casefold().split()
+        found = []
+        for product in self._products.values():
+            if all(term in product.search_text for term in terms):
+                found.append(product.to_dict(self._variants))
+                if len(found) >= limit:
+                    break
+        return found
+
+    async def find_sku(self, shopify_service, sku: str) -> Optional[Tuple[Dict, Dict]]:
+        """(produit, variante) du SKU exact, None si inconnu"""
+        await self.ensure_fresh(shopify_service)
+        key = self._by_sku.get(sku)
+        if key is None:
+            return None
+        variant = self._variants[key]
+        product = self._products[variant.product_key]
+        return product.to_dict(self._variants), variant.to_dict()
+
+    def variant_ids_by_sku(self, skus: List[str]) -> Dict[str, str]:
+        """SKU → GID de variante pour les SKUs connus du catalogue (sans synchronisation)"""
+        return {sku: variant_gid(self._by_sku[sku]) for sku in skus if sku in self._by_sku}
+
+    def get_status(self) -> dict:
+        return {
+            "loaded": self.is_loaded,
+            "syncing": self._syncing,
+            "products": len(self._products),
+            "variants": len(self._variants),
+            "synced_from": self._synced_from.isoformat() if self._synced_from else None,
+            "last_full_sync": self._last_full_sync.isoformat() if self._last_full_sync else None,
+            "age_seconds": round(time.monotonic() - self._last_sync_at, 1) if self._last_sync_at is not None else None,
+            **self._stats
+        }
+
+
+# Instance globale
+product_catalog = ProductCatalog()
@@ -3,15 +3,53 @@ Service Shopify GraphQL pour Luxarmonie
 V3 - Fix: matching marchés par nom + pagination produits + récupération tous produits
 """
 
-import httpx
+import asyncio
+import json
 import os
-from typing import List, Dict, Optional
+import time
+from typing import AsyncIterator, Callable, List, Dict, Optional
 import logging
 
+from app.services.http_pool import http_pool
+from app.services.market_registry import get_market_registry
+from app.services.product_catalog import product_catalog
+from app.services.single_flight import get_single_flight, get_single_flight_stats, is_mutation, request_key
+from app.services.shopify_retry import (
+    RETRY_MAX_ATTEMPTS,
+    RETRYABLE_STATUS,
+    backoff_delay,
+    classify_exception,
+    get_circuit_breaker,
+    get_retry_stats,
+    has_internal_error,
+    is_retry_safe,
+    parse_retry_after
+)
+from app.services.shopify_throttle import (
+    THROTTLE_MAX_RETRIES,
+    AdaptiveConcurrency,
+    get_throttle_scheduler,
+    get_throttle_stats,
+    is_throttled
+)
+from app.services.variant_ids import variant_key, variant_key_set, variant_keys
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bulk Operations : intervalle de polling et durée max d'attente (secondes)
+BULK_POLL_INTERVAL = float(os.environ.get("SHOPIFY_BULK_POLL_INTERVAL", "2"))
+BULK_TIMEOUT = float(os.environ.get("SHOPIFY_BULK_TIMEOUT", "1800"))
+
+# Lookups ciblés de prix fixes : variantes par requête et PriceLists en alias par requête
+# (25 variantes × 10 PriceLists ≈ 800 points, sous la limite de 1000 par requête)
+VARIANT_LOOKUP_BATCH = 25
+PRICE_LIST_ALIAS_BATCH = 10
+
+# Mises à jour de prix par mutation priceListFixedPricesAdd
+PRICE_UPDATE_BATCH = 100
+
 
 class ShopifyService:
     """Service de connexion à Shopify via GraphQL Admin API"""
@@ -31,6 +69,9 @@ class ShopifyService:
         
     @property
     def graphql_url(self) -> str:
+        # Un domaine avec schéma (http://127.0.0.1:8787) cible le serveur local de test
+        if self.shop_domain.startswith(("http://", "https://")):
+            return f"{self.shop_domain.rstrip('/')}/admin/api/{self.api_version}/graphql.json"
         return f"https://{self.shop_domain}/admin/api/{self.api_version}/graphql.json"
     
     @property
@@ -41,40 +82,169 @@ class ShopifyService:
         }
     
     async def execute_query(self, query: str, variables: dict = None) -> dict:
-        """Exécute une requête GraphQL"""
+        """
+        Exécute une requête GraphQL
+        Lecture identique (requête + variables) déjà en vol : réponse partagée,
+        sans nouvel appel Shopify. Les mutations partent toujours.
+        """
+        if is_mutation(query):
+            return await self._send_query(query, variables)
+        return await get_single_flight(self.shop_domain).run(
+            request_key(query, variables),
+            lambda: self._send_query(query, variables)
+        )
+    
+    async def _send_query(self, query: str, variables: dict = None) -> dict:
+        """
+        Envoie une requête GraphQL : bucket de coût, retries THROTTLED, retries
+        classés des échecs transitoires (backoff + jitter, Retry-After) et
+        circuit breaker (cf. shopify_retry)
+        """
         logger.info(f"Shopify request to: {self.graphql_url}")
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            payload = {"query": query}
-            if variables:
-                payload["variables"] = variables
-            
+        payload = {"query": query}
+        if variables:
+            payload["variables"] = variables
+        
+        # Bucket de coût partagé : attendre les points nécessaires plutôt qu'échouer
+        scheduler = get_throttle_scheduler(self.shop_domain)
+        cost = scheduler.estimate_cost(query, variables)
+        breaker = get_circuit_breaker(self.shop_domain)
+        retry_safe = is_retry_safe(query)
+        throttled_retries = 0
+        retries = 0
+        
+        while True:
+            breaker.before_request()
             try:
-                response = await client.post(
-                    self.graphql_url,
-                    json=payload,
-                    headers=self.headers
-                )
-                logger.info(f"Response status: {response.status_code}")
-                
-                result = response.json()
+                if scheduler.enabled:
+                    await scheduler.acquire(cost)
+                response, result, failure = await self._attempt(payload, breaker)
+            finally:
+                breaker.end_attempt()
+            
+            if result is not None:
+                scheduler.observe(query, variables, result)
+            
+            if failure is None:
+                if scheduler.enabled and is_throttled(result) and throttled_retries < THROTTLE_MAX_RETRIES:
+                    throttled_retries += 1
+                    scheduler.record_throttled()
+                    breaker.record_retry("throttled")
+                    cost = scheduler.estimate_cost(query, variables)
+                    logger.warning(f"Shopify THROTTLED, retrying ({throttled_retries}/{THROTTLE_MAX_RETRIES})")
+                    continue
                 
                 if "errors" in result:
                     logger.error(f"GraphQL errors: {result['errors']}")
                 
                 response.raise_for_status()
                 return result
-                
-            except Exception as e:
-                logger.error(f"Request failed: {str(e)}")
+            
+            reason, maybe_processed, retry_after, error = failure
+            if retries < RETRY_MAX_ATTEMPTS and (retry_safe or not maybe_processed):
+                delay = backoff_delay(retries, retry_after)
+                retries += 1
+                breaker.record_retry(reason)
+                logger.warning(f"Shopify {reason}, retrying in {delay:.2f}s ({retries}/{RETRY_MAX_ATTEMPTS})")
+                await asyncio.sleep(delay)
+                continue
+            
+            breaker.record_gave_up()
+            logger.error(f"Request failed after {retries} retries: {reason}")
+            if error is not None:
+                raise error
+            if result is not None:
+                return result
+            response.raise_for_status()
+    
+    async def _attempt(self, payload: dict, breaker) -> tuple:
+        """
+        Une tentative HTTP, classée pour le circuit breaker.
+        Retourne (réponse, résultat JSON, échec) ; échec = (raison, peut-être
+        traitée, Retry-After, exception) si la tentative est transitoire.
+        """
+        try:
+            # Client partagé (keep-alive + HTTP/2) au lieu d'un client par requête
+            response = await http_pool.post(
+                self.shop_domain,
+                self.graphql_url,
+                json=payload,
+                headers=self.headers
+            )
+        except Exception as e:
+            reason, transient, maybe_processed = classify_exception(e)
+            logger.error(f"Request failed: {str(e)}")
+            if not transient:
                 raise
+            breaker.record_failure(reason)
+            return None, None, (reason, maybe_processed, None, e)
+        
+        logger.info(f"Response status: {response.status_code}")
+        status = response.status_code
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        
+        if status == 429:
+            # Limitation, pas une panne : le circuit reste fermé
+            breaker.record_success()
+            return response, None, ("http_429", False, retry_after, None)
+        if status in RETRYABLE_STATUS:
+            breaker.record_failure(f"http_{status}")
+            return response, None, (f"http_{status}", True, retry_after, None)
+        
+        result = response.json()
+        if has_internal_error(result):
+            breaker.record_failure("graphql_internal")
+            return response, result, ("graphql_internal", True, None, None)
+        
+        breaker.record_success()
+        return response, result, None
+    
+    def open_http_pool(self):
+        """Ouvre le client HTTP partagé de la boutique"""
+        http_pool.open(self.shop_domain)
+    
+    def get_http_stats(self) -> dict:
+        """Statistiques de réutilisation des connexions"""
+        return http_pool.get_stats()
+    
+    def get_throttle_stats(self) -> dict:
+        """Statistiques du bucket de coût GraphQL"""
+        return get_throttle_stats()
+    
+    def get_retry_stats(self) -> dict:
+        """Retries par raison et état du circuit breaker"""
+        return get_retry_stats()
+    
+    def get_coalescing_stats(self) -> dict:
+        """Lectures partagées avec une requête identique déjà en vol"""
+        return get_single_flight_stats()
     
     # ========================================
     # MARKETS
     # ========================================
     
-    async def get_all_markets(self) -> List[Dict]:
-        """Récupère tous les marchés avec leurs catalogues et priceLists"""
+    async def get_all_markets(self, force_refresh: bool = False) -> List[Dict]:
+        """
+        Récupère tous les marchés avec leurs catalogues et priceLists
+        Servis par le registre en mémoire (TTL, chargement partagé entre appels concurrents)
+        """
+        return await get_market_registry(self.shop_domain).get_all(self._fetch_all_markets, force_refresh)
+    
+    async def get_market_by_name(self, market_name: str) -> Optional[Dict]:
+        """Marché par nom (registre en mémoire)"""
+        return await get_market_registry(self.shop_domain).by_name(market_name, self._fetch_all_markets)
+    
+    async def get_market_by_id(self, market_id: str) -> Optional[Dict]:
+        """Marché par GID ou ID numérique (registre en mémoire)"""
+        return await get_market_registry(self.shop_domain).by_id(market_id, self._fetch_all_markets)
+    
+    def invalidate_markets(self):
+        """Force le rechargement de la liste des marchés au prochain accès"""
+        get_market_registry(self.shop_domain).invalidate()
+    
+    async def _fetch_all_markets(self) -> List[Dict]:
+        """Charge la liste complète des marchés depuis Shopify ; lève une exception en cas d'échec"""
         query = """
         query GetMarkets($first: Int!, $after: String) {
             markets(first: $first, after: $after) {
@@ -114,27 +284,22 @@ class ShopifyService:
             if cursor:
                 variables["after"] = cursor
             
-            try:
-                result = await self.execute_query(query, variables)
-                
-                if "data" in result and "markets" in result["data"]:
-                    edges = result["data"]["markets"]["edges"]
-                    logger.info(f"Found {len(edges)} markets in this batch")
-                    
-                    for edge in edges:
-                        market = edge["node"]
-                        market["numericId"] = market["id"].split("/")[-1]
-                        all_markets.append(market)
-                        cursor = edge["cursor"]
-                    
-                    has_next = result["data"]["markets"]["pageInfo"]["hasNextPage"]
-                else:
-                    logger.warning(f"No data in result: {result}")
-                    has_next = False
-                    
-            except Exception as e:
-                logger.error(f"Failed to get markets: {str(e)}")
-                has_next = False
+            # Une liste partielle n'est pas mise en cache : toute erreur remonte
+            result = await self.execute_query(query, variables)
+            
+            if not (result.get("data") or {}).get("markets"):
+                raise RuntimeError(f"No markets data in result: {result.get('errors')}")
+            
+            edges = result["data"]["markets"]["edges"]
+            logger.info(f"Found {len(edges)} markets in this batch")
+            
+            for edge in edges:
+                market = edge["node"]
+                market["numericId"] = market["id"].split("/")[-1]
+                all_markets.append(market)
+                cursor = edge["cursor"]
+            
+            has_next = result["data"]["markets"]["pageInfo"]["hasNextPage"]
         
         logger.info(f"Total markets found: {len(all_markets)}")
         return all_markets
@@ -196,12 +361,13 @@ class ShopifyService:
         
         return []
     
-    async def get_all_products(self, max_products: int = 2000) -> List[Dict]:
+    async def get_all_products(self, max_products: Optional[int] = None) -> List[Dict]:
         """
-        Récupère TOUS les produits avec pagination
+        Récupère TOUS les produits avec pagination, directement depuis Shopify
+        (les previews lisent le catalogue local, voir product_catalog)
         
         Args:
-            max_products: Limite max de produits (défaut 2000)
+            max_products: Limite max de produits (défaut : aucune)
             
         Returns:
             Liste de tous les produits avec leurs variantes
@@ -244,40 +410,40 @@ class ShopifyService:
         cursor = None
         batch_size = 250  # Max Shopify permet
         
-        logger.info(f"Starting to fetch all products (max: {max_products})")
+        logger.info(f"Starting to fetch all products (max: {max_products or 'none'})")
         
-        while has_next and len(all_products) < max_products:
+        while has_next and (max_products is None or len(all_products) < max_products):
             variables = {"first": batch_size}
             if cursor:
                 variables["after"] = cursor
             
+            # Un échec (après retries) remonte au lieu de renvoyer un catalogue tronqué
             try:
                 result = await self.execute_query(query, variables)
-                
-                if "data" in result and "products" in result["data"]:
-                    edges = result["data"]["products"]["edges"]
-                    logger.info(f"Fetched {len(edges)} products (total: {len(all_products) + len(edges)})")
-                    
-                    for edge in edges:
-                        product = edge["node"]
-                        product["numericId"] = product["id"].split("/")[-1]
-                        product["variants"] = [
-                            {
-                                **v["node"],
-                                "numericId": v["node"]["id"].split("/")[-1]
-                            }
-                            for v in product["variants"]["edges"]
-                        ]
-                        all_products.append(product)
-                        cursor = edge["cursor"]
-                    
-                    has_next = result["data"]["products"]["pageInfo"]["hasNextPage"]
-                else:
-                    has_next = False
-                    
             except Exception as e:
-                logger.error(f"Failed to get products batch: {str(e)}")
-                has_next = False
+                logger.error(f"Failed to get products batch after {len(all_products)} products: {str(e)}")
+                raise
+            
+            if not (result.get("data") or {}).get("products"):
+                raise RuntimeError(f"Products page failed after {len(all_products)} products: {result.get('errors')}")
+            
+            edges = result["data"]["products"]["edges"]
+            logger.info(f"Fetched {len(edges)} products (total: {len(all_products) + len(edges)})")
+            
+            for edge in edges:
+                product = edge["node"]
+                product["numericId"] = product["id"].split("/")[-1]
+                product["variants"] = [
+                    {
+                        **v["node"],
+                        "numericId": v["node"]["id"].split("/")[-1]
+                    }
+                    for v in product["variants"]["edges"]
+                ]
+                all_products.append(product)
+                cursor = edge["cursor"]
+            
+            has_next = result["data"]["products"]["pageInfo"]["hasNextPage"]
         
         logger.info(f"Total products fetched: {len(all_products)}")
         return all_products
@@ -412,74 +578,67 @@ class ShopifyService:
         pages_fetched = 0
         max_pages = 100  # Limite de sécurité
         
-        # Convertir variant_ids en set pour lookup rapide
-        variant_ids_set = None
-        if variant_ids:
-            # Normaliser les IDs (garder les deux formats)
-            variant_ids_set = set()
-            for vid in variant_ids:
-                variant_ids_set.add(vid)
-                # Ajouter aussi l'ID numérique si c'est un GID
-                if vid.startswith("gid://"):
-                    variant_ids_set.add(vid.split("/")[-1])
-                else:
-                    # Ajouter le format GID complet
-                    variant_ids_set.add(f"gid://shopify/ProductVariant/{vid}")
+        # Filtre normalisé une fois en clés entières (GID ou ID numérique)
+        variant_ids_set = variant_key_set(variant_ids)
         
-        try:
-            while has_next and pages_fetched < max_pages:
-                variables = {"priceListId": gid, "first": first}
-                if cursor:
-                    variables["after"] = cursor
-                
+        while has_next and pages_fetched < max_pages:
+            variables = {"priceListId": gid, "first": first}
+            if cursor:
+                variables["after"] = cursor
+            
+            # Un échec (après retries) remonte : jamais de liste tronquée présentée comme complète
+            try:
                 result = await self.execute_query(query, variables)
-                pages_fetched += 1
+            except Exception as e:
+                logger.error(f"Failed to get price list prices after {len(all_prices)} prices: {str(e)}")
+                raise
+            pages_fetched += 1
+            
+            if not result.get("data"):
+                raise RuntimeError(f"Price list page failed after {len(all_prices)} prices: {result.get('errors')}")
+            
+            if result["data"]["priceList"]:
+                price_list = result["data"]["priceList"]
+                edges = price_list["prices"]["edges"]
                 
-                if "data" in result and result["data"]["priceList"]:
-                    price_list = result["data"]["priceList"]
-                    edges = price_list["prices"]["edges"]
-                    
-                    if not edges:
-                        break
+                if not edges:
+                    break
+                
+                for edge in edges:
+                    node = edge["node"]
+                    variant_id = node["variant"]["id"]
+                    key = variant_key(variant_id)
                     
-                    for edge in edges:
-                        node = edge["node"]
-                        variant_id = node["variant"]["id"]
-                        variant_numeric = variant_id.split("/")[-1]
-                        
-                        # Filtrer par variant_ids si fourni
-                        if variant_ids_set:
-                            if variant_id not in variant_ids_set and variant_numeric not in variant_ids_set:
-                                cursor = edge["cursor"]
-                                continue
-                        
-                        price_data = {
-                            "variantId": variant_id,
-                            "variantNumericId": variant_numeric,
-                            "price": node["price"]["amount"],
-                            "currency": node["price"]["currencyCode"],
-                            "compareAtPrice": node["compareAtPrice"]["amount"] if node.get("compareAtPrice") else None
-                        }
-                        all_prices.append(price_data)
+                    # Filtrer par variant_ids si fourni
+                    if variant_ids_set and key not in variant_ids_set:
                         cursor = edge["cursor"]
+                        continue
                     
-                    has_next = price_list["prices"]["pageInfo"]["hasNextPage"]
-                    
-                    # OPTIMISATION: Si on a trouvé tous les variant_ids demandés, on arrête
-                    if variant_ids_set and len(all_prices) >= len(variant_ids):
-                        logger.info(f"Found all {len(all_prices)} requested prices, stopping pagination")
-                        break
-                    
-                    # Log progress tous les 10 pages
-                    if pages_fetched % 10 == 0:
-                        logger.info(f"PriceList {gid}: page {pages_fetched}, found {len(all_prices)} prices so far")
-                    
-                else:
-                    has_next = False
-                    
-        except Exception as e:
-            logger.error(f"Failed to get price list prices: {str(e)}")
-        
+                    price_data = {
+                        "variantId": variant_id,
+                        "variantNumericId": str(key),
+                        "price": node["price"]["amount"],
+                        "currency": node["price"]["currencyCode"],
+                        "compareAtPrice": node["compareAtPrice"]["amount"] if node.get("compareAtPrice") else None
+                    }
+                    all_prices.append(price_data)
+                    cursor = edge["cursor"]
+                
+                has_next = price_list["prices"]["pageInfo"]["hasNextPage"]
+                
+                # OPTIMISATION: Si on a trouvé tous les variant_ids demandés, on arrête
+                if variant_ids_set and len(all_prices) >= len(variant_ids_set):
+                    logger.info(f"Found all {len(all_prices)} requested prices, stopping pagination")
+                    break
+                
+                # Log progress tous les 10 pages
+                if pages_fetched % 10 == 0:
+                    logger.info(f"PriceList {gid}: page {pages_fetched}, found {len(all_prices)} prices so far")
+                
+            else:
+                has_next = False
+                
+
         logger.info(f"PriceList {gid}: completed with {len(all_prices)} prices after {pages_fetched} pages")
         return all_prices
     
@@ -491,6 +650,7 @@ class ShopifyService:
         """
         Récupère les prix de variantes pour plusieurs marchés
         OPTIMISÉ: Parallélisation + limite de pagination stricte
+        Un marché en échec fait échouer l'appel (pas de résultat partiel silencieux)
         """
         import asyncio
         
@@ -527,37 +687,32 @@ class ShopifyService:
                     variant_ids=variant_ids,
                     max_pages=10  # Limite stricte
                 )
-                
-                market_prices = {}
-                for p in prices:
-                    market_prices[p["variantId"]] = {
-                        "price": p["price"],
-                        "compareAtPrice": p["compareAtPrice"],
-                        "currency": p["currency"]
-                    }
-                
-                return market_name, {
-                    "marketId": market["id"],
-                    "currency": price_list["currency"],
-                    "priceListId": price_list["id"],
-                    "prices": market_prices
-                }
             except Exception as e:
                 logger.error(f"Error processing market {market_name}: {e}")
-                return market_name, None
+                raise
+            
+            market_prices = {}
+            for p in prices:
+                market_prices[p["variantId"]] = {
+                    "price": p["price"],
+                    "compareAtPrice": p["compareAtPrice"],
+                    "currency": p["currency"]
+                }
+            
+            return market_name, {
+                "marketId": market["id"],
+                "currency": price_list["currency"],
+                "priceListId": price_list["id"],
+                "prices": market_prices
+            }
         
         # Traiter les marchés en parallèle par batches de 5
         batch_size = 5
         for i in range(0, len(markets_to_process), batch_size):
             batch = markets_to_process[i:i + batch_size]
             tasks = [process_market(m) for m in batch]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for res in results:
-                if isinstance(res, Exception):
-                    continue
-                if res and res[1]:
-                    result[res[0]] = res[1]
+            for market_name, market_result in await asyncio.gather(*tasks):
+                result[market_name] = market_result
         
         logger.info(f"Prices fetched for {len(result)} markets")
         return result
@@ -598,62 +753,165 @@ class ShopifyService:
         cursor = None
         pages = 0
         
-        # Normaliser variant_ids
-        variant_ids_set = set()
-        if variant_ids:
-            for vid in variant_ids:
-                variant_ids_set.add(vid)
-                if vid.startswith("gid://"):
-                    variant_ids_set.add(vid.split("/")[-1])
-                else:
-                    variant_ids_set.add(f"gid://shopify/ProductVariant/{vid}")
+        # Filtre normalisé une fois en clés entières
+        variant_ids_set = variant_key_set(variant_ids)
         
-        try:
-            while has_next and pages < max_pages:
-                variables = {"priceListId": gid, "first": 250}
-                if cursor:
-                    variables["after"] = cursor
-                
+        while has_next and pages < max_pages:
+            variables = {"priceListId": gid, "first": 250}
+            if cursor:
+                variables["after"] = cursor
+            
+            try:
                 result = await self.execute_query(query, variables)
-                pages += 1
+            except Exception as e:
+                logger.error(f"Error in get_price_list_prices_fast after {len(all_prices)} prices: {e}")
+                raise
+            pages += 1
+            
+            if not result.get("data"):
+                raise RuntimeError(f"Price list page failed after {len(all_prices)} prices: {result.get('errors')}")
+            
+            if result["data"]["priceList"]:
+                price_list = result["data"]["priceList"]
+                edges = price_list["prices"]["edges"]
+                
+                if not edges:
+                    break
                 
-                if "data" in result and result["data"]["priceList"]:
-                    price_list = result["data"]["priceList"]
-                    edges = price_list["prices"]["edges"]
+                for edge in edges:
+                    node = edge["node"]
+                    variant_id = node["variant"]["id"]
+                    key = variant_key(variant_id)
+                    cursor = edge["cursor"]
                     
-                    if not edges:
-                        break
+                    if variant_ids_set and key not in variant_ids_set:
+                        continue
                     
-                    for edge in edges:
+                    all_prices.append({
+                        "variantId": variant_id,
+                        "variantNumericId": str(key),
+                        "price": node["price"]["amount"],
+                        "currency": node["price"]["currencyCode"],
+                        "compareAtPrice": node["compareAtPrice"]["amount"] if node.get("compareAtPrice") else None
+                    })
+                
+                has_next = price_list["prices"]["pageInfo"]["hasNextPage"]
+                
+                # Arrêt anticipé si tous trouvés
+                if variant_ids_set and len(all_prices) >= len(variant_ids_set):
+                    break
+            else:
+                break
+                
+
+        return all_prices
+    
+    async def get_variant_ids_by_sku(self, skus: List[str]) -> Dict[str, str]:
+        """
+        Résout des SKUs en GID de variantes
+        Un appel productVariants(query: "sku:A OR sku:B ...") par lot
+        """
+        query = """
+        query GetVariantsBySku($first: Int!, $query: String!) {
+            productVariants(first: $first, query: $query) {
+                edges {
+                    node {
+                        id
+                        sku
+                    }
+                }
+            }
+        }
+        """
+        
+        wanted = set(skus)
+        found = {}
+        for i in range(0, len(skus), VARIANT_LOOKUP_BATCH):
+            batch = skus[i:i + VARIANT_LOOKUP_BATCH]
+            search = " OR ".join(f'sku:"{sku}"' for sku in batch)
+            try:
+                result = await self.execute_query(query, {"first": len(batch) * 2, "query": search})
+            except Exception as e:
+                logger.error(f"Failed to resolve SKUs {batch}: {e}")
+                raise
+            if not result.get("data"):
+                raise RuntimeError(f"SKU lookup failed for {batch}: {result.get('errors')}")
+            for edge in result["data"]["productVariants"]["edges"]:
+                node = edge["node"]
+                if node.get("sku") in wanted:
+                    found[node["sku"]] = node["id"]
+        
+        return found
+    
+    async def get_fixed_prices_for_variants(
+        self,
+        variant_ids: List[str],
+        price_list_ids: List[str]
+    ) -> Dict[str, List[Dict]]:
+        """
+        Prix fixes de quelques variantes dans plusieurs PriceLists, sans pagination
+        Chaque requête interroge jusqu'à PRICE_LIST_ALIAS_BATCH PriceLists (alias pl0, pl1...)
+        filtrées sur un lot de VARIANT_LOOKUP_BATCH variantes : le nombre d'appels
+        dépend du nombre de variantes demandées, pas de la taille des PriceLists.
+        
+        Returns:
+            {price_list_id: [{"variantId", "price", "compareAtPrice", "currency"}]}
+        """
+        keys = variant_keys(variant_ids)
+        result = {price_list_id: [] for price_list_id in price_list_ids}
+        
+        for i in range(0, len(keys), VARIANT_LOOKUP_BATCH):
+            variant_batch = keys[i:i + VARIANT_LOOKUP_BATCH]
+            search = " OR ".join(f"variant_id:{key}" for key in variant_batch)
+            
+            for j in range(0, len(price_list_ids), PRICE_LIST_ALIAS_BATCH):
+                list_batch = price_list_ids[j:j + PRICE_LIST_ALIAS_BATCH]
+                
+                params = "".join(f", $pl{k}: ID!" for k in range(len(list_batch)))
+                aliases = "".join(
+                    f"""
+            pl{k}: priceList(id: $pl{k}) {{
+                id
+                prices(first: $first, query: $query) {{
+                    edges {{
+                        node {{
+                            variant {{ id }}
+                            price {{ amount currencyCode }}
+                            compareAtPrice {{ amount }}
+                        }}
+                    }}
+                }}
+            }}"""
+                    for k in range(len(list_batch))
+                )
+                query = f"query VariantFixedPrices($first: Int!, $query: String!{params}) {{{aliases}\n        }}"
+                
+                variables = {"first": len(variant_batch), "query": search}
+                variables.update({f"pl{k}": price_list_id for k, price_list_id in enumerate(list_batch)})
+                
+                # Un échec remonte : sinon les variantes non lues passeraient pour absentes
+                try:
+                    response = await self.execute_query(query, variables)
+                except Exception as e:
+                    logger.error(f"Failed to fetch fixed prices for {len(variant_batch)} variants: {e}")
+                    raise
+                data = response.get("data")
+                if not data:
+                    raise RuntimeError(f"Fixed prices lookup failed: {response.get('errors')}")
+                for k, price_list_id in enumerate(list_batch):
+                    price_list = data.get(f"pl{k}")
+                    if not price_list:
+                        continue
+                    for edge in price_list["prices"]["edges"]:
                         node = edge["node"]
-                        variant_id = node["variant"]["id"]
-                        variant_numeric = variant_id.split("/")[-1]
-                        cursor = edge["cursor"]
-                        
-                        if variant_ids_set:
-                            if variant_id not in variant_ids_set and variant_numeric not in variant_ids_set:
-                                continue
-                        
-                        all_prices.append({
-                            "variantId": variant_id,
-                            "variantNumericId": variant_numeric,
+                        result[price_list_id].append({
+                            "variantId": node["variant"]["id"],
                             "price": node["price"]["amount"],
                             "currency": node["price"]["currencyCode"],
                             "compareAtPrice": node["compareAtPrice"]["amount"] if node.get("compareAtPrice") else None
                         })
-                    
-                    has_next = price_list["prices"]["pageInfo"]["hasNextPage"]
-                    
-                    # Arrêt anticipé si tous trouvés
-                    if variant_ids_set and len(all_prices) >= len(variant_ids):
-                        break
-                else:
-                    break
-                    
-        except Exception as e:
-            logger.error(f"Error in get_price_list_prices_fast: {e}")
         
-        return all_prices
+        return result
     
     async def update_catalog_prices(
         self, 
@@ -717,60 +975,122 @@ class ShopifyService:
             market_name: Nom du marché ("France", "Australie", etc.)
             updates: Liste de {variant_id, price, compare_at_price}
         """
-        # Trouver le marché et sa PriceList
-        markets = await self.get_all_markets()
+        bulk = await self.bulk_update_markets({market_name: updates})
+        return bulk["markets"][market_name]
+    
+    async def bulk_update_markets(
+        self,
+        updates_by_market: Dict[str, List[Dict]],
+        on_market_done: Optional[Callable[[str, Dict], None]] = None
+    ) -> Dict:
+        """
+        Met à jour les prix de plusieurs marchés : les lots de PRICE_UPDATE_BATCH
+        de tous les marchés partent en parallèle, sous une limite de concurrence
+        adaptée au bucket de coût et au taux d'erreur (AdaptiveConcurrency).
         
-        target_market = None
-        for market in markets:
-            if market["name"] == market_name:
-                target_market = market
-                break
+        Args:
+            updates_by_market: {nom du marché: [{variant_id, price, compare_at_price}]}
+            on_market_done: appelé avec (marché, résultat) dès qu'un marché est terminé
         
-        if not target_market:
-            return {"success": False, "error": f"Market '{market_name}' not found"}
-        
-        price_list = target_market.get("priceList")
-        if not price_list:
-            return {"success": False, "error": f"Market '{market_name}' has no PriceList"}
-        
-        # Formater les updates
-        price_updates = []
-        for update in updates:
-            price_updates.append({
-                "variantId": update["variant_id"],
-                "price": update["price"],
-                "compareAtPrice": update.get("compare_at_price"),
-                "currencyCode": price_list["currency"]
-            })
+        Returns:
+            {"markets": {marché: {success, updated, errors}}, "concurrency": stats}
+        """
+        # Trouver les marchés et leurs PriceLists (une seule fois pour tous)
+        markets = {market["name"]: market for market in await self.get_all_markets()}
         
-        # Appliquer par batches de 100
-        batch_size = 100
-        results = {"success": True, "updated": 0, "errors": []}
+        results: Dict[str, Dict] = {}
+        pending: Dict[str, int] = {}
+        jobs = []
         
-        for i in range(0, len(price_updates), batch_size):
-            batch = price_updates[i:i + batch_size]
+        def finish(market_name: str):
+            result = results[market_name]
+            result["success"] = "error" not in result and len(result["errors"]) == 0
+            if on_market_done:
+                on_market_done(market_name, result)
+        
+        for market_name, updates in updates_by_market.items():
+            target_market = markets.get(market_name)
+            if not target_market:
+                results[market_name] = {"success": False, "updated": 0, "errors": [], "error": f"Market '{market_name}' not found"}
+                finish(market_name)
+                continue
+            
+            price_list = target_market.get("priceList")
+            if not price_list:
+                results[market_name] = {"success": False, "updated": 0, "errors": [], "error": f"Market '{market_name}' has no PriceList"}
+                finish(market_name)
+                continue
             
-            result = await self.update_catalog_prices(price_list["id"], batch)
+            # Formater les updates
+            price_updates = []
+            for update in updates:
+                price_updates.append({
+                    "variantId": update["variant_id"],
+                    "price": update["price"],
+                    "compareAtPrice": update.get("compare_at_price"),
+                    "currencyCode": price_list["currency"]
+                })
             
-            if "error" in result:
-                results["errors"].append(result["error"])
-            elif "data" in result:
-                user_errors = result["data"].get("priceListFixedPricesAdd", {}).get("userErrors", [])
-                if user_errors:
-                    for err in user_errors:
-                        results["errors"].append(f"{err['field']}: {err['message']}")
+            results[market_name] = {"success": True, "updated": 0, "errors": []}
+            batches = [
+                price_updates[i:i + PRICE_UPDATE_BATCH]
+                for i in range(0, len(price_updates), PRICE_UPDATE_BATCH)
+            ]
+            pending[market_name] = len(batches)
+            if not batches:
+                finish(market_name)
+            jobs.extend((market_name, price_list["id"], batch) for batch in batches)
+        
+        concurrency = AdaptiveConcurrency(get_throttle_scheduler(self.shop_domain))
+        
+        async def send(market_name: str, price_list_id: str, batch: List[Dict]):
+            ok = False
+            market_result = results[market_name]
+            try:
+                result = await self.update_catalog_prices(price_list_id, batch)
+                data = result.get("data") or {}
+                
+                if "error" in result:
+                    market_result["errors"].append(result["error"])
+                elif not data and result.get("errors"):
+                    market_result["errors"].append(f"GraphQL errors: {result['errors']}")
                 else:
-                    results["updated"] += len(batch)
+                    # Erreurs de validation : le lot est passé, pas un signal de surcharge
+                    ok = True
+                    user_errors = (data.get("priceListFixedPricesAdd") or {}).get("userErrors", [])
+                    if user_errors:
+                        for err in user_errors:
+                            market_result["errors"].append(f"{err['field']}: {err['message']}")
+                    else:
+                        market_result["updated"] += len(batch)
+            except Exception as e:
+                # Lot en échec (après retries / circuit ouvert) : erreur du marché, pas de l'appel
+                logger.error(f"Price update batch failed for {market_name}: {e}")
+                market_result["errors"].append(str(e))
+            finally:
+                await concurrency.release(ok)
+                pending[market_name] -= 1
+                if pending[market_name] == 0:
+                    finish(market_name)
+        
+        # Lots dans l'ordre des marchés : les premiers marchés se terminent en premier
+        tasks = []
+        for job in jobs:
+            await concurrency.acquire()
+            tasks.append(asyncio.create_task(send(*job)))
+        await asyncio.gather(*tasks)
         
-        results["success"] = len(results["errors"]) == 0
-        return results
+        stats = concurrency.get_stats()
+        logger.info(f"Bulk update: {len(jobs)} batches over {len(updates_by_market)} markets, concurrency {stats}")
+        return {"markets": results, "concurrency": stats}
     
     async def get_all_products_with_variants(self) -> List[Dict]:
         """
-        Récupère tous les produits avec leurs variantes pour les promos aléatoires.
+        Récupère tous les produits avec leurs variantes pour les promos aléatoires
+        (catalogue local, sans plafond).
         Retourne une liste de produits avec id, title et variants.
         """
-        products = await self.get_all_products(max_products=5000)
+        products = await product_catalog.get_products(self)
         
         # Transformer le format pour les promos
         result = []
@@ -792,6 +1112,100 @@ class ShopifyService:
         
         logger.info(f"Retrieved {len(result)} products with variants for random promo")
         return result
+    
+    # ========================================
+    # BULK OPERATIONS (JSONL)
+    # ========================================
+    
+    async def run_bulk_query(self, bulk_query: str) -> Dict:
+        """
+        Lance une bulkOperationRunQuery et attend sa fin (polling).
+        Retourne l'opération terminée (status, objectCount, url du JSONL).
+        """
+        mutation = """
+        mutation RunBulkQuery($query: String!) {
+            bulkOperationRunQuery(query: $query) {
+                bulkOperation {
+                    id
+                    status
+                }
+                userErrors {
+                    field
+                    message
+                }
+            }
+        }
+        """
+        
+        result = await self.execute_query(mutation, {"query": bulk_query})
+        payload = (result.get("data") or {}).get("bulkOperationRunQuery") or {}
+        
+        user_errors = payload.get("userErrors") or []
+        if user_errors:
+            raise RuntimeError(f"Bulk operation rejected: {user_errors}")
+        
+        operation = payload.get("bulkOperation")
+        if not operation:
+            raise RuntimeError(f"Bulk operation not created: {result.get('errors')}")
+        
+        logger.info(f"Bulk operation started: {operation['id']}")
+        return await self.wait_bulk_operation(operation["id"])
+    
+    async def get_bulk_operation(self, operation_id: str) -> Optional[Dict]:
+        """Récupère l'état d'une opération bulk"""
+        query = """
+        query GetBulkOperation($id: ID!) {
+            node(id: $id) {
+                ... on BulkOperation {
+                    id
+                    status
+                    errorCode
+                    objectCount
+                    url
+                    partialDataUrl
+                }
+            }
+        }
+        """
+        
+        result = await self.execute_query(query, {"id": operation_id})
+        return (result.get("data") or {}).get("node")
+    
+    async def wait_bulk_operation(self, operation_id: str) -> Dict:
+        """Attend qu'une opération bulk soit terminée"""
+        deadline = time.monotonic() + BULK_TIMEOUT
+        
+        while True:
+            operation = await self.get_bulk_operation(operation_id)
+            if not operation:
+                raise RuntimeError(f"Bulk operation {operation_id} not found")
+            
+            status = operation.get("status")
+            if status == "COMPLETED":
+                logger.info(f"Bulk operation completed: {operation.get('objectCount')} objects")
+                return operation
+            if status in ("FAILED", "CANCELED", "CANCELING", "EXPIRED"):
+                raise RuntimeError(f"Bulk operation {status}: {operation.get('errorCode')}")
+            
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Bulk operation {operation_id} timed out ({status})")
+            
+            await asyncio.sleep(BULK_POLL_INTERVAL)
+    
+    async def stream_bulk_results(self, url: Optional[str]) -> AsyncIterator[Dict]:
+        """
+        Lit le fichier JSONL d'une opération bulk ligne par ligne.
+        Chaque ligne est décodée séparément : le fichier n'est jamais chargé en entier.
+        """
+        if not url:
+            return
+        
+        client = http_pool.get_client(self.shop_domain)
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.strip():
+                    yield json.loads(line)
 
 
 # Instance globale
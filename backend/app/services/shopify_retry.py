@@ -0,0 +1,220 @@
+"""
+Retries classés et circuit breaker du client GraphQL Shopify
+
+Classement d'un échec :
+    - transitoire, requête jamais traitée (connexion refusée, 429) : on
+      réessaie toujours ;
+    - transitoire, requête peut-être traitée (timeout de lecture, 5xx,
+      INTERNAL_SERVER_ERROR) : on réessaie les lectures et les mutations
+      idempotentes (SAFE_MUTATIONS) seulement ;
+    - définitif (4xx, erreur inattendue) : pas de retry.
+Backoff exponentiel avec jitter complet ; un 429 attend le Retry-After.
+
+Le circuit breaker (un par boutique) s'ouvre après BREAKER_FAILURE_THRESHOLD
+échecs transitoires consécutifs (hors 429 / THROTTLED : limitation, pas
+panne) : les requêtes échouent aussitôt pendant BREAKER_RESET_SECONDS, puis
+une seule requête test décide de la fermeture.
+"""
+
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Retries : nombre max après la première tentative, délais (secondes)
+RETRY_MAX_ATTEMPTS = int(os.environ.get("SHOPIFY_RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.environ.get("SHOPIFY_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("SHOPIFY_RETRY_MAX_DELAY", "20"))
+# Plafond d'un Retry-After (un en-tête aberrant ne bloque pas une requête des heures)
+RETRY_AFTER_MAX = float(os.environ.get("SHOPIFY_RETRY_AFTER_MAX", "60"))
+
+# Circuit breaker
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("SHOPIFY_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("SHOPIFY_BREAKER_RESET_SECONDS", "30"))
+
+# Mutations rejouables sans effet de bord : priceListFixedPricesAdd écrit des
+# prix absolus (rejouer le même lot redonne le même état)
+SAFE_MUTATIONS = {"priceListFixedPricesAdd"}
+
+RETRYABLE_STATUS = {500, 502, 503, 504}
+
+_MUTATION_FIELD_RE = re.compile(r'^\s*mutation\b[^{]*\{\s*(\w+)')
+
+
+class CircuitOpenError(Exception):
+    """Shopify jugé dégradé : requête refusée sans appel"""
+
+
+def is_retry_safe(query: str) -> bool:
+    """Lecture, ou mutation dont le champ racine est dans SAFE_MUTATIONS"""
+    match = _MUTATION_FIELD_RE.match(query)
+    if match is None:
+        return not query.lstrip().startswith("mutation")
+    return match.group(1) in SAFE_MUTATIONS
+
+
+def classify_exception(error: Exception) -> Tuple[str, bool, bool]:
+    """Exception de transport → (raison, transitoire, peut-être traitée)"""
+    if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return "connect", True, False
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout", True, True
+    if isinstance(error, httpx.TransportError):
+        return "transport", True, True
+    return type(error).__name__, False, True
+
+
+def has_internal_error(result: dict) -> bool:
+    """Réponse 200 dont les erreurs GraphQL signalent une panne côté Shopify"""
+    for error in result.get("errors", []) or []:
+        if isinstance(error, dict) and (error.get("extensions") or {}).get("code") == "INTERNAL_SERVER_ERROR":
+            return True
+    return False
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """En-tête Retry-After (secondes ou date HTTP) → secondes, None si absent/invalide"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Délai avant le retry n° attempt (0 = premier retry) : Retry-After s'il est
+    fourni (+ jitter pour étaler les clients), sinon jitter complet sur
+    base × 2^attempt plafonné
+    """
+    if retry_after is not None:
+        return min(retry_after, RETRY_AFTER_MAX) + random.uniform(0, RETRY_BASE_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    État fermé / ouvert / semi-ouvert d'une boutique + compteurs de retries.
+    Chaque tentative se termine par record_success ou record_failure (verdict),
+    puis end_attempt.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {
+            "attempts": 0,
+            "failures": 0,
+            "retries": 0,
+            "gave_up": 0,
+            "opened": 0,
+            "fail_fast": 0,
+            "retries_by_reason": {},
+            "last_failure": None
+        }
+
+    def before_request(self):
+        """Lève CircuitOpenError si le circuit est ouvert (ou si la requête test est déjà partie)"""
+        if self.state == "open":
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                self._stats["fail_fast"] += 1
+                raise CircuitOpenError(f"Shopify circuit open, retry in {remaining:.0f}s")
+            self.state = "half_open"
+            self._probe_in_flight = False
+            logger.info("Shopify circuit half-open: sending a probe request")
+
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                self._stats["fail_fast"] += 1
+                raise CircuitOpenError("Shopify circuit half-open, probe request in flight")
+            self._probe_in_flight = True
+
+        self._stats["attempts"] += 1
+
+    def record_success(self):
+        self._consecutive_failures = 0
+        if self.state != "closed":
+            logger.info("Shopify circuit closed")
+        self.state = "closed"
+        self._probe_in_flight = False
+
+    def record_failure(self, reason: str):
+        self._consecutive_failures += 1
+        self._stats["failures"] += 1
+        self._stats["last_failure"] = {"reason": reason, "at": datetime.now().isoformat()}
+        if self.state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self._stats["opened"] += 1
+                logger.warning(
+                    f"Shopify circuit opened after {self._consecutive_failures} consecutive failures "
+                    f"({reason}), failing fast for {self.reset_seconds:.0f}s"
+                )
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def end_attempt(self):
+        """Tentative terminée sans verdict (annulée, réponse illisible) : libère la requête test"""
+        if self.state == "half_open":
+            self._probe_in_flight = False
+
+    def record_retry(self, reason: str):
+        self._stats["retries"] += 1
+        by_reason = self._stats["retries_by_reason"]
+        by_reason[reason] = by_reason.get(reason, 0) + 1
+
+    def record_gave_up(self):
+        self._stats["gave_up"] += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            **self._stats,
+            "retries_by_reason": dict(self._stats["retries_by_reason"])
+        }
+
+
+# Un circuit par boutique, partagé par tous les ShopifyService
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(shop_domain: str) -> CircuitBreaker:
+    """Retourne le circuit de la boutique (créé à la demande)"""
+    breaker = _breakers.get(shop_domain)
+    if breaker is None:
+        breaker = CircuitBreaker()
+        _breakers[shop_domain] = breaker
+    return breaker
+
+
+def get_retry_stats() -> dict:
+    """Retries et état du circuit par boutique"""
+    return {
+        "shops": {shop: b.get_stats() for shop, b in _breakers.items()}
+    }
@@ -0,0 +1,324 @@
+"""
+Ordonnanceur de coût GraphQL Shopify (leaky bucket côté client)
+Piloté par extensions.cost.throttleStatus renvoyé par chaque réponse
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Valeurs initiales du bucket (plan standard), recalées sur chaque réponse Shopify
+THROTTLE_ENABLED = os.environ.get("SHOPIFY_THROTTLE_ENABLED", "1") == "1"
+THROTTLE_MAX_AVAILABLE = float(os.environ.get("SHOPIFY_THROTTLE_MAX_AVAILABLE", "1000"))
+THROTTLE_RESTORE_RATE = float(os.environ.get("SHOPIFY_THROTTLE_RESTORE_RATE", "50"))
+THROTTLE_MAX_RETRIES = int(os.environ.get("SHOPIFY_THROTTLE_MAX_RETRIES", "5"))
+
+# Coût forfaitaire d'une mutation (règle Shopify)
+MUTATION_COST = 10
+
+# Apply parallèle : lots de mutations en vol, limite adaptative entre 1 et le max
+APPLY_MAX_CONCURRENCY = int(os.environ.get("SHOPIFY_APPLY_MAX_CONCURRENCY", "16"))
+APPLY_INITIAL_CONCURRENCY = int(os.environ.get("SHOPIFY_APPLY_INITIAL_CONCURRENCY", "4"))
+# Taux d'erreur (sur les derniers lots) au-delà duquel la limite est divisée par 2
+APPLY_ERROR_RATE_THRESHOLD = float(os.environ.get("SHOPIFY_APPLY_ERROR_RATE", "0.2"))
+APPLY_ERROR_WINDOW = 20
+APPLY_ERROR_MIN_SAMPLES = 5
+
+# Champs de structure d'une connexion qui ne coûtent rien
+_FREE_FIELDS = {"edges", "node", "pageInfo"}
+
+_FIELD_RE = re.compile(r'(\w+)\s*(?:\(([^)]*)\))?\s*(\{)?|\}')
+_FIRST_RE = re.compile(r'\bfirst\s*:\s*(\$?\w+)')
+
+
+def estimate_query_cost(query: str, variables: dict = None) -> int:
+    """
+    Estime le coût d'une requête selon les règles Shopify :
+    objet = 1, connexion = 2 + first × coût des enfants, scalaire = 0, mutation = 10
+    """
+    variables = variables or {}
+    body = query.strip()
+
+    if body.startswith("mutation"):
+        return MUTATION_COST
+
+    # Ignorer la définition de l'opération (query X($a: Int!) {)
+    start = body.find("{")
+    if start < 0:
+        return 1
+    body = body[start + 1:]
+
+    cost = 0
+    multipliers = [1]
+
+    for match in _FIELD_RE.finditer(body):
+        if match.group(0) == "}":
+            if len(multipliers) > 1:
+                multipliers.pop()
+            continue
+
+        name, args, opens = match.group(1), match.group(2), match.group(3)
+        if not opens:
+            continue
+
+        size = None
+        if args:
+            first = _FIRST_RE.search(args)
+            if first:
+                value = first.group(1)
+                if value.startswith("$"):
+                    value = variables.get(value[1:], 0)
+                try:
+                    size = int(value)
+                except (TypeError, ValueError):
+                    size = 0
+
+        current = multipliers[-1]
+        if size is not None:
+            cost += 2 * current
+            multipliers.append(current * size)
+        else:
+            if name not in _FREE_FIELDS:
+                cost += current
+            multipliers.append(current)
+
+    return max(cost, 1)
+
+
+def is_throttled(result: dict) -> bool:
+    """Vrai si la réponse GraphQL est une erreur THROTTLED"""
+    for error in result.get("errors", []) or []:
+        if isinstance(error, dict) and (error.get("extensions") or {}).get("code") == "THROTTLED":
+            return True
+    return False
+
+
+class ThrottleScheduler:
+    """
+    Leaky bucket local d'une boutique.
+    Chaque requête réserve son coût estimé avant l'envoi ; si le bucket
+    n'a pas assez de points, l'appelant attend juste le temps de restauration
+    nécessaire. L'état est recalé sur throttleStatus après chaque réponse.
+    """
+
+    def __init__(
+        self,
+        maximum_available: float = THROTTLE_MAX_AVAILABLE,
+        restore_rate: float = THROTTLE_RESTORE_RATE
+    ):
+        self.enabled = THROTTLE_ENABLED
+        self.maximum_available = maximum_available
+        self.restore_rate = restore_rate
+        self._available = maximum_available
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        # Coûts demandés observés, par forme de requête
+        self._learned_costs: Dict[str, float] = {}
+        self._stats = {
+            "requests": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "throttled": 0,
+            "estimated_cost": 0.0,
+            "actual_cost": 0.0
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._available = min(
+            self.maximum_available,
+            self._available + elapsed * self.restore_rate
+        )
+        self._updated_at = now
+
+    def _cost_key(self, query: str, variables: Optional[dict]) -> str:
+        first = (variables or {}).get("first")
+        digest = hashlib.md5(query.encode("utf-8")).hexdigest()
+        return f"{digest}:{first}"
+
+    def estimate_cost(self, query: str, variables: dict = None) -> float:
+        """Coût estimé : dernier coût demandé observé, sinon heuristique"""
+        learned = self._learned_costs.get(self._cost_key(query, variables))
+        if learned is not None:
+            return learned
+        return float(estimate_query_cost(query, variables))
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._available
+
+    async def acquire(self, cost: float) -> float:
+        """
+        Réserve `cost` points dans le bucket, en attendant si nécessaire.
+        Les appelants concurrents sont servis dans l'ordre d'arrivée.
+        Retourne le temps d'attente en secondes.
+        """
+        cost = min(cost, self.maximum_available)
+        waited = 0.0
+
+        async with self._lock:
+            self._refill()
+            if self._available < cost:
+                delay = (cost - self._available) / self.restore_rate
+                self._stats["waits"] += 1
+                logger.info(f"Throttle: waiting {delay:.2f}s for {cost:.0f} points ({self._available:.0f} available)")
+                await asyncio.sleep(delay)
+                waited = delay
+                self._refill()
+
+            self._available -= cost
+            self._stats["requests"] += 1
+            self._stats["estimated_cost"] += cost
+            self._stats["wait_seconds"] += waited
+
+        return waited
+
+    def observe(self, query: str, variables: Optional[dict], result: dict):
+        """Recale le bucket et l'estimation sur le bloc extensions.cost de la réponse"""
+        cost = (result.get("extensions") or {}).get("cost")
+        if not cost:
+            return
+
+        requested = cost.get("requestedQueryCost")
+        if requested is not None:
+            self._learned_costs[self._cost_key(query, variables)] = float(requested)
+
+        actual = cost.get("actualQueryCost")
+        if actual is not None:
+            self._stats["actual_cost"] += float(actual)
+
+        status = cost.get("throttleStatus")
+        if status:
+            self.maximum_available = float(status.get("maximumAvailable", self.maximum_available))
+            self.restore_rate = float(status.get("restoreRate", self.restore_rate)) or self.restore_rate
+            self._available = float(status.get("currentlyAvailable", self._available))
+            self._updated_at = time.monotonic()
+
+    def record_throttled(self):
+        self._stats["throttled"] += 1
+
+    @property
+    def throttled_count(self) -> int:
+        return self._stats["throttled"]
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            **self._stats,
+            "wait_seconds": round(self._stats["wait_seconds"], 3),
+            "currently_available": round(self.available, 1),
+            "maximum_available": self.maximum_available,
+            "restore_rate": self.restore_rate,
+            "learned_queries": len(self._learned_costs)
+        }
+
+
+class AdaptiveConcurrency:
+    """
+    Limite de requêtes en vol pour l'apply parallèle (AIMD) :
+    - +1 après `limit` succès consécutifs, si le bucket a assez de points
+      pour remplir toutes les places de la nouvelle limite sans attendre ;
+    - ÷2 si une réponse THROTTLED a été vue depuis le dernier ajustement, ou si
+      le taux d'erreur sur les derniers lots dépasse APPLY_ERROR_RATE_THRESHOLD.
+    Le débit reste borné par le bucket (acquire de ThrottleScheduler) ; la
+    concurrence ne sert qu'à couvrir la latence des allers-retours.
+    """
+
+    def __init__(
+        self,
+        scheduler: ThrottleScheduler,
+        cost: float = MUTATION_COST,
+        maximum: int = APPLY_MAX_CONCURRENCY,
+        initial: int = APPLY_INITIAL_CONCURRENCY
+    ):
+        self._scheduler = scheduler
+        self._cost = cost
+        self.maximum = max(1, maximum)
+        self.limit = max(1, min(initial, self.maximum))
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+        self._outcomes = deque(maxlen=APPLY_ERROR_WINDOW)
+        self._successes = 0
+        self._throttled_seen = scheduler.throttled_count
+        self._stats = {"requests": 0, "errors": 0, "increases": 0, "decreases": 0, "peak": self.limit}
+
+    async def acquire(self):
+        """Attend une place sous la limite courante"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+    async def release(self, ok: bool):
+        """Libère la place et ajuste la limite selon le résultat du lot"""
+        async with self._condition:
+            self._in_flight -= 1
+            self._stats["requests"] += 1
+            if not ok:
+                self._stats["errors"] += 1
+            self._outcomes.append(ok)
+            self._adapt(ok)
+            self._condition.notify_all()
+
+    def _error_rate(self) -> float:
+        if len(self._outcomes) < APPLY_ERROR_MIN_SAMPLES:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _adapt(self, ok: bool):
+        throttled = self._scheduler.throttled_count
+        if throttled > self._throttled_seen or self._error_rate() > APPLY_ERROR_RATE_THRESHOLD:
+            self._throttled_seen = throttled
+            self._outcomes.clear()
+            self._successes = 0
+            if self.limit > 1:
+                self.limit = max(1, self.limit // 2)
+                self._stats["decreases"] += 1
+                logger.info(f"Apply concurrency decreased to {self.limit}")
+            return
+
+        if not ok:
+            self._successes = 0
+            return
+
+        self._successes += 1
+        if (
+            self._successes >= self.limit
+            and self.limit < self.maximum
+            and self._scheduler.available >= self._cost * (self.limit + 1 - self._in_flight)
+        ):
+            self.limit += 1
+            self._successes = 0
+            self._stats["increases"] += 1
+            self._stats["peak"] = max(self._stats["peak"], self.limit)
+
+    def get_stats(self) -> dict:
+        return {**self._stats, "limit": self.limit, "maximum": self.maximum}
+
+
+# Un bucket par boutique, partagé par tous les ShopifyService
+_schedulers: Dict[str, ThrottleScheduler] = {}
+
+
+def get_throttle_scheduler(shop_domain: str) -> ThrottleScheduler:
+    """Retourne l'ordonnanceur de la boutique (créé à la demande)"""
+    scheduler = _schedulers.get(shop_domain)
+    if scheduler is None:
+        scheduler = ThrottleScheduler()
+        _schedulers[shop_domain] = scheduler
+    return scheduler
+
+
+def get_throttle_stats() -> dict:
+    """Statistiques des ordonnanceurs par boutique"""
+    return {
+        "shops": {shop: s.get_stats() for shop, s in _schedulers.items()}
+    }
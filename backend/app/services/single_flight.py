@@ -0,0 +1,119 @@
+"""
+Coalescence des requêtes identiques en vol (single-flight)
+Une lecture GraphQL (requête + variables) déjà en cours n'est pas renvoyée à
+Shopify : les appelants suivants attendent la même réponse. Les compteurs
+indiquent combien d'appels amont ont été économisés.
+"""
+
+import asyncio
+import copy
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(query: str, variables: Optional[dict]) -> str:
+    """Clé d'une requête : texte + variables en JSON canonique (ordre des clés ignoré)"""
+    return f"{query}\n{json.dumps(variables or {}, sort_keys=True, default=str)}"
+
+
+def is_mutation(query: str) -> bool:
+    return query.lstrip().startswith("mutation")
+
+
+class _Flight:
+    __slots__ = ("task", "followers")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Appels en vol par clé. Le premier appelant lance l'appel ; ceux qui arrivent
+    avant la fin partagent son résultat (ou son exception).
+    Quand un appel a été partagé, chaque appelant reçoit sa propre copie du
+    résultat : les appelants modifient librement les dicts renvoyés.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._stats = {"calls": 0, "upstream": 0, "coalesced": 0, "shared_errors": 0}
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        self._stats["calls"] += 1
+        flight = self._flights.get(key)
+        # Un appel terminé (nettoyage pas encore passé) ne se partage plus
+        if flight is None or flight.task.done():
+            self._stats["upstream"] += 1
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._done(key, task))
+        else:
+            flight.followers += 1
+            self._stats["coalesced"] += 1
+
+        try:
+            # shield : l'annulation d'un appelant n'interrompt pas l'appel partagé
+            result = await asyncio.shield(flight.task)
+        except Exception:
+            if flight.followers:
+                self._stats["shared_errors"] += 1
+            raise
+
+        if flight.followers:
+            return copy.deepcopy(result)
+        return result
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is not None and self._flights[key].task is task:
+            del self._flights[key]
+        # Exception non récupérée si tous les appelants ont été annulés
+        if not task.cancelled():
+            task.exception()
+
+    async def cancel_all(self):
+        """Annule les appels en vol et attend leur fin (arrêt de l'application)"""
+        tasks = [flight.task for flight in self._flights.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> dict:
+        calls = self._stats["calls"]
+        return {
+            **self._stats,
+            "in_flight": len(self._flights),
+            "hit_rate": round(self._stats["coalesced"] / calls, 3) if calls else 0.0
+        }
+
+
+# Un single-flight par boutique, partagé par tous les ShopifyService
+_flights: Dict[str, SingleFlight] = {}
+
+
+def get_single_flight(shop_domain: str) -> SingleFlight:
+    """Retourne le single-flight de la boutique (créé à la demande)"""
+    flight = _flights.get(shop_domain)
+    if flight is None:
+        flight = SingleFlight()
+        _flights[shop_domain] = flight
+    return flight
+
+
+async def cancel_single_flights():
+    """
+    Annule les appels partagés de toutes les boutiques : protégés par shield,
+    ils survivent à l'annulation de leurs appelants
+    """
+    await asyncio.gather(*(flight.cancel_all() for flight in _flights.values()))
+
+
+def get_single_flight_stats() -> dict:
+    """Compteurs de coalescence par boutique"""
+    return {
+        "shops": {shop: f.get_stats() for shop, f in _flights.items()}
+    }
@@ -0,0 +1,35 @@
+"""
+Normalisation des identifiants de variantes
+Les GID Shopify (gid://shopify/ProductVariant/123) et les ids numériques
+("123" ou 123) sont convertis une seule fois en clé entière à l'entrée
+(réponses Shopify, requêtes API) ; tous les index internes sont indexés par int.
+Le GID n'est reconstruit qu'en sortie, pour les réponses et les mutations.
+"""
+
+from typing import Iterable, List, Optional, Set
+
+VARIANT_GID_PREFIX = "gid://shopify/ProductVariant/"
+
+
+def variant_key(variant_id) -> int:
+    """gid://shopify/ProductVariant/123, "123" ou 123 → 123"""
+    if isinstance(variant_id, int):
+        return variant_id
+    return int(str(variant_id).rsplit("/", 1)[-1])
+
+
+def variant_gid(key) -> str:
+    """123, "123" ou GID → gid://shopify/ProductVariant/123"""
+    return f"{VARIANT_GID_PREFIX}{variant_key(key)}"
+
+
+def variant_keys(variant_ids: Optional[Iterable]) -> List[int]:
+    """Liste d'ids (tous formats) → clés entières, sans doublons, ordre conservé"""
+    return list(dict.fromkeys(variant_key(vid) for vid in (variant_ids or []) if vid))
+
+
+def variant_key_set(variant_ids: Optional[Iterable]) -> Optional[Set[int]]:
+    """Filtre par ids (tous formats) → set de clés entières, None si pas de filtre"""
+    if not variant_ids:
+        return None
+    return {variant_key(vid) for vid in variant_ids if vid}
@@ -0,0 +1,10 @@
+"""
+Configuration commune des tests
+CACHE_DIR est lu à l'import des services : le pointer vers un répertoire
+temporaire avant tout import de app pour ne jamais toucher au vrai cache.
+"""
+
+import os
+import tempfile
+
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="price-cache-tests-")
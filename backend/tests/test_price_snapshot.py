@@ -0,0 +1,74 @@
+"""Snapshot binaire du cache : aller-retour écriture / lecture et détection de corruption"""
+
+import pytest
+
+from app.services.price_snapshot import HEADER, read_snapshot, write_snapshot
+from app.services.price_store import MISSING, PriceStore
+
+
+def build_store() -> PriceStore:
+    store = PriceStore()
+    france = store.new_market("gid://shopify/Market/1", "EUR", "gid://shopify/PriceList/1")
+    store.put(france, "gid://shopify/ProductVariant/101", "129.99", "199.99")
+    store.put(france, "102", "59.90", None)
+    store.publish("France", france)
+    # Colonne plus courte que l'index : complétée avec MISSING à l'écriture
+    japon = store.new_market("gid://shopify/Market/2", "JPY", "gid://shopify/PriceList/2")
+    store.put(japon, 101, "15000", None)
+    store.publish("Japon", japon)
+    return store
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "price_cache.bin")
+    store = build_store()
+    write_snapshot(path, store.current, "2026-01-02T03:04:05")
+
+    restored, meta = read_snapshot(path)
+
+    assert meta["last_refresh"] == "2026-01-02T03:04:05"
+    assert restored.epoch == store.epoch
+    assert list(restored.markets) == ["France", "Japon"]
+    for name, market in store.markets.items():
+        copy = restored.markets[name]
+        assert (copy.market_id, copy.currency, copy.price_list_id) == (market.market_id, market.currency, market.price_list_id)
+        assert copy.count == market.count
+        assert copy.loaded_at == market.loaded_at
+        assert list(restored.current.iter_market(name)) == list(store.current.iter_market(name))
+    assert restored.get("France", "gid://shopify/ProductVariant/101") == {
+        "price": "129.99", "compareAtPrice": "199.99", "currency": "EUR"
+    }
+    assert restored.get("Japon", 102) is None
+    assert restored.current.total_prices == store.current.total_prices
+
+
+def test_restored_columns_are_copied_on_write(tmp_path):
+    path = str(tmp_path / "price_cache.bin")
+    write_snapshot(path, build_store().current)
+    restored, _ = read_snapshot(path)
+
+    restored.update({"France": [(101, 9999, MISSING)]})
+
+    assert restored.get("France", 101)["price"] == "99.99"
+    assert read_snapshot(path)[0].get("France", 101)["price"] == "129.99"
+
+
+def test_snapshot_crc_mismatch_is_rejected(tmp_path):
+    path = tmp_path / "price_cache.bin"
+    write_snapshot(str(path), build_store().current)
+
+    data = bytearray(path.read_bytes())
+    data[-3] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match="checksum"):
+        read_snapshot(str(path))
+
+
+def test_truncated_snapshot_is_rejected(tmp_path):
+    path = tmp_path / "price_cache.bin"
+    write_snapshot(str(path), build_store().current)
+    path.write_bytes(path.read_bytes()[:HEADER.size + 16])
+
+    with pytest.raises(ValueError, match="size mismatch"):
+        read_snapshot(str(path))
@@ -0,0 +1,80 @@
+"""Journal des mises à jour : segments scellés et rejeu au démarrage du cache"""
+
+import pytest
+
+from app.services import price_cache as price_cache_module
+from app.services.price_snapshot import write_snapshot
+from app.services.price_store import MISSING, PriceStore
+from app.services.price_wal import PriceWAL
+
+
+def test_replay_reads_sealed_segments_before_active_log(tmp_path):
+    path = str(tmp_path / "price_cache.wal")
+    wal = PriceWAL(path)
+    wal.append([("France", 1, 1000, MISSING), ("France", 2, 2000, MISSING)])
+    wal.seal()
+    wal.append([("France", 1, 1100, MISSING)])
+
+    reopened = PriceWAL(path)
+    records = list(reopened.replay())
+
+    assert records == [("France", 1, 1000, MISSING), ("France", 2, 2000, MISSING), ("France", 1, 1100, MISSING)]
+    assert reopened.records == 3
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "price_cache.wal"
+    wal = PriceWAL(str(path))
+    wal.append([("France", 1, 1000, MISSING)])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"m": "France", "v": 2, "p"')
+
+    assert list(PriceWAL(str(path)).replay()) == [("France", 1, 1000, MISSING)]
+
+
+def test_discard_sealed_keeps_newer_segments(tmp_path):
+    path = str(tmp_path / "price_cache.wal")
+    wal = PriceWAL(path)
+    wal.append([("France", 1, 1000, MISSING)])
+    first = wal.seal()
+    wal.append([("France", 2, 2000, MISSING)])
+    wal.seal()
+
+    wal.discard_sealed(first)
+
+    assert list(PriceWAL(path).replay()) == [("France", 2, 2000, MISSING)]
+
+
+@pytest.fixture
+def cache_files(tmp_path, monkeypatch):
+    """Fichiers du cache dans un répertoire temporaire (chemins lus à la construction)"""
+    monkeypatch.setattr(price_cache_module, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(price_cache_module, "SNAPSHOT_FILE", str(tmp_path / "price_cache.bin"))
+    monkeypatch.setattr(price_cache_module, "WAL_FILE", str(tmp_path / "price_cache.wal"))
+    monkeypatch.setattr(price_cache_module, "CACHE_FILE", str(tmp_path / "price_cache.json"))
+    return tmp_path
+
+
+def test_cache_replays_sealed_segment_and_active_log_over_snapshot(cache_files):
+    store = PriceStore()
+    france = store.new_market("gid://shopify/Market/1", "EUR", "gid://shopify/PriceList/1")
+    store.put(france, 1, "10.00", None)
+    store.put(france, 2, "20.00", None)
+    store.publish("France", france)
+    write_snapshot(str(cache_files / "price_cache.bin"), store.current)
+
+    # Arrêt après le scellement mais avant l'écriture du snapshot suivant :
+    # le segment scellé n'a pas été supprimé et doit être rejoué
+    wal = PriceWAL(str(cache_files / "price_cache.wal"))
+    wal.append([("France", 1, 1100, MISSING), ("France", 3, 3000, 3500)])
+    wal.seal()
+    wal.append([("France", 1, 1200, MISSING), ("Inconnu", 1, 100, MISSING)])
+
+    cache = price_cache_module.PriceCache()
+
+    assert cache.is_loaded
+    assert cache.get_price("France", 1)["price"] == "12.00"
+    assert cache.get_price("France", 2)["price"] == "20.00"
+    assert cache.get_price("France", 3) == {"price": "30.00", "compareAtPrice": "35.00", "currency": "EUR"}
+    assert cache.snapshot().markets["France"].count == 3
+    assert cache.get_status()["wal_records"] == 4
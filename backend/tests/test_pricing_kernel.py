@@ -0,0 +1,48 @@
+"""Parité des terminaisons vectorisées (pricing_kernel) avec les fonctions scalaires"""
+
+import random
+
+import numpy as np
+import pytest
+
+from app.config.countries import ENDINGS
+from app.services.pricing_kernel import VECTOR_ENDINGS, apply_endings
+
+EDGE_PRICES = [
+    0.0, 0.01, 0.5, 1.5, 2.5, 4.99, 5.0, 7.5, 8.99, 9.0, 9.99, 10.0, 12.5, 19.5,
+    99.99, 499.5, 500.0, 999.0, 999.99, 1000.0, 1499.5, 1500.0, 2500.0, 9999.99,
+    10000.0, 10990.0, 12345.67, 99999.5, 250000.0, -0.5, -3.2, -12.5
+]
+
+
+def sample_prices(count: int = 5000) -> list:
+    rng = random.Random(17)
+    prices = list(EDGE_PRICES)
+    for _ in range(count):
+        scale = rng.choice((10, 100, 1000, 10000, 1000000))
+        prices.append(round(rng.uniform(0, scale), rng.choice((0, 1, 2))))
+    return prices
+
+
+def test_every_scalar_ending_has_a_vector_ending():
+    assert set(VECTOR_ENDINGS) == set(ENDINGS)
+
+
+@pytest.mark.parametrize("family", sorted(ENDINGS))
+def test_vector_ending_matches_scalar(family):
+    prices = sample_prices()
+    vector = VECTOR_ENDINGS[family](np.array(prices, dtype=np.float64)).tolist()
+    scalar = [ENDINGS[family](price) for price in prices]
+    mismatches = [(p, s, v) for p, s, v in zip(prices, scalar, vector) if s != v]
+    assert not mismatches, mismatches[:5]
+
+
+def test_apply_endings_per_column_matches_scalar():
+    families = sorted(ENDINGS) + ["99", "00"]
+    prices = np.array(sample_prices(500), dtype=np.float64)
+    block = np.repeat(prices[:, None], len(families), axis=1)
+
+    result = apply_endings(block, [VECTOR_ENDINGS[family] for family in families])
+
+    for column, family in enumerate(families):
+        assert result[:, column].tolist() == [ENDINGS[family](p) for p in prices.tolist()]
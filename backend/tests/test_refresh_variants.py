@@ -0,0 +1,100 @@
+"""Rechargement ciblé de variantes : ids invalides, SKUs inconnus, erreurs Shopify"""
+
+import asyncio
+
+import pytest
+
+from app.services import price_cache as price_cache_module
+from app.services.price_store import MISSING
+
+
+class FakeShopify:
+    """Double minimal de ShopifyService pour refresh_variants"""
+
+    shop_domain = "test.myshopify.com"
+
+    def __init__(self, prices_by_pricelist=None, skus=None, fail=False):
+        self.prices_by_pricelist = prices_by_pricelist or {}
+        self.skus = skus or {}
+        self.fail = fail
+        self.requested_variants = None
+
+    def get_http_stats(self):
+        return {"shops": {}}
+
+    async def get_variant_ids_by_sku(self, skus):
+        return {sku: self.skus[sku] for sku in skus if sku in self.skus}
+
+    async def get_fixed_prices_for_variants(self, variant_ids, price_list_ids):
+        if self.fail:
+            raise RuntimeError("Shopify unavailable")
+        self.requested_variants = variant_ids
+        return {pl: self.prices_by_pricelist.get(pl, []) for pl in price_list_ids}
+
+
+def price(variant, amount):
+    return {"variantId": f"gid://shopify/ProductVariant/{variant}", "price": amount, "currency": "EUR", "compareAtPrice": None}
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(price_cache_module, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(price_cache_module, "SNAPSHOT_FILE", str(tmp_path / "price_cache.bin"))
+    monkeypatch.setattr(price_cache_module, "WAL_FILE", str(tmp_path / "price_cache.wal"))
+    monkeypatch.setattr(price_cache_module, "CACHE_FILE", str(tmp_path / "price_cache.json"))
+    cache = price_cache_module.PriceCache()
+    store = cache._store
+    france = store.new_market("gid://shopify/Market/1", "EUR", "gid://shopify/PriceList/1")
+    store.put(france, 1, "10.00", None)
+    store.put(france, 2, "20.00", None)
+    store.publish("France", france)
+    return cache
+
+
+def test_invalid_ids_are_reported_and_valid_ids_refreshed(cache):
+    shopify = FakeShopify({"gid://shopify/PriceList/1": [price(1, "11.00")]})
+
+    result = asyncio.run(cache.refresh_variants(
+        shopify, variant_ids=["abc", "gid://shopify/ProductVariant/1", "2", "gid://shopify/ProductVariant/"]
+    ))
+
+    assert result["invalid_ids"] == ["abc", "gid://shopify/ProductVariant/"]
+    assert result["variants"] == ["gid://shopify/ProductVariant/1", "gid://shopify/ProductVariant/2"]
+    assert result["updated"] == 1
+    assert result["missing"] == {"France": ["gid://shopify/ProductVariant/2"]}
+    assert cache.get_price("France", 1)["price"] == "11.00"
+    assert cache.get_price("France", 2)["price"] == "20.00"
+
+
+def test_unknown_skus_are_reported(cache):
+    shopify = FakeShopify(
+        {"gid://shopify/PriceList/1": [price(2, "21.00")]},
+        skus={"SKU-2": "gid://shopify/ProductVariant/2"}
+    )
+
+    result = asyncio.run(cache.refresh_variants(shopify, skus=["SKU-2", "SKU-404"]))
+
+    assert result["unknown_skus"] == ["SKU-404"]
+    assert shopify.requested_variants == ["gid://shopify/ProductVariant/2"]
+    assert cache.get_price("France", 2)["price"] == "21.00"
+
+
+def test_only_invalid_ids_queries_nothing(cache):
+    shopify = FakeShopify()
+
+    result = asyncio.run(cache.refresh_variants(shopify, variant_ids=["abc"]))
+
+    assert result["invalid_ids"] == ["abc"]
+    assert result["updated"] == 0
+    assert shopify.requested_variants is None
+
+
+def test_shopify_failure_raises_and_keeps_cache(cache):
+    epoch = cache.epoch
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.refresh_variants(FakeShopify(fail=True), variant_ids=["1"]))
+
+    assert cache.epoch == epoch
+    assert cache.get_price("France", 1)["price"] == "10.00"
+    assert cache.snapshot().markets["France"].get(0) == (1000, MISSING)
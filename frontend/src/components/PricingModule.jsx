@@ -348,7 +348,7 @@ function PricingModule() {
         })
       }
       
-      const response = await axios.post(`${API_URL}/pricing/preview`, {
+      const response = await axios.post(`${API_URL}/pricing/preview/session`, {
         countries: selectAllCountries ? ['all'] : selectedCountries,
         product_ids: productIds,
         variant_ids: variantIds,
@@ -425,6 +425,7 @@ function PricingModule() {
         apply_vat: settings.applyVat,
         discount: settings.discount / 100,
         use_market_price: true,
+        preview_id: preview?.preview_id,  // Lignes de la preview stockée, sans recalcul
         dry_run: false
       }, {
         timeout: 600000 // 10 min timeout
@@ -472,7 +473,7 @@ function PricingModule() {
       const newSeed = Math.floor(Math.random() * 1000000)
       setPromoSeed(newSeed)
       
-      const response = await axios.post(`${API_URL}/pricing/random-promo/preview`, {
+      const response = await axios.post(`${API_URL}/pricing/random-promo/preview/session`, {
         countries: selectAllCountries ? ['all'] : selectedCountries,
         catalog_percentage: promoSettings.catalogPercentage,
         min_discount: promoSettings.minDiscount,
@@ -527,6 +528,7 @@ function PricingModule() {
         min_discount: promoSettings.minDiscount,
         max_discount: promoSettings.maxDiscount,
         seed: promoSeed,
+        preview_id: promoPreview.preview_id,  // Promos tirées à la preview, sans nouveau tirage
         dry_run: false
       }, {
         timeout: 600000
@@ -1112,9 +1114,9 @@ function PricingModule() {
                         ))}
                       </tbody>
                     </table>
-                    {promoPreview.preview?.length > 20 && (
+                    {promoPreview.summary?.total_price_changes > 20 && (
                       <p className="text-xs text-gray-500 mt-2 text-center">
-                        Et {promoPreview.preview.length - 20} autres modifications...
+                        Et {promoPreview.summary.total_price_changes - 20} autres modifications...
                       </p>
                     )}
                   </div>
@@ -1193,9 +1195,9 @@ function PricingModule() {
             </table>
           </div>
 
-          {preview.preview.length > 100 && (
+          {preview.summary.total_updates > 100 && (
             <p className="text-sm text-luxarmonie-gray-500 mt-4 text-center">
-              Et {preview.preview.length - 100} autres modifications...
+              Et {preview.summary.total_updates - 100} autres modifications...
             </p>
           )}
         </div>